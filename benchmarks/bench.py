@@ -0,0 +1,150 @@
+'''
+Reproducible benchmarks on synthetic hives, see reg.synth
+Generates small, medium and large (multi-GB) hives if needed and times opening, lookups, traversal, value decoding and export
+Results are saved as JSON for tracking across versions:
+
+    python benchmarks/bench.py --sizes small medium -o results.json
+'''
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reg import Registry
+from reg import export
+from reg import synth
+
+
+# Reading whole file into memory is skipped for hives bigger than this
+MAX_READ_SIZE = 1 << 30
+GET_PATHS = 1000
+
+
+def open_mmap(path, shape):
+    with Registry.from_path(path, use_mmap=True) as registry:
+        registry.root
+    return 1
+
+
+def open_read(path, shape):
+    if os.path.getsize(path) > MAX_READ_SIZE:
+        return None
+    registry = Registry.from_path(path)
+    registry.root
+    return 1
+
+
+def get(path, shape):
+    with Registry.from_path(path, use_mmap=True) as registry:
+        for key_path in shape.paths(GET_PATHS):
+            registry.get(key_path)
+    return GET_PATHS
+
+
+def walk(path, shape):
+    keys = 0
+    with Registry.from_path(path, use_mmap=True) as registry:
+        for key_path, key, values in registry.walk(include_values=False):
+            keys += 1
+    return keys
+
+
+def decode(path, shape):
+    values = 0
+    with Registry.from_path(path, use_mmap=True) as registry:
+        for key_path, key, key_values in registry.walk():
+            key.last_written
+            for value in key_values:
+                value.value
+                values += 1
+    return values
+
+
+def export_jsonl(path, shape):
+    with Registry.from_path(path, use_mmap=True) as registry, open(os.devnull, 'w', encoding='utf-8') as out:
+        return export.export(registry, out).rows
+
+
+BENCHMARKS = dict(
+    open_mmap=open_mmap,
+    open_read=open_read,
+    get=get,
+    walk=walk,
+    decode=decode,
+    export=export_jsonl,
+)
+
+
+def run(func, path, shape, repeat):
+    # Result of func is a count of processed items, None means the benchmark is skipped
+    runs = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        count = func(path, shape)
+        runs.append(time.perf_counter() - start)
+        if count is None:
+            return None
+    best = min(runs)
+    return dict(best=best, median=statistics.median(runs), runs=runs, items=count, items_per_second=count / best if best else None)
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmarks on synthetic hives')
+    parser.add_argument('-s', '--sizes', nargs='+', choices=list(synth.SHAPES), default=['small', 'medium'],
+                        help='hive presets, large one is several GB and takes minutes to generate')
+    parser.add_argument('-b', '--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('-d', '--directory', default='.', help='where hives are generated, existing ones are reused')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help='JSON results file, stdout by default')
+    args = parser.parse_args(argv)
+
+    results = dict(
+        revision=revision(),
+        python=sys.version,
+        platform=platform.platform(),
+        timestamp=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        hives=[],
+    )
+    for size in args.sizes:
+        shape = synth.SHAPES[size]
+        path = os.path.join(args.directory, f'synthetic-{size}.hive')
+        generate_seconds = None
+        if not os.path.exists(path):
+            print(f'Generating {path}: {shape}', file=sys.stderr)
+            start = time.perf_counter()
+            synth.generate(path, shape)
+            generate_seconds = time.perf_counter() - start
+
+        hive = dict(name=size, shape=shape.asdict(), keys=shape.keys, file_size=os.path.getsize(path),
+                    generate_seconds=generate_seconds, results={})
+        for name in args.benchmarks:
+            result = run(BENCHMARKS[name], path, shape, args.repeat)
+            hive['results'][name] = result
+            if result is not None:
+                print(f'{size} {name}: {result["best"]:.3f}s', file=sys.stderr)
+        results['hives'].append(hive)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
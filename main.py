@@ -13,6 +13,10 @@ from reg import Registry
 # It provides two constructors besides main one
 # Via filepath
 r = Registry.from_path(args.filename)
+# Via filepath, memory-mapping the file instead of reading it. Opening is O(1) and only touched pages are read
+# Registry can also be used as a context manager to unmap the file when done
+with Registry.from_path(args.filename, use_mmap=True) as mapped:
+    print(mapped.root)
 # Via file descriptor
 with open(args.filename, 'rb') as f:
     r = Registry.from_file(f)
@@ -55,3 +59,8 @@ def recursive_print(key):
 
 # Uncomment next line to launch it. WARNING - a lot of output
 # recursive_print(r.root)
+
+# Same without recursion limits and with flat memory usage: .walk yields keys one by one and forgets them afterwards
+# It can also start from a subkey and stop at a given depth
+for path, key, values in r.walk(max_depth=1):
+    print(path, len(values))
@@ -0,0 +1,225 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+
+from . import batch
+from . import carve
+from . import diff
+from . import export
+from . import namespace
+from . import server
+from . import synth
+from .celltable import CellTable
+from .registry import Registry, RegistryKey
+
+
+def batch_command(args):
+    for result in batch.process_hives(batch.find_hives(args.paths), jobs=args.jobs):
+        print(json.dumps(result._asdict()))
+
+
+def scan_command(args):
+    for path, values in batch.scan_parallel(args.hive, jobs=args.jobs):
+        print(path)
+        for name, type in values:
+            print(f'\t{type} {name}')
+
+
+def validate_command(args):
+    failed = False
+    for path in args.hives:
+        # Empty files can't be mapped
+        with Registry.from_path(path, use_mmap=os.path.getsize(path) > 0) as registry:
+            report = registry.validate(cells=not args.headers_only)
+        failed |= not report.ok
+        print(json.dumps(dict(path=path, **report.asdict())))
+    sys.exit(1 if failed else 0)
+
+
+def stats_command(args):
+    with Registry.from_path(args.hive, use_mmap=True) as registry:
+        print(json.dumps(CellTable.from_registry(registry).stats(), indent=4))
+
+
+def export_command(args):
+    with Registry.from_path(args.hive, use_mmap=True) as registry:
+        out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+        try:
+            stats = export.export(registry, out, args.format, args.paths)
+        finally:
+            if args.output:
+                out.close()
+    print(stats, file=sys.stderr)
+
+
+def diff_command(args):
+    symbols = {diff.ADDED: '+', diff.REMOVED: '-', diff.MODIFIED: '~'}
+    with Registry.from_path(args.old, use_mmap=True) as old, Registry.from_path(args.new, use_mmap=True) as new:
+        for change in diff.diff(old, new, args.path, prune=args.prune):
+            line = f'{symbols[change.change]} {change.kind} {change.path}'
+            if change.kind == 'value':
+                line += f' {change.name}'
+            if change.change == diff.MODIFIED:
+                line += f': {change.old} -> {change.new}'
+            print(line)
+
+
+def find_command(args):
+    with Registry.from_path(args.hive, use_mmap=True) as registry:
+        results = registry.find(args.pattern, args.regex, include_keys=not args.values_only, include_values=not args.keys_only)
+        for path, item in results:
+            print(path if isinstance(item, RegistryKey) else f'{path}\t{item}')
+
+
+def timeline_command(args):
+    with Registry.from_path(args.hive, use_mmap=True, timeline=args.save) as registry:
+        keys = registry.recent(args.latest) if args.latest is not None else registry.modified(args.since, args.until)
+        for path, key in keys:
+            print(f'{key.last_written}\t{path}')
+
+
+def lookup_command(args):
+    ns = namespace.Namespace.from_image(args.image) if args.image else namespace.Namespace()
+    for mount in args.mounts or ():
+        mount_point, _, path = mount.partition('=')
+        ns.mount(mount_point, path)
+    with ns:
+        for path in args.paths:
+            try:
+                mount_point, key = ns.locate(path)
+            except KeyError:
+                print(json.dumps(dict(query=path, error='not found')))
+                continue
+            print(json.dumps(dict(query=path, mount=mount_point, **export.key_dict(key)), ensure_ascii=False))
+
+
+def security_command(args):
+    with Registry.from_path(args.hive, use_mmap=True) as registry:
+        for security in registry.descriptors():
+            print(json.dumps(dict(offset=security._offset, references=security.reference_count, **security.descriptor.asdict())))
+
+
+def carve_command(args):
+    with Registry.from_path(args.hive, use_mmap=True) as registry:
+        for record in carve.carve(registry, slack=not args.no_slack):
+            if isinstance(record, carve.RecoveredKey):
+                keynode = record.keynode
+                result = dict(kind='key', offset=record.offset, name=keynode.name, last_written=keynode.last_written,
+                              parent_path=record.parent_path, values=list(record.value_offsets))
+            elif isinstance(record, carve.RecoveredValue):
+                keyvalue = record.keyvalue
+                result = dict(kind='value', offset=record.offset, name=keyvalue.name, type=keyvalue.type_str,
+                              data_size=keyvalue.data_length, key=record.key_offset)
+            else:
+                result = dict(kind='list', offset=record.offset, keys=[4096 + pointer for pointer in record.leaf._pointers()])
+            print(json.dumps(result, ensure_ascii=False))
+
+
+def serve_command(args):
+    server.serve(args.hives, args.host, args.port, args.socket, args.jobs)
+
+
+def synth_command(args):
+    shape = synth.SHAPES[args.preset]
+    options = {name: value for name, value in vars(args).items() if name in shape.asdict() and value is not None}
+    synth.generate(args.output, synth.Shape(**{**shape.asdict(), **options}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m reg', description='parse windows 10 registry')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparser = subparsers.add_parser('batch', help='summarize many hives in parallel, one JSON line per hive')
+    subparser.add_argument('paths', nargs='+', help='hive files or directories to search for hives')
+    subparser.add_argument('-j', '--jobs', type=int, help='number of worker processes, CPU count by default')
+    subparser.set_defaults(func=batch_command)
+
+    subparser = subparsers.add_parser('scan', help='list keys and values of one hive, scanning its hbins in parallel')
+    subparser.add_argument('hive')
+    subparser.add_argument('-j', '--jobs', type=int, help='number of worker processes, CPU count by default')
+    subparser.set_defaults(func=scan_command)
+
+    subparser = subparsers.add_parser('validate', help='check base block, hbins and cell chains, one JSON report per hive, exit status 1 if any is broken')
+    subparser.add_argument('hives', nargs='+')
+    subparser.add_argument('--headers-only', action='store_true', help="check base block and hbins only, skip cell chains")
+    subparser.set_defaults(func=validate_command)
+
+    subparser = subparsers.add_parser('stats', help='cell statistics and fragmentation report of a hive, requires numpy')
+    subparser.add_argument('hive')
+    subparser.set_defaults(func=stats_command)
+
+    subparser = subparsers.add_parser('export', help='stream keys and values of a hive as JSON Lines or CSV')
+    subparser.add_argument('hive')
+    subparser.add_argument('-f', '--format', choices=list(export.WRITERS), default='jsonl')
+    subparser.add_argument('-o', '--output', help='output file, stdout by default')
+    subparser.add_argument('-p', '--path', dest='paths', action='append', help='subtree to export, can be repeated. Whole hive by default')
+    subparser.set_defaults(func=export_command)
+
+    subparser = subparsers.add_parser('diff', help='added, removed and modified keys and values between two snapshots of a hive')
+    subparser.add_argument('old')
+    subparser.add_argument('new')
+    subparser.add_argument('-p', '--path', help='subtree to compare, whole hive by default')
+    subparser.add_argument('--prune', action='store_true', help='skip subtrees of keys with equal last_written and counts, faster but misses changes below unchanged keys')
+    subparser.set_defaults(func=diff_command)
+
+    subparser = subparsers.add_parser('find', help='keys and values which paths match a glob or regex pattern')
+    subparser.add_argument('hive')
+    subparser.add_argument('pattern', help='glob like \\ControlSet00*\\Services\\*\\ImagePath, ** matches any number of levels')
+    subparser.add_argument('-r', '--regex', action='store_true', help='pattern is a regex over full paths')
+    group = subparser.add_mutually_exclusive_group()
+    group.add_argument('-k', '--keys-only', action='store_true')
+    group.add_argument('-v', '--values-only', action='store_true')
+    subparser.set_defaults(func=find_command)
+
+    subparser = subparsers.add_parser('timeline', help='keys sorted by last_written, optionally within a time range or most recent only')
+    subparser.add_argument('hive')
+    subparser.add_argument('-s', '--since', type=datetime.datetime.fromisoformat, help='UTC datetime like 2024-01-31T12:00, inclusive')
+    subparser.add_argument('-u', '--until', type=datetime.datetime.fromisoformat, help='UTC datetime, exclusive')
+    subparser.add_argument('-n', '--latest', type=int, help='only N most recently written keys, newest first')
+    subparser.add_argument('--save', action='store_true', help='keep timeline in a sidecar file next to the hive (hive + .tl) for next runs')
+    subparser.set_defaults(func=timeline_command)
+
+    subparser = subparsers.add_parser('lookup', help='keys by full paths across hives of a Windows image, following symbolic links')
+    subparser.add_argument('paths', nargs='+', help='paths like HKLM\\SYSTEM\\CurrentControlSet\\Services or HKU\\SID\\Software')
+    subparser.add_argument('-i', '--image', help='root of a Windows installation to mount hives from (reg.namespace.Namespace.from_image)')
+    subparser.add_argument('-m', '--mount', dest='mounts', action='append', help='MOUNT_POINT=HIVE, like HKLM\\SYSTEM=/cases/SYSTEM, can be repeated')
+    subparser.set_defaults(func=lookup_command)
+
+    subparser = subparsers.add_parser('security', help='distinct security descriptors of a hive with their reference counts')
+    subparser.add_argument('hive')
+    subparser.set_defaults(func=security_command)
+
+    subparser = subparsers.add_parser('carve', help='recover deleted keys, values and subkeys lists from unallocated space as JSON Lines')
+    subparser.add_argument('hive')
+    subparser.add_argument('--no-slack', action='store_true', help="don't search space after the last hbin")
+    subparser.set_defaults(func=carve_command)
+
+    subparser = subparsers.add_parser('serve', help='keep hives open and answer JSON Lines queries on localhost, see reg.server')
+    subparser.add_argument('hives', nargs='*', help='hives to load on start, named by their paths')
+    subparser.add_argument('--host', default='127.0.0.1')
+    subparser.add_argument('--port', type=int, default=server.DEFAULT_PORT)
+    subparser.add_argument('--socket', help='listen on a Unix socket instead of TCP')
+    subparser.add_argument('-j', '--jobs', type=int, help='number of worker threads for opening hives, walks and finds')
+    subparser.set_defaults(func=serve_command)
+
+    subparser = subparsers.add_parser('synth', help='generate a synthetic hive of configurable shape')
+    subparser.add_argument('output')
+    subparser.add_argument('-p', '--preset', choices=list(synth.SHAPES), default='small', help='shape to start from, options below override it')
+    subparser.add_argument('--depth', type=int)
+    subparser.add_argument('--fanout', type=int)
+    subparser.add_argument('--values', type=int, help='values per key')
+    subparser.add_argument('--value-size', type=int)
+    subparser.add_argument('--big-value-size', type=int)
+    subparser.add_argument('--big-value-every', type=int)
+    subparser.add_argument('--lists', choices=list(synth.LIST_TYPES) + ['mixed'])
+    subparser.add_argument('--ri-leaf-size', type=int)
+    subparser.set_defaults(func=synth_command)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
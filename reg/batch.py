@@ -0,0 +1,122 @@
+import collections
+import concurrent.futures
+import logging
+import os
+import struct
+
+from .registry import Registry, RegistryKey
+
+
+log = logging.getLogger()
+
+
+# Regf signature and file type: primary hives are 0, transaction logs reuse the same header with 1 or 2
+HIVE_HEADER = struct.Struct('<4s24xI')
+
+BatchResult = collections.namedtuple('BatchResult', ['path', 'result', 'error'])
+
+
+def is_hive(path):
+    try:
+        with open(path, 'rb') as f:
+            signature, file_type = HIVE_HEADER.unpack(f.read(HIVE_HEADER.size))
+    except (OSError, struct.error):
+        return False
+    return signature == b'regf' and file_type == 0
+
+
+def find_hives(paths):
+    '''
+    Expands directories into hive files found in them recursively, in sorted order
+    Files given explicitly are kept as is
+    '''
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if is_hive(os.path.join(root, name)):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def summarize(registry):
+    '''
+    Default batch job: counts keys and values with a linear scan
+    '''
+    keys = values = 0
+    for path, item in registry.scan():
+        if isinstance(item, RegistryKey):
+            keys += 1
+        else:
+            values += 1
+    return dict(file_name=registry.regf.file_name, keys=keys, values=values)
+
+
+def _process_hive(task):
+    func, path = task
+    try:
+        with Registry.from_path(path, use_mmap=True) as registry:
+            # Broken hives fail here in milliseconds instead of somewhere deep in func
+            registry.validate(cells=False).raise_for_errors()
+            return BatchResult(path, func(registry), None)
+    except Exception as e:
+        log.warning(f'Failed to process {path}: {e!r}')
+        return BatchResult(path, None, repr(e))
+
+
+def process_hives(paths, func=summarize, jobs=None):
+    '''
+    Applies func(registry) to every hive in a pool of jobs processes (os.cpu_count() by default)
+    Yields BatchResult(path, result, error) in the order of paths, a failing hive doesn't stop the batch
+    func and its result must be picklable, i.e. func has to be a module-level function
+    '''
+    paths = list(paths)
+    jobs = jobs or os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        chunksize = max(1, len(paths) // (jobs * 4))
+        yield from pool.map(_process_hive, [(func, path) for path in paths], chunksize=chunksize)
+
+
+def split_hbins(registry, chunks):
+    '''
+    Splits hbins into at most chunks contiguous (start, end) offset ranges of roughly equal size
+    '''
+    bounds = [hbin._offset for hbin in registry.hbins] + [4096 + registry.regf.hive_bins_data_size]
+    target = (bounds[-1] - bounds[0]) / chunks
+    ranges = []
+    start = bounds[0]
+    for offset in bounds[1:-1]:
+        if offset - start >= target:
+            ranges.append((start, offset))
+            start = offset
+    ranges.append((start, bounds[-1]))
+    return ranges
+
+
+def describe(path, key):
+    '''
+    Default per-key job of parallel scan: key path with its value names and types
+    '''
+    return path, [(value.name, value.type) for value in key.values]
+
+
+def _scan_range(task):
+    func, path, start, end = task
+    with Registry.from_path(path, use_mmap=True) as registry:
+        return [func(key_path, key) for key_path, key in registry.scan(include_values=False, start=start, end=end)]
+
+
+def scan_parallel(path, func=describe, jobs=None):
+    '''
+    Splits hbins of a single hive into chunks scanned in parallel, each worker mapping the same file
+    func(path, key) is applied to every allocated key, it can read key's values too
+    Yields results in file order, so output doesn't depend on scheduling
+    '''
+    jobs = jobs or os.cpu_count()
+    with Registry.from_path(path, use_mmap=True) as registry:
+        ranges = split_hbins(registry, jobs * 4)
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        for results in pool.map(_scan_range, [(func, path, start, end) for start, end in ranges]):
+            yield from results
@@ -0,0 +1,212 @@
+import collections
+import datetime
+import heapq
+import logging
+import re
+import struct
+
+from .common import *
+from .cell import FLAG_KEY_COMP_NAME, FLAG_VALUE_COMP_NAME, FastLeaf, HashLeaf, KeyNode, KeyValue
+from .timeline import to_filetime
+
+
+log = logging.getLogger()
+
+
+# Deleted cells found in unallocated space
+# parent_path - path of the parent key if it's still allocated, None otherwise
+# value_offsets - absolute offsets of vk cells referenced by the key's values list which still look like values
+RecoveredKey = collections.namedtuple('RecoveredKey', ['offset', 'keynode', 'parent_path', 'value_offsets'])
+# key_offset - offset of the recovered key referencing this value, None if no key scanned before it does
+RecoveredValue = collections.namedtuple('RecoveredValue', ['offset', 'keyvalue', 'key_offset'])
+RecoveredList = collections.namedtuple('RecoveredList', ['offset', 'leaf'])
+
+SIGNATURES = (b'nk', b'vk', b'lf', b'lh')
+CELL_SIZE = STRUCTS[INT]
+# Cell size and KeyNode fields up to its name: signature, flags, last_written, access bits, parent, subkeys, volatile subkeys,
+# subkeys list, volatile subkeys list, values, values list, security, class name, 6 maximums and workvar, name and class name lengths
+NK = struct.Struct('<i2sHQ15IHH')
+# Cell size, signature, name length, data size, data offset, data type, flags, spare
+VK = struct.Struct('<i2sHIIIHH')
+LIST_HEADER = struct.Struct('<i2sH')
+LIST_CLASSES = {b'lf': FastLeaf, b'lh': HashLeaf}
+# Timestamps outside of it are garbage rather than deleted keys
+MIN_FILETIME = to_filetime(datetime.datetime(1990, 1, 1))
+MAX_FILETIME = to_filetime(datetime.datetime(2100, 1, 1))
+MAX_KEY_NAME = 512
+MAX_VALUE_NAME = 32768
+
+
+def _decodes(data, encoding):
+    try:
+        return data.decode(encoding).isprintable()
+    except UnicodeDecodeError:
+        return False
+
+
+class Carver:
+    '''
+    Recovers deleted KeyNodes, KeyValues and fast/hash leaves from free cells of hbins and from slack after the last hbin
+    Deleted cells keep their content when they're freed and merged with neighbours, so their signatures are searched
+    at 8-byte cell boundaries anywhere in unallocated space. The search runs in C right over the hive buffer, nothing is copied
+    Each candidate has to pass structural checks (size, field ranges, offsets, name encoding) before it's decoded
+    Results are streamed in file order, memory is bounded by pending links of values to keys scanned before them
+    '''
+    def __init__(self, registry, signatures=SIGNATURES, slack=True):
+        unknown = set(signatures) - set(SIGNATURES)
+        if unknown:
+            raise ValueError(f'Unsupported signatures {unknown}, expected some of {SIGNATURES}')
+        self._registry = registry
+        self._hive = registry._hive
+        self._buf = registry._buf
+        self._pattern = re.compile(b'|'.join(re.escape(signature) for signature in signatures))
+        self._slack = slack
+        # Cell offsets are relative to the first hbin and have to point inside the buffer
+        self._limit = len(self._buf) - 4096
+        self._paths = {}
+        # offset of value: offset of key, with a heap of those offsets to drop links the scan has passed
+        self._links = {}
+        self._pending = []
+        self.candidates = 0
+
+    def regions(self):
+        '''
+        Yields (start, end) absolute offsets of runs of free cells and of slack after hive bins data
+        '''
+        buf = self._buf
+        cell_size = CELL_SIZE.unpack_from
+        region = None
+        for hbin in self._registry._iter_hbins():
+            offset = hbin._offset + 32
+            end = hbin._offset + hbin.size
+            while offset < end:
+                size, = cell_size(buf, offset)
+                if size == 0:
+                    raise ValueError(f'Invalid cell size at {hex(offset)}')
+                if size > 0:
+                    if region is not None and region[1] == offset:
+                        region = (region[0], offset + size)
+                    else:
+                        if region is not None:
+                            yield region
+                        region = (offset, offset + size)
+                offset += abs(size)
+            # Cells don't span hbins, neither do regions
+            if region is not None:
+                yield region
+                region = None
+        slack_start = 4096 + self._registry.regf.hive_bins_data_size
+        if self._slack and slack_start < len(buf):
+            yield slack_start, len(buf)
+
+    def __iter__(self):
+        buf = self._buf
+        for start, end in self.regions():
+            for match in self._pattern.finditer(buf, start + 4, end):
+                offset = match.start() - 4
+                if offset % 8:
+                    continue
+                self.candidates += 1
+                signature = match.group()
+                if signature == b'nk':
+                    record = self._key(offset, end)
+                elif signature == b'vk':
+                    record = self._value(offset, end)
+                else:
+                    record = self._list(offset, end, signature)
+                if record is not None:
+                    yield record
+            self._drop_links(end)
+
+    def _cell_size(self, offset, end, minimum):
+        # Freed cells have positive size, merged ones keep theirs. Either way the cell has to fit into the region
+        size = abs(CELL_SIZE.unpack_from(self._buf, offset)[0])
+        return size if size % 8 == 0 and minimum <= size <= end - offset else 0
+
+    def _pointer(self, pointer):
+        return pointer % 8 == 0 and pointer < self._limit
+
+    def _key(self, offset, end):
+        if offset + NK.size > end:
+            return None
+        (_, _, flags, last_written, _, parent, _, _, _, _, values, values_list,
+         _, _, _, _, _, _, _, name_length, _) = NK.unpack_from(self._buf, offset)
+        if not 0 < name_length <= MAX_KEY_NAME or not self._cell_size(offset, end, NK.size + name_length):
+            return None
+        if not MIN_FILETIME <= last_written < MAX_FILETIME or not self._pointer(parent):
+            return None
+        if values and values != 0xffffffff and not self._pointer(values_list):
+            return None
+        encoding = 'ascii' if FLAG_KEY_COMP_NAME&flags > 0 else 'utf-16-le'
+        if not _decodes(bytes(self._buf[offset + NK.size : offset + NK.size + name_length]), encoding):
+            return None
+
+        keynode = KeyNode(self._hive, offset)
+        return RecoveredKey(offset, keynode, self._parent_path(parent), self._link_values(offset, values, values_list))
+
+    def _parent_path(self, parent):
+        parent = 4096 + parent
+        if parent + NK.size > len(self._buf) or CELL_SIZE.unpack_from(self._buf, parent)[0] >= 0 or self._buf[parent + 4 : parent + 6] != b'nk':
+            return None
+        try:
+            return self._registry._scan_path(self._hive.cell(KeyNode, parent), self._paths)
+        except (ValueError, UnicodeDecodeError, struct.error):
+            return None
+
+    def _link_values(self, key_offset, count, values_list):
+        if count == 0 or count == 0xffffffff:
+            return ()
+        start = 4096 + values_list + 4
+        if start + count * 4 > len(self._buf) or abs(CELL_SIZE.unpack_from(self._buf, start - 4)[0]) < count * 4 + 4:
+            return ()
+        offsets = []
+        for pointer in struct.unpack_from(f'<{count}I', self._buf, start):
+            if self._pointer(pointer) and self._buf[4096 + pointer + 4 : 4096 + pointer + 6] == b'vk':
+                offsets.append(4096 + pointer)
+                if 4096 + pointer > key_offset:
+                    self._links[4096 + pointer] = key_offset
+                    heapq.heappush(self._pending, 4096 + pointer)
+        return tuple(offsets)
+
+    def _drop_links(self, position):
+        while self._pending and self._pending[0] < position:
+            self._links.pop(heapq.heappop(self._pending), None)
+
+    def _value(self, offset, end):
+        if offset + VK.size > end:
+            return None
+        _, _, name_length, data_size, data_offset, data_type, flags, _ = VK.unpack_from(self._buf, offset)
+        if name_length > MAX_VALUE_NAME or not self._cell_size(offset, end, VK.size + name_length):
+            return None
+        if flags > 0xff or data_type > 0xffff:
+            return None
+        if data_size >= 0x80000000:
+            if data_size & 0x7fffffff > 4:
+                return None
+        elif data_size > 0 and not self._pointer(data_offset):
+            return None
+        encoding = 'ascii' if FLAG_VALUE_COMP_NAME&flags > 0 else 'utf-16-le'
+        if name_length and not _decodes(bytes(self._buf[offset + VK.size : offset + VK.size + name_length]), encoding):
+            return None
+        return RecoveredValue(offset, KeyValue(self._hive, offset), self._links.pop(offset, None))
+
+    def _list(self, offset, end, signature):
+        if offset + LIST_HEADER.size > end:
+            return None
+        count = LIST_HEADER.unpack_from(self._buf, offset)[2]
+        if count == 0 or not self._cell_size(offset, end, LIST_HEADER.size + count * 8):
+            return None
+        # Entries are (KeyNode offset, name hint or hash)
+        pointers = struct.unpack_from(f'<{count * 2}I', self._buf, offset + LIST_HEADER.size)[::2]
+        if not all(self._pointer(pointer) for pointer in pointers):
+            return None
+        return RecoveredList(offset, LIST_CLASSES[signature](self._hive, offset))
+
+
+def carve(registry, signatures=SIGNATURES, slack=True):
+    '''
+    Yields RecoveredKey, RecoveredValue and RecoveredList of deleted cells in file order, see Carver
+    signatures - cell types to look for, some of nk, vk, lf, lh
+    slack - also search space after the last hbin
+    '''
+    return iter(Carver(registry, signatures, slack))
@@ -1,7 +1,12 @@
 import enum
+import io
 import logging
+import struct
+import sys
+import time
 
 from .common import *
+from .security import SecurityDescriptor
 
 
 log = logging.getLogger()
@@ -16,6 +21,8 @@ FLAG_KEY_COMP_NAME = 0x0020
 FLAG_KEY_PREDEF_HANDLE = 0x0040
 
 FLAG_VALUE_COMP_NAME = 0x0001
+# Value data larger than this is split into db segments of this size
+BIG_DATA_SEGMENT_SIZE = 16344
 
 class RegType(enum.IntEnum):
     REG_NONE = 0x00000000 	
@@ -35,117 +42,366 @@ class RegType(enum.IntEnum):
         return [i.value for i in RegType]
 
 
+# Size and signature of any cell, used to pick cell type before decoding the whole header
+CELL_HEADER = struct.Struct('<i2s')
+POINTER = STRUCTS[DWORD]
+
+
 class Cell(Block):
-    def __init__(self, buf, offset):
-        super().__init__(buf, offset, dict(
-            size=(0, DWORD),
-            signature=(4, STR, 2)
-        ))
-        self.allocated = self.size < 0
-        self.size = abs(self.size)
+    __slots__ = ()
+    _fields = dict(
+        size=(0, INT),
+        signature=(4, STR, 2)
+    )
+
+    @property
+    def size(self):
+        return abs(self._raw[0])
+
+    @property
+    def allocated(self):
+        return self._raw[0] < 0
+
+
+def name_hash(name):
+    '''
+    Hash of a key name as stored in HashLeaf entries
+    '''
+    h = 0
+    for c in name.upper():
+        h = (h * 37 + ord(c)) & 0xffffffff
+    return h
 
 
 class PointersList(LazyList):
-    def __init__(self, buf, offset, children, max_size=-1, max_items=-1, step=4):
-        self.pointers = Block(buf, offset, {})
+    '''
+    List of cell pointers. Items aren't kept loaded, they are resolved by index via registry cell cache
+    '''
+    __slots__ = ('_step',)
+
+    def __init__(self, hive, offset, children, max_size=-1, max_items=-1, step=4):
         self._step = step
-        super().__init__(buf, offset, children, max_size, max_items)
-   
-    def _load_next(self):
-        item_offset = self.pointers.unpack(self._current_size, DWORD)
-        self._current_size += self._step
-        item = self._children(self._buf, 4096 + item_offset)
-        return item
+        super().__init__(hive, offset, children, max_size, max_items)
+
+    def __getitem__(self, key):
+        if not isinstance(key, int):
+            raise TypeError(f'Expected int, got {type(key)}')
+        if key < 0:
+            raise IndexError(f'Negative index is not supported')
+        if key >= self._max_items:
+            raise IndexError(f'Index out of range. Total {self._max_items} items')
+        return self._load_at(key)
+
+    def __len__(self):
+        return self._max_items
+
+    def __iter__(self):
+        return (self._load_at(i) for i in range(self._max_items))
+
+    def _load_at(self, index):
+        if self._hive.stats is not None:
+            self._hive.stats.list_loads += 1
+        item_offset = POINTER.unpack_from(self._buf, self._offset + index*self._step)[0]
+        return self._hive.cell(self._children, 4096 + item_offset)
+
+    def _pointers(self):
+        '''
+        Offsets of all items, decoded with a single unpack_from
+        '''
+        words = self._step // 4
+        return struct.unpack_from(f'<{self._max_items * words}I', self._buf, self._offset)[::words]
+
+    def _match(self, item_offset, name):
+        keynode = self._hive.cell(KeyNode, 4096 + item_offset)
+        return keynode if keynode.name.upper() == name else None
+
+    def keynode_at(self, index):
+        return self._load_at(index)
+
+    def keynodes(self):
+        '''
+        Yields all KeyNodes without keeping them loaded
+        '''
+        if self._hive.stats is not None:
+            self._hive.stats.list_loads += self._max_items
+        for item_offset in self._pointers():
+            yield self._hive.cell(self._children, 4096 + item_offset)
+
+    def find(self, name):
+        '''
+        Finds KeyNode by case-insensitive name, returns None if there's no such one
+        Heirs narrow down candidates so only the matching KeyNode gets decoded
+        '''
+        name = name.upper()
+        for item_offset in self._pointers():
+            keynode = self._match(item_offset, name)
+            if keynode is not None:
+                return keynode
+        return None
 CELL_TYPES = dict()
 
 
+def load_cell(hive, offset):
+    '''
+    Returns cell of the type matching its signature
+    '''
+    signature = CELL_HEADER.unpack_from(hive.buf, offset)[1]
+    return hive.cell(CELL_TYPES[signature.decode('ascii', 'replace')], offset)
+
+
+class IndexHeader(Cell):
+    __slots__ = ()
+    _fields = dict(
+        number_of_items=(6, WORD)
+    )
+
+
 class IndexLeaf(PointersList):
-    def __init__(self, buf, offset):
-        header = Cell(buf, offset)
-        header._fields['number_of_items'] = (6, WORD)
-        super().__init__(buf, 8+offset, KeyNode, max_items=header.number_of_items)
+    __slots__ = ()
+
+    def __init__(self, hive, offset):
+        header = IndexHeader(hive, offset)
+        super().__init__(hive, 8+offset, KeyNode, max_items=header.number_of_items)
+
+    def find(self, name):
+        # Subkeys are sorted by uppercased name, so binary search decodes log(n) names
+        name = name.upper()
+        pointers = self._pointers()
+        low, high = 0, len(pointers)
+        while low < high:
+            middle = (low + high) // 2
+            keynode = self._hive.cell(KeyNode, 4096 + pointers[middle])
+            current = keynode.name.upper()
+            if current == name:
+                return keynode
+            elif current < name:
+                low = middle + 1
+            else:
+                high = middle
+        return None
 CELL_TYPES['li'] = IndexLeaf
 
 
 class FastLeaf(PointersList):
-    def __init__(self, buf, offset):
-        header = Cell(buf, offset)
-        header._fields['number_of_items'] = (6, WORD)
-        super().__init__(buf, 8+offset, KeyNode, max_items=header.number_of_items, step=8)
+    __slots__ = ()
+
+    def __init__(self, hive, offset):
+        header = IndexHeader(hive, offset)
+        super().__init__(hive, 8+offset, KeyNode, max_items=header.number_of_items, step=8)
+
+    def find(self, name):
+        # Each pointer is followed by first 4 characters of the name, zero-padded
+        name = name.upper()
+        hint = name[:4].encode('ascii').ljust(4, b'\x00') if name[:4].isascii() else None
+        entries = struct.unpack_from('<' + 'I4s' * self._max_items, self._buf, self._offset)
+        for item_offset, item_hint in zip(entries[::2], entries[1::2]):
+            if hint is None or item_hint.upper() == hint:
+                keynode = self._match(item_offset, name)
+                if keynode is not None:
+                    return keynode
+        return None
 CELL_TYPES['lf'] = FastLeaf
 
 
 class HashLeaf(PointersList):
-    def __init__(self, buf, offset):
-        header = Cell(buf, offset)
-        header._fields['number_of_items'] = (6, WORD)
-        super().__init__(buf, 8+offset, KeyNode, max_items=header.number_of_items, step=8)
+    __slots__ = ()
+
+    def __init__(self, hive, offset):
+        header = IndexHeader(hive, offset)
+        super().__init__(hive, 8+offset, KeyNode, max_items=header.number_of_items, step=8)
+
+    def find(self, name):
+        # Each pointer is followed by hash of the name
+        name = name.upper()
+        expected = name_hash(name)
+        entries = struct.unpack_from(f'<{self._max_items * 2}I', self._buf, self._offset)
+        for item_offset, item_hash in zip(entries[::2], entries[1::2]):
+            if item_hash == expected:
+                keynode = self._match(item_offset, name)
+                if keynode is not None:
+                    return keynode
+        return None
 CELL_TYPES['lh'] = HashLeaf
 
 
 class IndexRoot(PointersList):
-    def __init__(self, buf, offset):
-        header = Cell(buf, offset)
-        header._fields['number_of_items'] = (6, WORD)
-        super().__init__(buf, 8+offset, None, max_items=header.number_of_items)
+    __slots__ = ()
+
+    def __init__(self, hive, offset):
+        header = IndexHeader(hive, offset)
+        super().__init__(hive, 8+offset, None, max_items=header.number_of_items)
     
-    def _load_next(self):
-        item_offset = self.pointers.unpack(self._current_size, DWORD)
-        self._current_size += self._step
-        cell = Cell(self._buf, 4096 + item_offset)
-        item = CELL_TYPES[cell.signature](self._buf, 4096 + item_offset)
-        return item
+    def _load_at(self, index):
+        if self._hive.stats is not None:
+            self._hive.stats.list_loads += 1
+        item_offset = POINTER.unpack_from(self._buf, self._offset + index*self._step)[0]
+        return load_cell(self._hive, 4096 + item_offset)
+
+    def keynode_at(self, index):
+        # Only headers of leaves before the one holding index are read
+        for leaf_index in range(self._max_items):
+            leaf = self._load_at(leaf_index)
+            if index < leaf._max_items:
+                return leaf.keynode_at(index)
+            index -= leaf._max_items
+        raise IndexError(f'Index out of range')
+
+    def keynodes(self):
+        for item_offset in self._pointers():
+            yield from load_cell(self._hive, 4096 + item_offset).keynodes()
+
+    def find(self, name):
+        # Leaves are sorted too, so binary search for the first one whose last name isn't less than the target
+        upper = name.upper()
+        low, high = 0, self._max_items
+        while low < high:
+            middle = (low + high) // 2
+            leaf = self._load_at(middle)
+            if leaf._max_items == 0:
+                raise ValueError(f'Empty leaf {middle} of index root at {hex(self._offset - 8)}')
+            if leaf._load_at(leaf._max_items - 1).name.upper() < upper:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._max_items:
+            return None
+        return self._load_at(low).find(name)
 CELL_TYPES['ri'] = IndexRoot
 
 
 class KeyNode(Cell):
-    def __init__(self, buf, offset):
-        super().__init__(buf, offset)
-        self._fields.update(dict(
-            flags=(6, WORD),
-            last_written=(8, FILETIME),
-            access_bits=(16, DWORD),
-            parent=(20, DWORD),
-            number_of_subkeys=(24, DWORD),
-            number_of_volatile_subkeys=(28, DWORD),
-            subkeys_list_offset=(32, DWORD),
-            volatile_subkeys_list_offset=(36, DWORD),
-            number_of_key_values=(40, DWORD),
-            key_values_list_offset=(44, DWORD),
-            key_security_offset=(48, DWORD),
-            class_name_offset=(52, DWORD),
-            largest_subkey_name_length=(56, DWORD),
-            largest_subkey_class_name_length=(60, DWORD),
-            largest_value_name_length=(64, DWORD),
-            largest_value_data_size=(68, DWORD),
-            workvar=(72, DWORD),
-            key_name_length=(76, WORD),
-            class_name_length=(78, WORD),
-        ))
-
-        if FLAG_KEY_COMP_NAME&self.flags > 0:
-            encoding = 'ascii'
-        else:
-            encoding = 'utf-16-le'
-        self._fields['name'] = (80, STR, self.key_name_length, encoding)
+    __slots__ = ('_name', '_subkeys', '_values')
+    _fields = dict(
+        flags=(6, WORD),
+        last_written=(8, FILETIME),
+        access_bits=(16, DWORD),
+        parent=(20, DWORD),
+        number_of_subkeys=(24, DWORD),
+        number_of_volatile_subkeys=(28, DWORD),
+        subkeys_list_offset=(32, DWORD),
+        volatile_subkeys_list_offset=(36, DWORD),
+        number_of_key_values=(40, DWORD),
+        key_values_list_offset=(44, DWORD),
+        key_security_offset=(48, DWORD),
+        class_name_offset=(52, DWORD),
+        largest_subkey_name_length=(56, DWORD),
+        largest_subkey_class_name_length=(60, DWORD),
+        largest_value_name_length=(64, DWORD),
+        largest_value_data_size=(68, DWORD),
+        workvar=(72, DWORD),
+        key_name_length=(76, WORD),
+        class_name_length=(78, WORD),
+    )
+
+    def __init__(self, hive, offset):
+        super().__init__(hive, offset)
+        self._name = None
         self._subkeys = None
         self._values = None
 
+    @property
+    def name(self):
+        if self._name is None:
+            if FLAG_KEY_COMP_NAME&self.flags > 0:
+                encoding = 'ascii'
+            else:
+                encoding = 'utf-16-le'
+            # Names build paths and drive lookups, so they are decoded in raw mode too
+            self._name = sys.intern(self.unpack(80, STR, self.key_name_length, encoding, raw=False))
+        return self._name
+
     @property
     def subkeys(self):
         if self._subkeys is None:
             if self.number_of_subkeys > 0 and self.number_of_subkeys != 0xffffffff:
-                cell = Cell(self._buf, 4096 + self.subkeys_list_offset)
-                self._subkeys = CELL_TYPES[cell.signature](self._buf, 4096 + self.subkeys_list_offset)
+                self._subkeys = load_cell(self._hive, 4096 + self.subkeys_list_offset)
+                if self._hive.stats is not None:
+                    self._hive.stats.largest_seen('subkeys', self.number_of_subkeys)
+                    if isinstance(self._subkeys, IndexRoot):
+                        self._hive.stats.largest_seen('ri_leaves', len(self._subkeys))
             else:
                 self._subkeys = []
         return self._subkeys
+
+    def iter_subkeys(self):
+        '''
+        Yields subkey KeyNodes one by one, flattening IndexRoot, without caching them
+        '''
+        if self.number_of_subkeys == 0 or self.number_of_subkeys == 0xffffffff:
+            return iter(())
+        if self._hive.stats is None:
+            return self.subkeys.keynodes()
+        return self._timed_keynodes(self._hive.stats)
+
+    def _timed_keynodes(self, stats):
+        # Only time spent in the list counts, not work of the caller between subkeys
+        start = time.perf_counter()
+        keynodes = self.subkeys.keynodes()
+        elapsed = time.perf_counter() - start
+        try:
+            while True:
+                start = time.perf_counter()
+                keynode = next(keynodes, None)
+                elapsed += time.perf_counter() - start
+                if keynode is None:
+                    return
+                yield keynode
+        finally:
+            stats.record('subkeys', elapsed)
+
+    @property
+    def security(self):
+        '''
+        KeySecurity of the key, None if it has none. Every descriptor is decoded once per hive however many keys share it
+        '''
+        if self.key_security_offset == 0xffffffff:
+            return None
+        return load_security(self._hive, 4096 + self.key_security_offset)
+
+    @property
+    def subkeys_count(self):
+        return 0 if self.number_of_subkeys == 0xffffffff else self.number_of_subkeys
+
+    @property
+    def values_count(self):
+        return 0 if self.number_of_key_values == 0xffffffff else self.number_of_key_values
+
+    def subkey_at(self, index):
+        '''
+        Returns subkey KeyNode by its index in subkey list order, flattening IndexRoot
+        '''
+        if not 0 <= index < self.subkeys_count:
+            raise IndexError(f'Index out of range. Total {self.subkeys_count} subkeys')
+        stats = self._hive.stats
+        if stats is None:
+            return self.subkeys.keynode_at(index)
+        start = time.perf_counter()
+        try:
+            return self.subkeys.keynode_at(index)
+        finally:
+            stats.timed('subkeys', start)
+
+    def find_subkey(self, name):
+        '''
+        Finds direct subkey by case-insensitive name, returns None if there's no such one
+        Uses subkey list hints and sort order, so only the matching KeyNode gets decoded
+        '''
+        if self.number_of_subkeys == 0 or self.number_of_subkeys == 0xffffffff:
+            return None
+        stats = self._hive.stats
+        if stats is None:
+            return self.subkeys.find(name)
+        start = time.perf_counter()
+        try:
+            return self.subkeys.find(name)
+        finally:
+            stats.timed('subkeys', start)
   
     @property
     def values(self):
         if self._values is None:
             if self.number_of_key_values > 0 and self.number_of_key_values != 0xffffffff:
-                self._values = PointersList(self._buf, 4096 + 4 + self.key_values_list_offset, KeyValue, max_items=self.number_of_key_values)
+                self._values = PointersList(self._hive, 4096 + 4 + self.key_values_list_offset, KeyValue, max_items=self.number_of_key_values)
             else:
                 self._values = []
         return self._values
@@ -174,36 +430,166 @@ class KeyNode(Cell):
 CELL_TYPES['nk'] = KeyNode
 
 
+def _chunks(buf, segments, segment_size, size):
+    buf = memoryview(buf)
+    for offset in segments:
+        if size <= 0:
+            break
+        length = min(size, segment_size)
+        yield buf[offset : offset + length]
+        size -= length
+
+
+class DataReader(io.RawIOBase):
+    '''
+    Raw file object over value data split into segments of equal size, reads copy straight from the hive buffer
+    '''
+    def __init__(self, buf, segments, segment_size, size):
+        super().__init__()
+        self._view = memoryview(buf)
+        self._segments = segments
+        self._segment_size = segment_size
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        if self._position >= self._size:
+            return 0
+        index, skip = divmod(self._position, self._segment_size)
+        length = min(len(b), self._segment_size - skip, self._size - self._position)
+        offset = self._segments[index] + skip
+        b[:length] = self._view[offset : offset + length]
+        self._position += length
+        return length
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        elif whence != io.SEEK_SET:
+            raise ValueError(f'Invalid whence {whence}')
+        if offset < 0:
+            raise ValueError(f'Negative seek position {offset}')
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        # Exported view would keep mmap from closing
+        self._view.release()
+        super().close()
+
+
 class KeyValue(Cell):
-    def __init__(self, buf, offset):
-        super().__init__(buf, offset)
-        self._fields.update(dict(
-            name_length=(6, WORD),
-            data_size=(8, DWORD),
-            data_offset=(12, DWORD),
-            data_type=(16, DWORD),
-            flags=(20, WORD),
-            spare=(22, WORD)
-        ))
-
-        if self.name_length > 0:
-            if FLAG_VALUE_COMP_NAME&self.flags > 0:
-                encoding = 'ascii'
-            else:
-                encoding = 'utf-16-le'
-            self._fields['name'] = (24, STR, self.name_length, encoding)
-        else:
-            self._fields_loaded['name'] = '(Default)'
-        
+    __slots__ = ('_name', '_data')
+    _fields = dict(
+        name_length=(6, WORD),
+        data_size=(8, DWORD),
+        data_offset=(12, DWORD),
+        data_type=(16, DWORD),
+        flags=(20, WORD),
+        spare=(22, WORD)
+    )
+
+    def __init__(self, hive, offset):
+        super().__init__(hive, offset)
+        self._name = None
         self._data = None
+
+    @property
+    def name(self):
+        if self._name is None:
+            if self.name_length > 0:
+                if FLAG_VALUE_COMP_NAME&self.flags > 0:
+                    encoding = 'ascii'
+                else:
+                    encoding = 'utf-16-le'
+                self._name = sys.intern(self.unpack(24, STR, self.name_length, encoding, raw=False))
+            else:
+                self._name = '(Default)'
+        return self._name
     
+    @property
+    def data_length(self):
+        '''
+        Real size of data in bytes, without resident data flag
+        '''
+        return self.data_size & 0x7fffffff
+
+    def _is_big_data(self):
+        # Hives before 1.4 keep big values in a single cell
+        return (self.data_length > BIG_DATA_SEGMENT_SIZE
+                and self._buf[4096 + self.data_offset + 4: 4096 + self.data_offset + 6] == b'db')
+
+    def _segments(self):
+        # Absolute offsets of data pieces and size of each piece but the last one
+        if self.data_size >= 0x80000000:
+            return [self._offset + 12], 4
+        elif self._is_big_data():
+            return BigData(self._hive, 4096 + self.data_offset).segments(), BIG_DATA_SEGMENT_SIZE
+        return [4096 + self.data_offset + 4], self.data_length
+
+    def chunks(self):
+        '''
+        Yields raw data as memoryviews of the hive buffer, one per db segment, trimmed to data_length
+        Nothing is copied, release chunks before closing a memory-mapped registry
+        '''
+        segments, segment_size = self._segments()
+        return _chunks(self._buf, segments, segment_size, self.data_length)
+
+    def open(self):
+        '''
+        Returns read-only seekable binary file object over raw data, streaming big values segment by segment
+        '''
+        segments, segment_size = self._segments()
+        return io.BufferedReader(DataReader(self._buf, segments, segment_size, self.data_length))
+
     @property
     def data(self):
+        stats = self._hive.stats
+        if stats is None:
+            return self.decode()
+        start = time.perf_counter()
+        data = self.decode()
+        stats.timed('data', start)
+        stats.largest_seen('value_size', self.data_length)
+        return data
+
+    def _native(self):
+        segments, segment_size = self._segments()
+        if len(segments) == 1:
+            # A copy, views of the buffer would keep a memory-mapped registry from closing. chunks() gives those
+            data = bytes(self._buf[segments[0] : segments[0] + self.data_length])
+        else:
+            data = b''.join(self.chunks())
+        if self.data_type in (RegType.REG_DWORD, RegType.REG_QWORD):
+            return int.from_bytes(data, 'little')
+        elif self.data_type == RegType.REG_DWORD_BIG_ENDIAN:
+            return int.from_bytes(data, 'big')
+        return data
+
+    def decode(self, raw=None):
+        '''
+        Returns value data, decoding mode of the hive by default
+        raw - native form: ints for DWORD and QWORD types, bytes for everything else,
+        leaving strings to be decoded by the caller
+        '''
+        if self._hive.raw if raw is None else raw:
+            return self._native()
         if self._data is None:
             if self.data_size >= 0x80000000:
                 self._data = self.data_offset
-            elif self._buf[4096 + self.data_offset + 4: 4096 + self.data_offset + 6] == b'db':
-                self._data = BigData(self._buf, 4096 + self.data_offset).data
+            elif self._is_big_data():
+                self._data = b''.join(self.chunks())
             else:
                 if self.data_type in [RegType.REG_SZ, RegType.REG_EXPAND_SZ, RegType.REG_MULTI_SZ]:
                     format = [STR, self.data_size, 'utf-16-le']
@@ -221,7 +607,7 @@ class KeyValue(Cell):
                 else:  # UNKNOWN
                     format = [BYTES, self.data_size]
 
-                self._data = Cell(self._buf, 4096 + self.data_offset).unpack(4, *format)                
+                self._data = Cell(self._hive, 4096 + self.data_offset).unpack(4, *format, raw=False)                
                 
                 if self.data_type == RegType.REG_MULTI_SZ:
                     self._data = self._data.split('\x00')
@@ -240,40 +626,121 @@ CELL_TYPES['vk'] = KeyValue
 
 
 class KeySecurity(Cell):
-    def __init__(self, buf, offset):
-        raise NotImplementedError
-        super().__init__(buf, offset)
+    '''
+    Security descriptor shared by all keys referencing it. sk cells of a hive form a doubly linked list
+    Decoded once per hive: KeyNode.security keeps them in Hive.descriptors instead of the LRU cache
+    '''
+    __slots__ = ('_descriptor',)
+    _fields = dict(
+        flink=(8, DWORD),
+        blink=(12, DWORD),
+        reference_count=(16, DWORD),
+        descriptor_size=(20, DWORD),
+    )
+
+    def __init__(self, hive, offset):
+        super().__init__(hive, offset)
+        self._descriptor = None
+
+    @property
+    def descriptor(self):
+        if self._descriptor is None:
+            self._descriptor = SecurityDescriptor(self._hive, self._offset + 24)
+        return self._descriptor
+
+    def __str__(self):
+        return f'{self.__class__.__module__}.KeySecurity at {hex(self._offset)}, {self.reference_count} references'
 CELL_TYPES['sk'] = KeySecurity
 
 
+def load_security(hive, offset):
+    '''
+    KeySecurity at offset, decoded on first request and kept in Hive.descriptors
+    '''
+    security = hive.descriptors.get(offset)
+    if security is None:
+        if CELL_HEADER.unpack_from(hive.buf, offset)[1] != b'sk':
+            raise ValueError(f'No KeySecurity at {hex(offset)}')
+        security = hive.descriptors[offset] = KeySecurity(hive, offset)
+    return security
+
+
 class BigData(Cell):
-    def __init__(self, buf, offset):
-        super().__init__(buf, offset)
-        self._fields['number_of_segments'] = (6, WORD)
-        self._fields['segments_list_offset'] = (8, DWORD)
+    __slots__ = ('_data',)
+    _fields = dict(
+        number_of_segments=(6, WORD),
+        segments_list_offset=(8, DWORD)
+    )
+
+    def __init__(self, hive, offset):
+        super().__init__(hive, offset)
         self._data = None
-    
+
+    def segments(self):
+        '''
+        Absolute offsets of segments data
+        '''
+        pointers = struct.unpack_from(f'<{self.number_of_segments}I', self._buf, 4096 + self.segments_list_offset + 4)
+        return [4096 + pointer + 4 for pointer in pointers]
+
+    def chunks(self, size=None):
+        '''
+        Yields segments data as memoryviews of the hive buffer
+        size - data size of the value, by default every segment is assumed full
+        '''
+        segments = self.segments()
+        return _chunks(self._buf, segments, BIG_DATA_SEGMENT_SIZE, len(segments) * BIG_DATA_SEGMENT_SIZE if size is None else size)
+
     @property
     def data(self):
         if self._data is None:
-            self._data = b''
-            current_size = 0
-            segments_list = Cell(self._buf, 4096 + self.segments_list_offset)
-            for i in range(self.number_of_segments):
-                data_segment_offset = segments_list.unpack(4+current_size, DWORD)
-                data_segment = Cell(self._buf, 4096 + data_segment_offset).unpack(4, BYTES, 16344)
-                self._data += data_segment
+            self._data = b''.join(self.chunks())
         return self._data
 CELL_TYPES['db'] = BigData
 
 
+# Cell types decoded by linear cell scan. Other cells, including free ones, are exposed as plain Cell
+SCAN_TYPES = {
+    b'nk': KeyNode,
+    b'vk': KeyValue,
+    b'db': BigData,
+}
+
+
 class Cells(LazyList):
-    def __init__(self, buf, offset, max_size):
-        super().__init__(buf, offset, None, max_size=max_size)
+    '''
+    Consecutive cells of a Hbin
+    '''
+    __slots__ = ()
+
+    def __init__(self, hive, offset, max_size):
+        super().__init__(hive, offset, None, max_size=max_size)
+
+    def _cell_at(self, offset):
+        size, signature = CELL_HEADER.unpack_from(self._buf, offset)
+        if size == 0:
+            raise ValueError(f'Invalid cell size at {hex(offset)}')
+        return SCAN_TYPES.get(signature, Cell)(self._hive, offset) if size < 0 else Cell(self._hive, offset)
 
     def _load_next(self):
-        cell = Cell(self._buf, self._offset + self._current_size)
-        item = CELL_TYPES[cell.signature](self._buf, self._offset + self._current_size)
+        item = self._cell_at(self._offset + self._current_size)
         self._current_size += item.size
         return item
 
+    def iter_cells(self, signatures=None):
+        '''
+        Yields cells one by one without caching them
+        signatures - iterable of SCAN_TYPES signatures, e.g. (b'nk',). If given, only allocated cells having them are decoded
+        '''
+        offset = self._offset
+        end = self._offset + self._max_size
+        while offset < end:
+            size, signature = CELL_HEADER.unpack_from(self._buf, offset)
+            if size == 0:
+                raise ValueError(f'Invalid cell size at {hex(offset)}')
+            if signatures is None:
+                yield self._cell_at(offset)
+            elif size < 0 and signature in signatures:
+                yield SCAN_TYPES[signature](self._hive, offset)
+            offset += abs(size)
+
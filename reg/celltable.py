@@ -0,0 +1,129 @@
+import array
+import logging
+
+from .common import *
+from .cell import CELL_TYPES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+log = logging.getLogger()
+
+
+def signature_code(signature):
+    '''
+    Two-byte cell signature like b'vk' as it's stored in CellTable.signatures
+    '''
+    return int.from_bytes(signature, 'little')
+
+
+class CellTable:
+    '''
+    Headers of all cells of a hive as NumPy arrays: offset, size, allocated flag and 2-byte signature
+    Only chaining cells within hbins is a Python loop, classification and filtering are vectorized:
+    selecting all vk cells or all free cells larger than N is an array mask instead of millions of Cell objects
+    Requires numpy. It's imported with this module when available, like everywhere else in the package,
+    and from_registry raises ImportError without it, so the module itself imports fine either way
+    '''
+    def __init__(self, offsets, sizes, allocated, signatures, hbins):
+        self.offsets = offsets
+        self.sizes = sizes
+        self.allocated = allocated
+        self.signatures = signatures
+        self.hbins = hbins
+
+    @classmethod
+    def from_registry(cls, registry):
+        if np is None:
+            raise ImportError('CellTable requires numpy')
+
+        buf = registry._buf
+        unpack_from = STRUCTS[INT].unpack_from
+        hbins = array.array('q')
+        offsets = array.array('q')
+        sizes = array.array('q')
+        for hbin in registry._iter_hbins():
+            hbins.append(hbin._offset)
+            offset = hbin._offset + 32
+            end = hbin._offset + hbin.size
+            # Each size gives offset of the next cell, so this part is inherently serial
+            while offset < end:
+                size = unpack_from(buf, offset)[0]
+                if size == 0:
+                    raise ValueError(f'Invalid cell size at {hex(offset)}')
+                offsets.append(offset)
+                sizes.append(size)
+                offset += abs(size)
+
+        offsets = np.frombuffer(offsets, dtype=np.int64)
+        sizes = np.frombuffer(sizes, dtype=np.int64)
+        data = np.frombuffer(buf, dtype=np.uint8)
+        signatures = data[offsets + 4].astype(np.uint16) | (data[offsets + 5].astype(np.uint16) << 8)
+        return cls(offsets, np.abs(sizes), sizes < 0, signatures, np.frombuffer(hbins, dtype=np.int64))
+
+    def mask(self, signature=None, allocated=None, min_size=None, max_size=None):
+        '''
+        Boolean mask of cells matching all given conditions, signature being bytes like b'nk'
+        Signatures of free cells are whatever was left there, so combine them with allocated=True
+        '''
+        mask = np.ones(len(self.offsets), dtype=bool)
+        if signature is not None:
+            mask &= self.signatures == signature_code(signature)
+        if allocated is not None:
+            mask &= self.allocated == allocated
+        if min_size is not None:
+            mask &= self.sizes >= min_size
+        if max_size is not None:
+            mask &= self.sizes <= max_size
+        return mask
+
+    def select(self, **conditions):
+        '''
+        Offsets of cells matching conditions of .mask
+        '''
+        return self.offsets[self.mask(**conditions)]
+
+    def stats(self):
+        '''
+        Cell counts and sizes, allocated cells grouped by signature
+        '''
+        codes, counts = np.unique(self.signatures[self.allocated], return_counts=True)
+        signatures = {}
+        for code, count in zip(codes.tolist(), counts.tolist()):
+            signature = code.to_bytes(2, 'little').decode('latin-1')
+            # Data and value list cells have no signature, group them together
+            name = signature if signature in CELL_TYPES else 'other'
+            signatures[name] = signatures.get(name, 0) + count
+        return dict(
+            hbins=len(self.hbins),
+            cells=len(self.offsets),
+            allocated_cells=int(self.allocated.sum()),
+            allocated_bytes=int(self.sizes[self.allocated].sum()),
+            signatures=signatures,
+            **self.fragmentation(),
+        )
+
+    def fragmentation(self):
+        '''
+        Free space report. fragmentation is 0 when all free space is a single cell and tends to 1 when it's scattered
+        '''
+        free = self.sizes[~self.allocated]
+        free_bytes = int(free.sum())
+        largest = int(free.max()) if len(free) else 0
+        hbin_indexes = np.searchsorted(self.hbins, self.offsets[~self.allocated], side='right') - 1
+        return dict(
+            free_cells=len(free),
+            free_bytes=free_bytes,
+            largest_free_cell=largest,
+            hbins_with_free_cells=len(np.unique(hbin_indexes)),
+            fragmentation=1 - largest / free_bytes if free_bytes else 0.0,
+        )
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __str__(self):
+        return f'{self.__class__.__module__}.{self.__class__.__qualname__}, {len(self)} cells in {len(self.hbins)} hbins'
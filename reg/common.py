@@ -1,13 +1,17 @@
+import collections
 import datetime
 import enum
+import functools
 import logging
 import struct
+import time
 import uuid
 
 
 log = logging.getLogger()
 
 
+BYTE = enum.auto()
 WORD = enum.auto()
 DWORD = enum.auto()
 DWORD_BIG = enum.auto()
@@ -21,92 +25,301 @@ BYTES = enum.auto()
 # Constants to convert from filetime
 FILETIME_EPOCH = datetime.datetime(1601, 1, 1)
 
+DEFAULT_CACHE_SIZE = 65536
+
+
+# Precompiled structs of fixed-size field types
+STRUCTS = {
+    BYTE: struct.Struct('<B'),
+    WORD: struct.Struct('<H'),
+    DWORD: struct.Struct('<I'),
+    DWORD_BIG: struct.Struct('>I'),
+    QWORD: struct.Struct('<Q'),
+    INT: struct.Struct('<i'),
+    FILETIME: struct.Struct('<Q'),
+    GUID: struct.Struct('16s'),
+}
+
+
+def convert(value, ftype, *opts):
+    '''
+    Converts raw unpacked value to its exposed form
+    '''
+    if ftype == STR:
+        encoding = opts[1] if len(opts) == 2 else 'ascii'
+        try:
+            return value.decode(encoding).strip('\x00')
+        except UnicodeDecodeError:
+            # In regedit invalid values are just silent
+            return '...'
+    elif ftype == FILETIME:
+        return str(FILETIME_EPOCH + datetime.timedelta(microseconds=(value // 10)))
+    elif ftype == GUID:
+        return str(uuid.UUID(bytes=value))
+    elif ftype == QWORD:
+        return hex(value)
+    # Maybe we want to print bytes prettier
+    # elif ftype == BYTES:
+    #     return ''.join([ '%0.2x'%i for i in value ])
+    return value
+
+
+class Field:
+    '''
+    Descriptor exposing one field of a Block layout
+    Reads value from the tuple decoded by a single unpack_from in Block constructor
+    '''
+    __slots__ = ('index', 'ftype', 'opts')
+
+    def __init__(self, index, ftype, opts):
+        self.index = index
+        self.ftype = ftype
+        self.opts = opts
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance._raw[self.index]
+
+
+class ConvertedField(Field):
+    '''
+    Field which value needs converting (strings, timestamps, guids, qwords)
+    Hives in raw mode get it as unpacked: ints for timestamps and qwords, bytes for strings and guids
+    '''
+    __slots__ = ()
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance._raw[self.index]
+        return value if instance._hive.raw else convert(value, self.ftype, *self.opts)
+
+
+class CellCache:
+    '''
+    Bounded LRU cache of decoded cells keyed by offset, evicts least recently used ones beyond max_size
+    max_size of 0 disables caching
+    '''
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cells = collections.OrderedDict()
+
+    def load(self, cls, hive, offset):
+        cell = self._cells.get(offset)
+        # Same offset may be read as different types, e.g. plain Cell to peek at the header
+        if cell is not None and type(cell) is cls:
+            self.hits += 1
+            self._cells.move_to_end(offset)
+            return cell
+
+        self.misses += 1
+        cell = cls(hive, offset)
+        if self.max_size > 0:
+            self._cells[offset] = cell
+            if len(self._cells) > self.max_size:
+                self._cells.popitem(last=False)
+        return cell
+
+    def clear(self):
+        self._cells.clear()
+
+    def __len__(self):
+        return len(self._cells)
+
+    def __str__(self):
+        return f'{self.__class__.__module__}.{self.__class__.__qualname__}, {len(self)}/{self.max_size} cells, {self.hits} hits, {self.misses} misses'
+
+
+class Stats:
+    '''
+    Counters of parser work, collected only while attached to a Hive. Hot paths check a single None otherwise
+    cells - decoded blocks by class name, bytes - bytes decoded by them and by unpack calls
+    list_loads - items loaded by lists, largest - biggest lists seen, like number of subkeys or ri leaves of one key
+    timings - name: [calls, total seconds, max seconds] of timed operations: get, subkeys (loading, expanding and searching
+    subkey lists, whether by views, walks or scans), data
+    Cache hits and misses are counted from the moment Stats were created
+    '''
+    def __init__(self, cache):
+        self.cells = collections.Counter()
+        self.bytes = 0
+        self.unpack_calls = 0
+        self.list_loads = 0
+        self.largest = {}
+        self.timings = {}
+        self._cache = cache
+        self._cache_hits = cache.hits
+        self._cache_misses = cache.misses
+
+    def decoded(self, block):
+        self.cells[block.__class__.__qualname__] += 1
+        self.bytes += block._struct.size
+
+    def unpacked(self, size):
+        self.unpack_calls += 1
+        self.bytes += size
+
+    def largest_seen(self, name, value):
+        if value > self.largest.get(name, 0):
+            self.largest[name] = value
+
+    def timed(self, name, start):
+        '''
+        Records operation started at time.perf_counter() value start
+        '''
+        self.record(name, time.perf_counter() - start)
+
+    def record(self, name, elapsed):
+        timing = self.timings.get(name)
+        if timing is None:
+            self.timings[name] = [1, elapsed, elapsed]
+        else:
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+
+    def asdict(self):
+        return dict(
+            cells=dict(self.cells),
+            cells_total=sum(self.cells.values()),
+            bytes=self.bytes,
+            unpack_calls=self.unpack_calls,
+            list_loads=self.list_loads,
+            cache_hits=self._cache.hits - self._cache_hits,
+            cache_misses=self._cache.misses - self._cache_misses,
+            largest=dict(self.largest),
+            timings={name: dict(calls=calls, seconds=seconds, max_seconds=longest) for name, (calls, seconds, longest) in self.timings.items()},
+        )
+
+    def __str__(self):
+        return f'{self.__class__.__module__}.{self.__class__.__qualname__}, {sum(self.cells.values())} cells, {self.bytes} bytes, {self.unpack_calls} unpack calls'
+
+
+class Hive:
+    '''
+    State shared by all blocks of one registry: the buffer, decoded cells cache and decoding mode
+    raw - expose fields and value data in native form instead of formatted strings, see ConvertedField
+    stats - Stats being collected, None when disabled
+    descriptors - KeySecurity cells by offset. There are few of them shared by many keys, so they are never evicted
+    '''
+    __slots__ = ('buf', 'cache', 'raw', 'stats', 'descriptors')
+
+    def __init__(self, buf, cache_size=DEFAULT_CACHE_SIZE, raw=False):
+        self.buf = buf
+        self.cache = CellCache(cache_size)
+        self.raw = raw
+        self.stats = None
+        self.descriptors = {}
+
+    def cell(self, cls, offset):
+        '''
+        Returns cls instance at offset, shared with everyone else asking for it while it stays cached
+        '''
+        return self.cache.load(cls, self, offset)
+
 
 class Block:
     '''
     Represents consecutive byte fields
-    Lazy-loads fields provided in constructor via __getattribute__ magic
+    Heirs declare fixed-size fields in _fields class attribute as name=(offset, type, *opts)
+    They are compiled once per class into a single struct.Struct and exposed as Field descriptors
     Provider generalized __str__ for all heirs
     '''
-    def __init__(self, buf, offset, fields):
-        self._buf = buf
+    __slots__ = ('_hive', '_buf', '_offset', '_raw')
+    _fields = {}
+    _indexes = {}
+    _struct = struct.Struct('')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = dict(cls.__mro__[1]._fields)
+        fields.update(cls.__dict__.get('_fields', {}))
+        cls._fields = fields
+
+        cls._indexes = {}
+        format = '<'
+        position = 0
+        for index, (name, (offset, ftype, *opts)) in enumerate(sorted(fields.items(), key=lambda i: i[1][0])):
+            if offset < position:
+                raise ValueError(f'Field {cls.__qualname__}.{name} at {offset} overlaps previous field')
+            if ftype == DWORD_BIG:
+                raise ValueError(f'Field {cls.__qualname__}.{name}: big-endian fields are not supported in layouts')
+            if ftype in [STR, BYTES]:
+                code, size = f'{opts[0]}s', opts[0]
+            else:
+                code, size = STRUCTS[ftype].format.lstrip('<'), STRUCTS[ftype].size
+            format += (f'{offset - position}x' if offset > position else '') + code
+            position = offset + size
+            cls._indexes[name] = index
+
+            # Explicitly defined attributes (properties) take precedence over fields
+            if not isinstance(getattr(cls, name, None), (Field, type(None))):
+                continue
+            if ftype in (STR, FILETIME, GUID, QWORD):
+                setattr(cls, name, ConvertedField(index, ftype, opts))
+            else:
+                setattr(cls, name, Field(index, ftype, opts))
+        cls._struct = struct.Struct(format)
+
+    def __init__(self, hive, offset):
+        self._hive = hive
+        self._buf = hive.buf
         self._offset = offset
-        self._fields = fields
-        self._fields_loaded = {}
+        try:
+            self._raw = self._struct.unpack_from(self._buf, offset)
+        except struct.error as e:
+            log.critical(f'{offset}/{len(self._buf)} {self.__class__.__qualname__}:{self._struct.size}')
+            raise e
+        if hive.stats is not None:
+            hive.stats.decoded(self)
     
-    def unpack(self, offset, ftype, *opts):
+    def unpack(self, offset, ftype, *opts, raw=None):
+        '''
+        raw - return value as unpacked, without converting it. Decoding mode of the hive by default
+        '''
         if ftype in [STR, BYTES]:
             if len(opts) < 1:
                 raise ValueError(f'Invalid size specified for {ftype} at {offset}')
             size = opts[0]
-            format = f'{size}s'
-        elif ftype == WORD:
-            format = 'H'
-            size = 2
-        elif ftype == DWORD:
-            format = 'I'
-            size = 4
-        elif ftype == DWORD_BIG:
-            format = '>I'
-            size = 4
-        elif ftype == QWORD:
-            format = 'Q'
-            size = 8
-        elif ftype == INT:
-            format = 'i'
-            size = 4
-        elif ftype == FILETIME:
-            format = 'Q'
-            size = 8
-        elif ftype == GUID:
-            format = '16s'
-            size = 16
+            # struct caches compiled formats of its module-level functions
+            unpack_from = functools.partial(struct.unpack_from, f'{size}s')
+        else:
+            size = STRUCTS[ftype].size
+            unpack_from = STRUCTS[ftype].unpack_from
 
         try:
-            value = struct.unpack(format, self._buf[self._offset+offset : self._offset+offset+size])[0]
+            value = unpack_from(self._buf, self._offset + offset)[0]
         except struct.error as e:
             log.critical(f'{self._offset}+{offset}/{len(self._buf)} {ftype}:{size}')
             log.critical(f'{self._buf[self._offset+offset-20:self._offset+offset+80]}')
             raise e
 
-        if ftype == STR:
-            encoding = opts[1] if len(opts) == 2 else 'ascii'
-            try:
-                r = value.decode(encoding).strip('\x00')
-            except UnicodeDecodeError:
-                # In regedit invalid values are just silent
-                r = '...'  
-            return r
-        elif ftype == FILETIME:
-            return str(FILETIME_EPOCH + datetime.timedelta(microseconds=(value // 10)))
-        elif ftype == GUID:
-            return str(uuid.UUID(bytes=value))
-        elif ftype == QWORD:
-            return hex(value)
-        # Maybe we want to print bytes prettier
-        # elif ftype == BYTES:
-        #     return ''.join([ '%0.2x'%i for i in value ])
-        return value
-
-    def __getattribute__(self, name: str):
-        if name[0] != '_':
-            if name in self._fields and name not in self._fields_loaded:
-                self._fields_loaded[name] = self.unpack(*self._fields[name])
-
-            if name in self._fields_loaded:
-                return self._fields_loaded[name]
-        
-        return super().__getattribute__(name)
+        if self._hive.stats is not None:
+            self._hive.stats.unpacked(size)
+        if self._hive.raw if raw is None else raw:
+            return value
+        return convert(value, ftype, *opts)
 
-    def __setattr__(self, name, value):
-        if name[0] != '_':
-            self._fields_loaded[name] = value
+    def raw(self, name):
+        '''
+        Returns field value as unpacked, without converting it
+        '''
+        return self._raw[self._indexes[name]]
 
-        super().__setattr__(name, value)
+    def get(self, name, raw=None):
+        '''
+        Returns field value in the given decoding mode, mode of the hive by default
+        '''
+        if raw is None or raw == self._hive.raw:
+            return getattr(self, name)
+        value = self._raw[self._indexes[name]]
+        return value if raw else convert(value, *self._fields[name][1:])
     
     def items(self):
         for key in self._fields:
-            yield key, self.__getattribute__(key)
+            yield key, getattr(self, key)
 
     def __str__(self):
         return f'{self.__class__.__module__}.{self.__class__.__qualname__} at {hex(self._offset)}, contains {len(self._fields)} fields'
@@ -117,14 +330,16 @@ class LazyList:
     Iterable structure with lazy-loading
     Override _load_next to change what should go into this
     '''
-    def __init__(self, buf, offset, children, max_size=-1, max_items=-1):
-        self._buf = buf
+    __slots__ = ('_hive', '_buf', '_offset', '_children', '_max_size', '_current_size', '_max_items', '_loaded')
+
+    def __init__(self, hive, offset, children, max_size=-1, max_items=-1):
+        self._hive = hive
+        self._buf = hive.buf
         self._offset = offset
         self._children = children
         self._max_size = max_size
         self._current_size = 0
         self._max_items = max_items
-        self._current = -1
         self._loaded = []
     
     def __getitem__(self, key):
@@ -137,6 +352,8 @@ class LazyList:
             if self._has_next:
                 item = self._load_next()
                 self._loaded.append(item)
+                if self._hive.stats is not None:
+                    self._hive.stats.list_loads += 1
             else:
                 raise IndexError(f'Index out of range. Total {len(self._loaded)} loaded')
         
@@ -150,22 +367,25 @@ class LazyList:
             return self._max_items > len(self._loaded)
 
     def _load_next(self):
-        item = self._children(self._buf, self._offset + self._current_size)
+        item = self._children(self._hive, self._offset + self._current_size)
         self._current_size += item.size
         return item
     
     def __iter__(self):
-        self._current = -1
-        return self
-    
-    def __next__(self):
-        self._current += 1
-        try:
-            return self[self._current]
-        except IndexError:
-            raise StopIteration
+        # Lists are shared through the cell cache, so every iteration needs its own position
+        index = 0
+        while True:
+            try:
+                item = self[index]
+            except IndexError:
+                return
+            yield item
+            index += 1
 
     def __len__(self):
+        # Lists bounded by number of items know it upfront, only size-bounded ones have to chain through items
+        if self._max_size <= 0:
+            return max(self._max_items, 0)
         for item in self:
             pass
         return len(self._loaded)
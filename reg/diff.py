@@ -0,0 +1,86 @@
+import collections
+
+
+Change = collections.namedtuple('Change', ['change', 'kind', 'path', 'name', 'old', 'new'])
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+
+def _same_keynode(a, b):
+    # last_written changes on every write to a key, counts catch the rest of cheap-to-see changes
+    return (a.raw('last_written') == b.raw('last_written')
+            and a.number_of_subkeys == b.number_of_subkeys
+            and a.number_of_key_values == b.number_of_key_values)
+
+
+def _raw_data(keyvalue):
+    # Value data as stored, without decoding it. A view of the hive buffer unless it's split into db segments
+    chunks = list(keyvalue.chunks())
+    return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+
+def _same_value(a, b):
+    return (a.data_type == b.data_type
+            and a.data_size == b.data_size
+            and _raw_data(a) == _raw_data(b))
+
+
+def _values(keynode):
+    return {value.name.upper(): value for value in keynode.values}
+
+
+def _subkeys(keynode):
+    return {subkey.name.upper(): subkey for subkey in keynode.iter_subkeys()}
+
+
+def _subpath(path, name):
+    return ('' if path == '\\' else path) + '\\' + name
+
+
+def diff(registry_a, registry_b, path=None, prune=False):
+    '''
+    Yields Change(change, kind, path, name, old, new) turning registry_a into registry_b:
+    added, removed or modified keys and values. Keys are modified when their last_written differs
+    Every key is compared by default. prune - skip subtree of a key when both KeyNodes have equal last_written,
+    number of subkeys and number of values, so nearly identical hives are compared in time proportional to changes.
+    Windows updates last_written of the written key only, not of its ancestors, so pruning misses changes below
+    unchanged keys. Use it only for hives known to be written along whole paths
+    Values are compared by raw data first and decoded only when they differ. Names are matched case-insensitively
+    '''
+    key_a = registry_a.root if path is None else registry_a.get(path)
+    key_b = registry_b.root if path is None else registry_b.get(path)
+    stack = [(key_a.path, key_a._keynode, key_b._keynode)]
+    while stack:
+        path, a, b = stack.pop()
+        if prune and _same_keynode(a, b):
+            continue
+        if a.raw('last_written') != b.raw('last_written'):
+            yield Change(MODIFIED, 'key', path, a.name, a.last_written, b.last_written)
+
+        values_a = _values(a)
+        values_b = _values(b)
+        for name, value in values_a.items():
+            other = values_b.get(name)
+            if other is None:
+                yield Change(REMOVED, 'value', path, value.name, value.data, None)
+            elif not _same_value(value, other):
+                yield Change(MODIFIED, 'value', path, value.name, value.data, other.data)
+        for name, value in values_b.items():
+            if name not in values_a:
+                yield Change(ADDED, 'value', path, value.name, None, value.data)
+
+        subkeys_a = _subkeys(a)
+        subkeys_b = _subkeys(b)
+        pairs = []
+        for name, subkey in subkeys_a.items():
+            other = subkeys_b.get(name)
+            if other is None:
+                yield Change(REMOVED, 'key', _subpath(path, subkey.name), subkey.name, subkey.last_written, None)
+            else:
+                pairs.append((_subpath(path, subkey.name), subkey, other))
+        for name, subkey in subkeys_b.items():
+            if name not in subkeys_a:
+                yield Change(ADDED, 'key', _subpath(path, subkey.name), subkey.name, None, subkey.last_written)
+        # Reversed to visit subkeys in list order
+        stack.extend(reversed(pairs))
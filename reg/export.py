@@ -0,0 +1,108 @@
+import csv
+import json
+import time
+
+
+FIELDS = ['kind', 'path', 'name', 'last_written', 'type', 'data']
+
+
+class ExportStats:
+    def __init__(self, rows, seconds):
+        self.rows = rows
+        self.seconds = seconds
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return f'{self.rows} rows in {self.seconds:.3f}s, {self.rows_per_second:.0f} rows/s'
+
+
+def _data(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data).hex()
+    return data
+
+
+def value_dict(value):
+    '''
+    JSON-serializable dict of a RegistryValue, binary data as hex
+    '''
+    return dict(name=value.name, type=value.type, data=_data(value.value))
+
+
+def key_dict(key, values=True):
+    '''
+    JSON-serializable dict of a RegistryKey, with its values unless values is False
+    '''
+    keynode = key._keynode
+    result = dict(path=key.path, name=key.name, last_written=keynode.last_written,
+                  subkeys=keynode.number_of_subkeys if keynode.number_of_subkeys != 0xffffffff else 0)
+    if values:
+        result['values'] = [value_dict(value) for value in key.values]
+    return result
+
+
+def rows(registry, paths=None):
+    '''
+    Yields one row per key and one per value of subtrees at paths (whole hive by default), as tuples of FIELDS
+    Value rows carry last_written of their key
+    '''
+    for start in paths or [None]:
+        for path, key, values in registry.walk(start):
+            last_written = key._keynode.last_written
+            yield 'key', path, key.name, last_written, None, None
+            for value in values:
+                yield 'value', path, value.name, last_written, value.type, _data(value.value)
+
+
+def _jsonl_writer(out):
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    def write(batch):
+        out.write(''.join([encode(dict(zip(FIELDS, row))) + '\n' for row in batch]))
+    return write
+
+
+def _csv_writer(out):
+    writer = csv.writer(out)
+    writer.writerow(FIELDS)
+    def write(batch):
+        # MULTI_SZ values are lists, keep them parseable
+        writer.writerows([row if not isinstance(row[5], list) else row[:5] + (json.dumps(row[5], ensure_ascii=False),) for row in batch])
+    return write
+
+
+WRITERS = dict(
+    jsonl=_jsonl_writer,
+    csv=_csv_writer,
+)
+
+
+def export(registry, out, format='jsonl', paths=None, batch_size=4096, progress=None):
+    '''
+    Streams keys and values into text stream out as JSON Lines or CSV, writing batch_size rows at a time
+    Memory is bounded by a batch and the current branch of the tree
+    paths - subtrees to export, whole hive by default
+    progress - callable receiving ExportStats after each batch
+    Returns ExportStats
+    '''
+    if format not in WRITERS:
+        raise ValueError(f'Unsupported format {format}, expected one of {list(WRITERS)}')
+    write = WRITERS[format](out)
+
+    start = time.perf_counter()
+    count = 0
+    batch = []
+    for row in rows(registry, paths):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            write(batch)
+            count += len(batch)
+            batch = []
+            if progress is not None:
+                progress(ExportStats(count, time.perf_counter() - start))
+    write(batch)
+    count += len(batch)
+    out.flush()
+    return ExportStats(count, time.perf_counter() - start)
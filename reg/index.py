@@ -0,0 +1,125 @@
+import logging
+import mmap
+import os
+import struct
+
+
+log = logging.getLogger()
+
+
+MAGIC = b'RPIX'
+VERSION = 1
+# magic, version, sequence1, sequence2, last_written, checksum, number of entries
+HEADER = struct.Struct('<4sIIIQII')
+# path offset in paths blob, path length, KeyNode offset
+ENTRY = struct.Struct('<III')
+
+
+def fingerprint(regf):
+    '''
+    Header fields that change whenever hive is written, used to detect stale indexes
+    '''
+    return (regf.sequence1, regf.sequence2, regf.raw('last_written'), regf.checksum)
+
+
+class PathIndex:
+    '''
+    Sorted table of full key paths and offsets of their KeyNodes
+    Saved as a sidecar file which is memory-mapped and binary searched, so lookups don't walk the tree
+    Entries are sorted by uppercased path, paths are matched case-insensitively
+    '''
+    def __init__(self, buf):
+        self._buf = buf
+        magic, version, *header, self._count = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'Not a path index: {magic}, version {version}')
+        self.fingerprint = tuple(header)
+        self._paths = HEADER.size + self._count * ENTRY.size
+
+    @classmethod
+    def build(cls, registry):
+        '''
+        Walks the whole tree once and builds index in memory
+        '''
+        entries = []
+        stack = [('', registry.root._keynode)]
+        while stack:
+            path, keynode = stack.pop()
+            for subkey in keynode.iter_subkeys():
+                subkey_path = f'{path}\\{subkey.name}'
+                entries.append((subkey_path.upper(), subkey_path, subkey._offset))
+                stack.append((subkey_path, subkey))
+        entries.sort()
+
+        table = bytearray(HEADER.size + len(entries) * ENTRY.size)
+        HEADER.pack_into(table, 0, MAGIC, VERSION, *fingerprint(registry.regf), len(entries))
+        paths = bytearray()
+        for i, (_, path, offset) in enumerate(entries):
+            encoded = path.encode('utf-8')
+            ENTRY.pack_into(table, HEADER.size + i*ENTRY.size, len(paths), len(encoded), offset)
+            paths += encoded
+        return cls(bytes(table + paths))
+
+    @classmethod
+    def open(cls, path, registry):
+        '''
+        Memory-maps index saved at path
+        Builds and saves a new one if it's missing, broken or doesn't match registry header
+        '''
+        try:
+            with open(path, 'rb') as f:
+                index = cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError, struct.error):
+            index = None
+
+        if index is not None:
+            if index.fingerprint == fingerprint(registry.regf):
+                return index
+            log.info(f'Path index {path} is stale, rebuilding')
+            index.close()
+
+        index = cls.build(registry)
+        try:
+            index.save(path)
+        except OSError as e:
+            log.warning(f'Failed to save path index {path}: {e}')
+        return index
+
+    def save(self, path):
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self._buf)
+        os.replace(tmp, path)
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+    def _entry(self, i):
+        path_offset, length, offset = ENTRY.unpack_from(self._buf, HEADER.size + i*ENTRY.size)
+        start = self._paths + path_offset
+        return str(self._buf[start : start + length], 'utf-8'), offset
+
+    def get(self, path):
+        '''
+        Returns (path, KeyNode offset) for a full key path like \\Key\\Subkey, None if there's no such key
+        '''
+        target = path.upper()
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            current, offset = self._entry(middle)
+            upper = current.upper()
+            if upper == target:
+                return current, offset
+            elif upper < target:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def __len__(self):
+        return self._count
+
+    def __str__(self):
+        return f'{self.__class__.__module__}.{self.__class__.__qualname__}, {self._count} paths'
@@ -0,0 +1,286 @@
+import collections
+import logging
+import os
+
+from .common import *
+from .cell import FLAG_KEY_SYM_LINK
+from .registry import Registry
+
+
+log = logging.getLogger()
+
+
+ROOT_ALIASES = {
+    'HKEY_LOCAL_MACHINE': 'HKLM',
+    'HKEY_USERS': 'HKU',
+}
+# Kernel paths used by symbolic links, mapped to mount roots
+LINK_ROOTS = {
+    ('REGISTRY', 'MACHINE'): 'HKLM',
+    ('REGISTRY', 'USER'): 'HKU',
+}
+LINK_VALUE = 'SymbolicLinkValue'
+# Links pointing to links are followed this many times before giving up
+MAX_LINK_HOPS = 16
+# Hives of a Windows installation relative to its root and where they're mounted
+MACHINE_HIVES = {
+    'SYSTEM': 'HKLM\\SYSTEM',
+    'SOFTWARE': 'HKLM\\SOFTWARE',
+    'SAM': 'HKLM\\SAM',
+    'SECURITY': 'HKLM\\SECURITY',
+    'DEFAULT': 'HKU\\.DEFAULT',
+}
+PROFILE_LIST = '\\Microsoft\\Windows NT\\CurrentVersion\\ProfileList'
+
+
+def join(names):
+    return '\\'.join(names)
+
+
+def split(path):
+    '''
+    Uppercased names of a path with root aliases like HKEY_LOCAL_MACHINE replaced, as a tuple
+    '''
+    names = [name.upper() for name in path.split('\\') if name]
+    if names:
+        names[0] = ROOT_ALIASES.get(names[0], names[0])
+    return tuple(names)
+
+
+def _find(directory, *names):
+    # Case-insensitive path lookup, images copied from NTFS keep whatever case the files had
+    for name in names:
+        try:
+            entries = {entry.upper(): entry for entry in os.listdir(directory)}
+        except OSError:
+            return None
+        if name.upper() not in entries:
+            return None
+        directory = os.path.join(directory, entries[name.upper()])
+    return directory
+
+
+class Namespace:
+    '''
+    Hives mounted under registry roots like HKLM\\SYSTEM or HKU\\S-1-5-21-..., queried by full paths across all of them
+    Hives are opened on first access and kept in an LRU pool of at most max_open registries, the least recently used
+    one is closed when another has to be opened. Keys of a closed hive must not be used anymore
+    Symbolic links (keys with FLAG_KEY_SYM_LINK and a REG_LINK SymbolicLinkValue) are followed across hives. Each one is
+    resolved once and cached as a path prefix rewrite, so later lookups through it cost a tuple lookup per path level.
+    Offline SYSTEM hives don't have the volatile CurrentControlSet, it's resolved through \\Select\\Current
+    options - passed to Registry.from_path, use_mmap=True by default
+    '''
+    def __init__(self, max_open=8, **options):
+        if max_open < 1:
+            raise ValueError(f'max_open must be positive, got {max_open}')
+        self.max_open = max_open
+        self._options = dict(use_mmap=True, **options)
+        # uppercased mount point names: (mount point, hive path)
+        self._mounts = {}
+        self._open = collections.OrderedDict()
+        # uppercased full path names of links: uppercased target names
+        self._links = {}
+        self.opens = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_image(cls, root, max_open=8, **options):
+        '''
+        Mounts hives of a Windows installation at root: machine hives of Windows\\System32\\config under HKLM,
+        NTUSER.DAT and UsrClass.dat of Users\\* under HKU\\SID and HKU\\SID_Classes.
+        SIDs come from ProfileList of the SOFTWARE hive, user folder names are used when a profile isn't listed there
+        '''
+        namespace = cls(max_open, **options)
+        config = _find(root, 'Windows', 'System32', 'config')
+        for name, mount_point in MACHINE_HIVES.items():
+            path = _find(config, name) if config is not None else None
+            if path is not None:
+                namespace.mount(mount_point, path)
+
+        sids = {}
+        if 'HKLM\\SOFTWARE' in namespace:
+            try:
+                for profile in namespace.get('HKLM\\SOFTWARE' + PROFILE_LIST).subkeys:
+                    image_path = profile.values.get('ProfileImagePath')
+                    if image_path is not None and isinstance(image_path.value, str):
+                        sids[image_path.value.rstrip('\\').rsplit('\\', 1)[-1].upper()] = profile.name
+            except KeyError:
+                pass
+
+        users = _find(root, 'Users')
+        for user in sorted(os.listdir(users)) if users is not None else ():
+            sid = sids.get(user.upper(), user)
+            ntuser = _find(users, user, 'NTUSER.DAT')
+            if ntuser is not None and os.path.isfile(ntuser):
+                namespace.mount(f'HKU\\{sid}', ntuser)
+            classes = _find(users, user, 'AppData', 'Local', 'Microsoft', 'Windows', 'UsrClass.dat')
+            if classes is not None and os.path.isfile(classes):
+                namespace.mount(f'HKU\\{sid}_Classes', classes)
+        return namespace
+
+    def mount(self, mount_point, path):
+        '''
+        Registers hive at path under mount_point like HKLM\\SOFTWARE, without opening it
+        '''
+        names = split(mount_point)
+        if len(names) < 2:
+            raise ValueError(f'Mount point {mount_point} has to be below a root like HKLM')
+        if names in self._mounts:
+            raise ValueError(f'{mount_point} is already mounted')
+        self._mounts[names] = (join(name for name in mount_point.split('\\') if name), path)
+
+    def unmount(self, mount_point):
+        names = split(mount_point)
+        if names not in self._mounts:
+            raise KeyError(f'{mount_point} is not mounted')
+        del self._mounts[names]
+        registry = self._open.pop(names, None)
+        if registry is not None:
+            self._close(names, registry)
+        # Cached links may point into it or live in it
+        self._links.clear()
+
+    @property
+    def mounts(self):
+        '''
+        mount point: hive path
+        '''
+        return dict(self._mounts.values())
+
+    def __contains__(self, mount_point):
+        return split(mount_point) in self._mounts
+
+    def registry(self, mount_point):
+        '''
+        Registry mounted at mount_point, opened if it isn't open yet
+        '''
+        return self._registry(split(mount_point))
+
+    def _registry(self, names):
+        registry = self._open.get(names)
+        if registry is not None:
+            self._open.move_to_end(names)
+            return registry
+        if names not in self._mounts:
+            raise KeyError(f'{join(names)} is not mounted')
+        if len(self._open) >= self.max_open:
+            self._evict()
+        registry = Registry.from_path(self._mounts[names][1], **self._options)
+        self._open[names] = registry
+        self.opens += 1
+        return registry
+
+    def _evict(self):
+        names, registry = self._open.popitem(last=False)
+        self.evictions += 1
+        self._close(names, registry)
+
+    @staticmethod
+    def _close(names, registry):
+        try:
+            registry.close()
+        except BufferError:
+            # Someone still holds value data views of it, the mapping is released with them
+            log.debug(f'Hive mounted at {join(names)} is still in use, leaving it to garbage collection')
+
+    def _mount_of(self, names):
+        # Longest mounted prefix of names
+        for i in range(len(names), 1, -1):
+            if names[:i] in self._mounts:
+                return i
+        raise KeyError(join(names))
+
+    def _rewrite(self, names, follow):
+        # Replaces the longest cached link prefix with its target, the whole path being one only if it has to be followed
+        for i in range(len(names) if follow else len(names) - 1, 0, -1):
+            target = self._links.get(names[:i])
+            if target is not None:
+                return target + names[i:]
+        return None
+
+    def get(self, path, follow=True):
+        '''
+        Returns RegistryKey at a full path like HKLM\\SYSTEM\\CurrentControlSet\\Services, following symbolic links
+        Path of the returned key is relative to its hive, see locate. Names are matched case-insensitively
+        follow - False to return the link key itself when the path ends at one
+        '''
+        return self.locate(path, follow)[1]
+
+    def locate(self, path, follow=True):
+        '''
+        Returns (mount point, RegistryKey) of the hive the path ends in and the key, like get
+        '''
+        names = split(path)
+        for hop in range(MAX_LINK_HOPS):
+            names = self._rewrite(names, follow) or names
+            mount = self._mount_of(names)
+            registry = self._registry(names[:mount])
+            try:
+                key = registry.get('\\' + '\\'.join(names[mount:]))
+            except KeyError:
+                # A link on the way, walk down to find it
+                target = self._walk(registry, names, mount)
+                if target is None:
+                    raise KeyError(path) from None
+                names = target
+                continue
+            if follow and FLAG_KEY_SYM_LINK&key._keynode.flags > 0:
+                names = self._link(names, key)
+                continue
+            return self._mounts[names[:mount]][0], key
+        raise KeyError(f'{path}: more than {MAX_LINK_HOPS} symbolic links on the way, they probably loop')
+
+    def _walk(self, registry, names, mount):
+        # Returns names with the first link on the path replaced by its target, None if the path doesn't exist
+        key = registry.root
+        for i in range(mount, len(names)):
+            try:
+                key = key.subkey(names[i])
+            except KeyError:
+                if i == mount and names[i] == 'CURRENTCONTROLSET':
+                    target = self._current_control_set(registry, names[:mount])
+                    if target is not None:
+                        self._links[names[:i + 1]] = target
+                        return target + names[i + 1:]
+                return None
+            if FLAG_KEY_SYM_LINK&key._keynode.flags > 0:
+                return self._link(names[:i + 1], key) + names[i + 1:]
+        return None
+
+    def _link(self, names, key):
+        # Resolves link key at names and caches its target
+        value = key.values.get(LINK_VALUE)
+        if value is None:
+            raise KeyError(f'Symbolic link {join(names)} has no {LINK_VALUE}')
+        target = split(value.decode(raw=True).decode('utf-16-le').rstrip('\x00'))
+        root = LINK_ROOTS.get(target[:2])
+        if root is None:
+            raise KeyError(f'Symbolic link {join(names)} points outside of mountable roots: {target}')
+        self._links[names] = (root,) + target[2:]
+        return self._links[names]
+
+    @staticmethod
+    def _current_control_set(registry, mount):
+        try:
+            current = registry.get('\\Select').values.get('Current')
+        except KeyError:
+            return None
+        if current is None or not isinstance(current.decode(raw=True), int):
+            return None
+        return mount + (f'CONTROLSET{current.decode(raw=True):03}',)
+
+    def close(self):
+        try:
+            for names, registry in self._open.items():
+                self._close(names, registry)
+        finally:
+            self._open.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __str__(self):
+        return f'{self.__class__.__module__}.{self.__class__.__qualname__}, {len(self._mounts)} hives mounted, {len(self._open)}/{self.max_open} open'
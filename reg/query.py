@@ -0,0 +1,149 @@
+import fnmatch
+import re
+
+
+# Glob segment matching any number of levels
+ANY = object()
+GLOB_CHARS = frozenset('*?[')
+REGEX_CHARS = frozenset('.^$*+?{}[]|()')
+
+
+class GlobMatcher:
+    '''
+    Matches paths against a glob like \\ControlSet00*\\Services\\*\\ImagePath, segment by segment
+    Segments are fnmatch patterns, ** matches any number of levels. Names are matched case-insensitively
+    State of a key is a frozenset of positions in the pattern its path can reach, empty one means nothing below can match
+    '''
+    def __init__(self, pattern):
+        self.segments = []
+        for segment in pattern.split('\\'):
+            if not segment:
+                continue
+            if segment == '**':
+                self.segments.append(ANY)
+            elif GLOB_CHARS.isdisjoint(segment):
+                self.segments.append(segment.upper())
+            else:
+                self.segments.append(re.compile(fnmatch.translate(segment), re.IGNORECASE).match)
+
+    def _closure(self, positions):
+        # ** may match zero levels
+        for position in sorted(positions):
+            while position < len(self.segments) and self.segments[position] is ANY:
+                position += 1
+                positions.add(position)
+        return frozenset(positions)
+
+    def start(self):
+        return self._closure({0})
+
+    def step(self, state, name):
+        '''
+        State of a subkey named name, None if neither it nor anything below can match
+        '''
+        positions = set()
+        upper_name = None
+        for position in state:
+            if position == len(self.segments):
+                continue
+            segment = self.segments[position]
+            if segment is ANY:
+                positions.add(position)
+            elif isinstance(segment, str):
+                if upper_name is None:
+                    upper_name = name.upper()
+                if segment == upper_name:
+                    positions.add(position + 1)
+            elif segment(name):
+                positions.add(position + 1)
+        return self._closure(positions) if positions else None
+
+    def literals(self, state):
+        '''
+        Names of the only subkeys that can match, None if any subkey can
+        '''
+        names = []
+        for position in state:
+            if position == len(self.segments):
+                continue
+            if not isinstance(self.segments[position], str):
+                return None
+            names.append(self.segments[position])
+        return list(dict.fromkeys(names))
+
+    def matches(self, state):
+        return len(self.segments) in state
+
+    def has_values(self, state):
+        '''
+        Whether any value of the key can match, checked before decoding them
+        '''
+        return len(self.segments) - 1 in state
+
+    def matches_value(self, state, name):
+        state = self.step(state, name)
+        return state is not None and len(self.segments) in state
+
+
+def _literal_prefix(pattern):
+    # Longest literal start of a regex, used to prune subtrees outside of it
+    if '|' in pattern:
+        return ''
+    prefix = []
+    i = 1 if pattern.startswith('^') else 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            if i + 1 == len(pattern) or pattern[i + 1].isalnum():
+                break
+            char = pattern[i + 1]
+            i += 1
+        elif char in REGEX_CHARS:
+            break
+        prefix.append(char)
+        i += 1
+    # Quantifier makes the last character optional
+    if i < len(pattern) and pattern[i] in '*?{' and prefix:
+        prefix.pop()
+    return ''.join(prefix).upper()
+
+
+class RegexMatcher:
+    '''
+    Matches full paths, like \\ControlSet001\\Services\\Tcpip or \\Software\\Run\\Name for values, against a regex
+    Case-insensitive. Subtrees are pruned by the literal start of the regex, e.g. \\\\Software\\\\Microsoft\\\\.*
+    State of a key is its path
+    '''
+    def __init__(self, pattern):
+        self.regex = re.compile(pattern, re.IGNORECASE)
+        self.prefix = _literal_prefix(pattern)
+
+    def start(self):
+        return ''
+
+    def step(self, state, name):
+        path = state + '\\' + name
+        upper_path = path.upper()
+        if (self.prefix and not upper_path.startswith(self.prefix)
+                and not self.prefix.startswith(upper_path + '\\') and self.prefix != upper_path):
+            return None
+        return path
+
+    def literals(self, state):
+        return None
+
+    def matches(self, state):
+        return self.regex.fullmatch(state or '\\') is not None
+
+    def has_values(self, state):
+        return True
+
+    def matches_value(self, state, name):
+        return self.regex.fullmatch(state + '\\' + name) is not None
+
+
+def compile(pattern, regex=False):
+    '''
+    Returns matcher of glob or regex pattern for Registry.find
+    '''
+    return RegexMatcher(pattern) if regex else GlobMatcher(pattern)
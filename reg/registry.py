@@ -1,65 +1,80 @@
+import contextlib
 import logging
+import mmap
+import time
 
 from .common import *
 from .cell import *
+from .index import PathIndex
+from . import query
+from .timeline import Timeline
+from .transaction import find_logs, replay
+from .validate import validate
 
 log = logging.getLogger()
 
 
 class Regf(Block):
-    def __init__(self, buf, offset):
-        super().__init__(buf, offset, dict(
-            signature=(0, STR, 4),
-            sequence1=(4, DWORD),
-            sequence2=(8, DWORD),
-            last_written=(12, FILETIME),
-            major_version=(20, DWORD),
-            minor_version=(24, DWORD),
-            file_type=(28, DWORD),
-            file_format=(32, DWORD),
-            root_cell_offset=(36, DWORD),
-            hive_bins_data_size=(40, DWORD),
-            clustering_factor=(44, DWORD),
-            file_name=(48, STR, 64, 'utf-16-le'),
-            rmid=(112, GUID),
-            logid=(128, GUID),
-            flags=(144, DWORD),
-            tmid=(148, GUID),
-            guid_signature=(164, STR, 4),
-            last_reorganized=(168, FILETIME),
-            checksum=(508, DWORD),
-            thawtmid=(4040, GUID),
-            thawrmid=(4056, GUID),
-            thawlogid=(4056, DWORD),
-            boot_type=(4088, DWORD),
-            boot_recover=(4092, DWORD)
-        ))
+    __slots__ = ()
+    _fields = dict(
+        signature=(0, STR, 4),
+        sequence1=(4, DWORD),
+        sequence2=(8, DWORD),
+        last_written=(12, FILETIME),
+        major_version=(20, DWORD),
+        minor_version=(24, DWORD),
+        file_type=(28, DWORD),
+        file_format=(32, DWORD),
+        root_cell_offset=(36, DWORD),
+        hive_bins_data_size=(40, DWORD),
+        clustering_factor=(44, DWORD),
+        file_name=(48, STR, 64, 'utf-16-le'),
+        rmid=(112, GUID),
+        logid=(128, GUID),
+        flags=(144, DWORD),
+        tmid=(148, GUID),
+        guid_signature=(164, STR, 4),
+        last_reorganized=(168, FILETIME),
+        checksum=(508, DWORD),
+        thawtmid=(4040, GUID),
+        thawrmid=(4056, GUID),
+        thawlogid=(4072, GUID),
+        boot_type=(4088, DWORD),
+        boot_recover=(4092, DWORD)
+    )
 
 
 class Hbin(Block):
-    def __init__(self, buf, offset):
-        super().__init__(buf, offset, dict(
-            signature=(0, STR, 4),
-            offset=(4, DWORD),
-            size=(8, DWORD),
-            timestamp=(20, FILETIME),
-            spare=(28, DWORD)
-        ))
+    __slots__ = ('_cells',)
+    _fields = dict(
+        signature=(0, STR, 4),
+        offset=(4, DWORD),
+        size=(8, DWORD),
+        timestamp=(20, FILETIME),
+        spare=(28, DWORD)
+    )
+
+    def __init__(self, hive, offset):
+        super().__init__(hive, offset)
         self._cells = None
 
     @property
     def cells(self):
         if self._cells is None:
-            self._cells = Cells(self._buf, self._offset + 32, self.size)
+            self._cells = Cells(self._hive, self._offset + 32, self.size - 32)
         return self._cells
 
 
 class Hbins(LazyList):
-    def __init__(self, buf, offset, max_size):
-        super().__init__(buf, offset, Hbin, max_size=max_size)
+    __slots__ = ()
+
+    def __init__(self, hive, offset, max_size):
+        super().__init__(hive, offset, Hbin, max_size=max_size)
 
 
 class RegistryValue:
+    __slots__ = ('_keyvalue',)
+
     def __init__(self, keyvalue):
         if not isinstance(keyvalue, KeyValue):
             raise ValueError(f'Expected KeyValue, got {type(keyvalue)}')
@@ -73,6 +88,12 @@ class RegistryValue:
     @property
     def value(self):
         return self._keyvalue.data
+
+    def decode(self, raw=None):
+        '''
+        Returns value data in the given decoding mode, see KeyValue.decode
+        '''
+        return self._keyvalue.decode(raw)
     
     @property
     def type(self):
@@ -86,37 +107,60 @@ class RegistryValue:
 
 
 class RegistryKey:
+    __slots__ = ('_keynode', '_path')
+
     def __init__(self, keynode, path):
         if not isinstance(keynode, KeyNode):
             raise ValueError(f'Expected KeyNode, got {type(keynode)}')
         
         self._keynode = keynode
         self._path = path
-        self._subkeys = None
-        self._values = None
 
     @property
     def name(self):
         return self._keynode.name
+
+    @property
+    def last_written(self):
+        return self._keynode.last_written
+
+    def field(self, name, raw=None):
+        '''
+        Returns KeyNode field like last_written in the given decoding mode, mode of the registry by default
+        '''
+        return self._keynode.get(name, raw)
+
+    @property
+    def security(self):
+        '''
+        SecurityDescriptor of the key, None if it has none. Shared with all keys using the same sk cell
+        '''
+        security = self._keynode.security
+        return None if security is None else security.descriptor
+
+    @property
+    def path(self):
+        '''
+        Full path of the key, \\ for root
+        '''
+        return self._path + self.name if self._path else '\\'
         
     @property
     def subkeys(self):
-        if self._subkeys is None:
-            name = '' if self.name == 'ROOT' else self.name
-            self._subkeys = KeyedList({i.name: RegistryKey(i, self._path + name + '\\') for i in self._unpack_subkeys(self._keynode.subkeys)})
-        return self._subkeys
-    
-    def _unpack_subkeys(self, cell):
-        if isinstance(cell, PointersList) or isinstance(cell, list):
-            r = []
-            for i in cell:
-                r.extend(self._unpack_subkeys(i))
-            return r
-        elif isinstance(cell, KeyNode):
-            return [cell,]
-        else:
-            print(type(cell))
-            raise SystemError
+        return SubkeysView(self)
+
+    def _child(self, keynode):
+        # Root has empty path and its name is not a part of subkey paths
+        return RegistryKey(keynode, self._path + self.name + '\\' if self._path else '\\')
+
+    def subkey(self, name):
+        '''
+        Returns direct subkey by case-insensitive name without loading its siblings
+        '''
+        keynode = self._keynode.find_subkey(name)
+        if keynode is None:
+            raise KeyError(name)
+        return self._child(keynode)
     
     def __getitem__(self, key):
         if not isinstance(key, str) and not isinstance(key, int):
@@ -126,10 +170,8 @@ class RegistryKey:
 
     @property
     def values(self):
-        if self._values is None:
-            self._values = KeyedList({i.name: RegistryValue(i) for i in self._keynode.values})
-        return self._values
-    
+        return ValuesView(self)
+
     def __str__(self):
         return f'{self._path}{self.name}, {len(self.values)} values, {len(self.subkeys)} subkeys'
     
@@ -137,43 +179,432 @@ class RegistryKey:
         return f'RegistryKey(name="{self.name}", path="{self._path}")'
 
 
+class SubkeysView:
+    '''
+    Subkeys of a RegistryKey decoded only when accessed
+    len() comes from the KeyNode, names are found via subkey list hints and sort order, indexes are resolved in the list,
+    iteration yields keys one by one. Name access is case-insensitive
+    '''
+    __slots__ = ('_key',)
+
+    def __init__(self, key):
+        self._key = key
+
+    def __len__(self):
+        return self._key._keynode.subkeys_count
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._key.subkey(key)
+        elif isinstance(key, int):
+            return self._key._child(self._key._keynode.subkey_at(key + len(self) if key < 0 else key))
+        raise TypeError(f'Expected str or int, got {type(key)}')
+
+    def __contains__(self, name):
+        return self._key._keynode.find_subkey(name) is not None
+
+    def __iter__(self):
+        return map(self._key._child, self._key._keynode.iter_subkeys())
+
+    def get(self, name, default=None):
+        keynode = self._key._keynode.find_subkey(name)
+        return default if keynode is None else self._key._child(keynode)
+
+    def names(self):
+        return [keynode.name for keynode in self._key._keynode.iter_subkeys()]
+
+    def __repr__(self):
+        return str(list(self))
+
+
+class ValuesView:
+    '''
+    Values of a RegistryKey decoded only when accessed
+    len() comes from the KeyNode, indexes are resolved in the values list, names are matched case-insensitively
+    decoding value names only, iteration yields values one by one
+    '''
+    __slots__ = ('_key',)
+
+    def __init__(self, key):
+        self._key = key
+
+    def __len__(self):
+        return self._key._keynode.values_count
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            value = self.get(key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        elif isinstance(key, int):
+            return RegistryValue(self._key._keynode.values[key + len(self) if key < 0 else key])
+        raise TypeError(f'Expected str or int, got {type(key)}')
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __iter__(self):
+        return map(RegistryValue, self._key._keynode.values)
+
+    def get(self, name, default=None):
+        name = name.upper()
+        for keyvalue in self._key._keynode.values:
+            if keyvalue.name.upper() == name:
+                return RegistryValue(keyvalue)
+        return default
+
+    def names(self):
+        return [keyvalue.name for keyvalue in self._key._keynode.values]
+
+    def __repr__(self):
+        return str(list(self))
+
+
 class Registry:
-    def __init__(self, buf):
+    '''
+    Accepts any object supporting the buffer protocol: bytes, bytearray, memoryview or mmap
+    Fields are decoded in place, so with mmap only the pages actually touched are read from disk
+    logs - transaction logs (paths, file objects or buffers) replayed in memory when the hive is dirty,
+    see transaction.replay. .replayed is the number of applied log entries
+    raw - decode timestamps, qwords, guids and value data into native ints and bytes
+    instead of formatted strings. Key and value names are always decoded. Can be chosen per call as well:
+    RegistryValue.decode(raw), RegistryKey.field(name, raw)
+    '''
+    def __init__(self, buf, cache_size=DEFAULT_CACHE_SIZE, logs=None, raw=False):
+        self._mmap = buf if isinstance(buf, mmap.mmap) else None
+        self.replayed = 0
+        if logs:
+            buf, self.replayed = replay(buf, logs)
+            if self._mmap is not None and buf is not self._mmap:
+                # Hive grew, replay switched to a copy
+                self._mmap.close()
+                self._mmap = None
         self._buf = buf
+        self._hive = Hive(buf, cache_size, raw)
         self._regf = None
         self._hbins = None
+        self._index = None
+        self._timeline = None
     
     @classmethod
-    def from_file(cls, fd):
-        return cls(fd.read())
+    def from_file(cls, fd, use_mmap=False, cache_size=DEFAULT_CACHE_SIZE, logs=None, raw=False):
+        if use_mmap:
+            # Copy-on-write mapping lets replay patch dirty pages without touching the file
+            access = mmap.ACCESS_COPY if logs else mmap.ACCESS_READ
+            return cls(mmap.mmap(fd.fileno(), 0, access=access), cache_size, logs, raw)
+        return cls(fd.read(), cache_size, logs, raw)
     
     @classmethod
-    def from_path(cls, path):
+    def from_path(cls, path, use_mmap=False, index=False, cache_size=DEFAULT_CACHE_SIZE, logs=None, raw=False, timeline=False):
+        '''
+        index - True to use sidecar path index next to the hive (path + '.idx'), or index file path
+        timeline - True to use sidecar last_written timeline next to the hive (path + '.tl'), or timeline file path
+        cache_size - max number of decoded cells kept in LRU cache shared by all keys and values, 0 to disable
+        logs - True to replay path.LOG1 and path.LOG2 when they exist, or list of log paths
+        '''
+        if logs is True:
+            logs = find_logs(path)
         with open(path, 'rb') as f:
-            return cls.from_file(f)
+            registry = cls.from_file(f, use_mmap, cache_size, logs, raw)
+        if index:
+            registry.load_index(f'{path}.idx' if index is True else index)
+        if timeline:
+            registry.load_timeline(f'{path}.tl' if timeline is True else timeline)
+        return registry
+
+    def validate(self, cells=True):
+        '''
+        Pre-flight integrity check of the buffer (after log replay), see reg.validate.validate
+        Returns ValidationReport. Call .raise_for_errors() on it to fail fast
+        '''
+        return validate(self._buf, cells)
+
+    def load_index(self, path):
+        '''
+        Attaches path index sidecar, building or rebuilding it when it's missing or stale
+        '''
+        self._index = PathIndex.open(path, self)
+        return self._index
+
+    def load_timeline(self, path=None):
+        '''
+        Attaches last_written timeline sidecar, building or rebuilding it when it's missing or stale
+        Without path it's built in memory only
+        '''
+        self._timeline = Timeline.build(self) if path is None else Timeline.open(path, self)
+        return self._timeline
+
+    @property
+    def timeline(self):
+        if self._timeline is None:
+            self.load_timeline()
+        return self._timeline
+
+    def modified(self, start=None, end=None):
+        '''
+        Yields (path, RegistryKey) of keys with start <= last_written < end, oldest first
+        start, end - datetimes (naive ones are UTC) or FILETIME ints, open-ended when None
+        Uses timeline, building it in memory on first call unless loaded
+        '''
+        return self._timeline_keys(self.timeline.range(start, end))
+
+    def recent(self, count):
+        '''
+        Yields (path, RegistryKey) of count most recently written keys, newest first
+        '''
+        return self._timeline_keys(self.timeline.latest(count))
+
+    def _timeline_keys(self, entries):
+        paths = {}
+        for last_written, offset in entries:
+            keynode = self._hive.cell(KeyNode, offset)
+            path = self._scan_path(keynode, paths)
+            yield path, self._key_at(keynode, path)
+
+    def close(self):
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        if self._timeline is not None:
+            self._timeline.close()
+            self._timeline = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def cache(self):
+        '''
+        CellCache with hits and misses counters
+        '''
+        return self._hive.cache
+
+    def enable_stats(self):
+        '''
+        Starts collecting Stats from zero and returns them
+        '''
+        self._hive.stats = Stats(self._hive.cache)
+        return self._hive.stats
+
+    def disable_stats(self):
+        self._hive.stats = None
+
+    def stats(self):
+        '''
+        Parser counters as a dict ready to be exported: cells decoded by type, bytes, unpack calls, list loads,
+        cache hits and misses, largest lists and timings of get, subkeys and data, see common.Stats
+        Only cache counters and size are there unless stats are enabled
+        '''
+        cache = dict(cache_hits=self._hive.cache.hits, cache_misses=self._hive.cache.misses, cache_size=len(self._hive.cache))
+        if self._hive.stats is None:
+            return cache
+        return {**self._hive.stats.asdict(), 'cache_size': cache['cache_size']}
+
+    @contextlib.contextmanager
+    def profile(self):
+        '''
+        Collects Stats of the work done within the block, restoring previous collection state afterwards:
+            with registry.profile() as stats:
+                ...
+            print(stats.asdict())
+        '''
+        previous = self._hive.stats
+        stats = self.enable_stats()
+        try:
+            yield stats
+        finally:
+            self._hive.stats = previous
 
     @property
     def regf(self):
         if self._regf is None:
-            self._regf = Regf(self._buf, 0)
+            self._regf = Regf(self._hive, 0)
         return self._regf
 
     @property
     def hbins(self):
         if self._hbins is None:
-            self._hbins = Hbins(self._buf, 4096, self.regf.hive_bins_data_size)
+            self._hbins = Hbins(self._hive, 4096, self.regf.hive_bins_data_size)
         return self._hbins
 
     def __str__(self) -> str:
-        return f'Registry {self.regf.file_name}'
+        return f'Registry {self.regf.get("file_name", raw=False)}'
 
     @property
     def root(self):
-        return RegistryKey(self.hbins[0].cells[0], '')
+        return RegistryKey(self._hive.cell(KeyNode, 4096 + self.regf.root_cell_offset), '')
     
+    def descriptors(self):
+        '''
+        Yields every KeySecurity of the hive once, following the list of sk cells from the one of the root
+        A permissions audit goes over them instead of over keys: each one knows how many keys reference it
+        '''
+        security = self.root._keynode.security
+        seen = set()
+        # The list is circular
+        while security is not None and security._offset not in seen:
+            seen.add(security._offset)
+            yield security
+            security = load_security(self._hive, 4096 + security.flink)
+
     def get(self, path):
-        keynode = self.root
-        path = path.strip('\\').split('\\')
-        for name in path:
-            keynode = keynode[name]
-        return keynode
+        '''
+        Returns RegistryKey by its full path. Names are matched case-insensitively, like Windows does
+        '''
+        stats = self._hive.stats
+        if stats is None:
+            return self._get(path)
+        start = time.perf_counter()
+        try:
+            return self._get(path)
+        finally:
+            stats.timed('get', start)
+
+    def _get(self, path):
+        names = [name for name in path.split('\\') if name]
+        if self._index is not None and names:
+            entry = self._index.get('\\' + '\\'.join(names))
+            if entry is None:
+                raise KeyError(path)
+            path, offset = entry
+            return self._key_at(self._hive.cell(KeyNode, offset), path)
+
+        key = self.root
+        for name in names:
+            key = key.subkey(name)
+        return key
+
+    @staticmethod
+    def _key_at(keynode, path):
+        # RegistryKey keeps path of its parent, root has empty one
+        return RegistryKey(keynode, path[:path.rindex('\\') + 1] if path != '\\' else '')
+
+    def _scan_path(self, keynode, paths):
+        # Resolves full path via parent offsets. Only keys having subkeys are memoized as only they can be ancestors
+        chain = []
+        while keynode._offset not in paths:
+            if FLAG_KEY_HIVE_ENTRY&keynode.flags > 0:
+                paths[keynode._offset] = '\\'
+                break
+            if len(chain) > 512:
+                raise ValueError(f'KeyNode at {hex(chain[0]._offset)} is deeper than 512 levels, parent offsets loop')
+            chain.append(keynode)
+            keynode = KeyNode(self._hive, 4096 + keynode.parent)
+
+        path = paths[keynode._offset]
+        for keynode in reversed(chain):
+            path = ('' if path == '\\' else path) + '\\' + keynode.name
+            if keynode.number_of_subkeys > 0:
+                paths[keynode._offset] = path
+        return path
+
+    def _iter_hbins(self, start=None, end=None):
+        # Unlike .hbins doesn't keep Hbins loaded and can start from any hbin offset
+        offset = 4096 if start is None else start
+        end = 4096 + self.regf.hive_bins_data_size if end is None else end
+        while offset < end:
+            hbin = Hbin(self._hive, offset)
+            if hbin.size == 0:
+                raise ValueError(f'Invalid hbin size at {hex(offset)}')
+            yield hbin
+            offset += hbin.size
+
+    def scan(self, include_values=True, start=None, end=None):
+        '''
+        Linear pass over all hbins in file order, without tree traversal
+        Yields (path, RegistryKey) for every allocated KeyNode and (path, RegistryValue) for every allocated KeyValue,
+        value path being path of its key. Values not referenced by any key come last with None path
+        Key paths are rebuilt from parent offsets, each ancestor is resolved only once
+        start, end - absolute offsets of hbins limiting the scan. Values of keys outside of them are reported as unreferenced
+        '''
+        paths = {}
+        # Values whose key was scanned before them and values scanned before their key
+        owners = {}
+        pending = set()
+        for hbin in self._iter_hbins(start, end):
+            for cell in hbin.cells.iter_cells((b'nk', b'vk') if include_values else (b'nk',)):
+                if isinstance(cell, KeyNode):
+                    path = self._scan_path(cell, paths)
+                    yield path, self._key_at(cell, path)
+                    if not include_values or cell.number_of_key_values == 0 or cell.number_of_key_values == 0xffffffff:
+                        continue
+                    for value_offset in cell.values._pointers():
+                        if 4096 + value_offset in pending:
+                            pending.remove(4096 + value_offset)
+                            yield path, RegistryValue(KeyValue(self._hive, 4096 + value_offset))
+                        else:
+                            owners[4096 + value_offset] = path
+                else:
+                    path = owners.pop(cell._offset, None)
+                    if path is None:
+                        pending.add(cell._offset)
+                    else:
+                        yield path, RegistryValue(cell)
+        for offset in sorted(pending):
+            yield None, RegistryValue(KeyValue(self._hive, offset))
+
+    def walk(self, start_path=None, max_depth=None, include_values=True):
+        '''
+        Iterative depth-first traversal yielding (path, key, values) tuples
+        values is a list of RegistryValue, or None if include_values is False
+        Subkeys are decoded one at a time and aren't cached on their parents,
+        so only the current branch is kept alive regardless of hive size or depth
+        '''
+        start = self.root if start_path is None else self.get(start_path)
+        stack = [iter((start,))]
+        while stack:
+            key = next(stack[-1], None)
+            if key is None:
+                stack.pop()
+                continue
+
+            values = [RegistryValue(i) for i in key._keynode.values] if include_values else None
+            yield key.path, key, values
+
+            if max_depth is None or len(stack) <= max_depth:
+                stack.append(map(key._child, key._keynode.iter_subkeys()))
+
+    @staticmethod
+    def _find_subkeys(matcher, key, state):
+        names = matcher.literals(state)
+        if names is None:
+            keynodes = key._keynode.iter_subkeys()
+        else:
+            # Literal segments are looked up directly instead of listing all subkeys
+            keynodes = filter(None, map(key._keynode.find_subkey, names))
+        for keynode in keynodes:
+            substate = matcher.step(state, keynode.name)
+            if substate is not None:
+                yield key._child(keynode), substate
+
+    def find(self, pattern, regex=False, include_keys=True, include_values=True):
+        '''
+        Streams (path, RegistryKey) for keys and (path, RegistryValue) for values matching the pattern,
+        value path being path of its key. Pattern is a glob like \\ControlSet00*\\Services\\*\\ImagePath or **\\*Run*,
+        or a regex over full paths if regex is True, see query module
+        Subkeys are rejected by name before anything else is decoded, so subtrees that can't match are never visited,
+        and values are only read for keys where some of them can match
+        '''
+        matcher = query.compile(pattern, regex)
+        stack = [iter(((self.root, matcher.start()),))]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                continue
+
+            key, state = item
+            if include_keys and matcher.matches(state):
+                yield key.path, key
+            if include_values and matcher.has_values(state):
+                for keyvalue in key._keynode.values:
+                    if matcher.matches_value(state, keyvalue.name):
+                        yield key.path, RegistryValue(keyvalue)
+            stack.append(self._find_subkeys(matcher, key, state))
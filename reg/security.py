@@ -0,0 +1,309 @@
+import enum
+import logging
+import struct
+import uuid
+
+from .common import *
+
+
+log = logging.getLogger()
+
+
+class AceType(enum.IntEnum):
+    ACCESS_ALLOWED = 0x00
+    ACCESS_DENIED = 0x01
+    SYSTEM_AUDIT = 0x02
+    SYSTEM_ALARM = 0x03
+    ACCESS_ALLOWED_COMPOUND = 0x04
+    ACCESS_ALLOWED_OBJECT = 0x05
+    ACCESS_DENIED_OBJECT = 0x06
+    SYSTEM_AUDIT_OBJECT = 0x07
+    SYSTEM_ALARM_OBJECT = 0x08
+    ACCESS_ALLOWED_CALLBACK = 0x09
+    ACCESS_DENIED_CALLBACK = 0x0a
+    ACCESS_ALLOWED_CALLBACK_OBJECT = 0x0b
+    ACCESS_DENIED_CALLBACK_OBJECT = 0x0c
+    SYSTEM_AUDIT_CALLBACK = 0x0d
+    SYSTEM_ALARM_CALLBACK = 0x0e
+    SYSTEM_AUDIT_CALLBACK_OBJECT = 0x0f
+    SYSTEM_ALARM_CALLBACK_OBJECT = 0x10
+    SYSTEM_MANDATORY_LABEL = 0x11
+    SYSTEM_RESOURCE_ATTRIBUTE = 0x12
+    SYSTEM_SCOPED_POLICY_ID = 0x13
+
+
+class AceFlags(enum.IntFlag):
+    OBJECT_INHERIT = 0x01
+    CONTAINER_INHERIT = 0x02
+    NO_PROPAGATE_INHERIT = 0x04
+    INHERIT_ONLY = 0x08
+    INHERITED = 0x10
+    SUCCESSFUL_ACCESS = 0x40
+    FAILED_ACCESS = 0x80
+
+
+class KeyRights(enum.IntFlag):
+    QUERY_VALUE = 0x0001
+    SET_VALUE = 0x0002
+    CREATE_SUB_KEY = 0x0004
+    ENUMERATE_SUB_KEYS = 0x0008
+    NOTIFY = 0x0010
+    CREATE_LINK = 0x0020
+    WOW64_64KEY = 0x0100
+    WOW64_32KEY = 0x0200
+    DELETE = 0x00010000
+    READ_CONTROL = 0x00020000
+    WRITE_DAC = 0x00040000
+    WRITE_OWNER = 0x00080000
+    SYNCHRONIZE = 0x00100000
+    ACCESS_SYSTEM_SECURITY = 0x01000000
+    MAXIMUM_ALLOWED = 0x02000000
+    GENERIC_ALL = 0x10000000
+    GENERIC_EXECUTE = 0x20000000
+    GENERIC_WRITE = 0x40000000
+    GENERIC_READ = 0x80000000
+
+
+# Security descriptor control flags
+SE_SACL_PRESENT = 0x0010
+SE_DACL_PRESENT = 0x0004
+SE_SELF_RELATIVE = 0x8000
+
+# Object ACEs have GUIDs before their SID when these flags are set
+ACE_OBJECT_TYPE_PRESENT = 0x1
+ACE_INHERITED_OBJECT_TYPE_PRESENT = 0x2
+
+WELL_KNOWN_SIDS = {
+    'S-1-0-0': 'Nobody',
+    'S-1-1-0': 'Everyone',
+    'S-1-3-0': 'CREATOR OWNER',
+    'S-1-3-1': 'CREATOR GROUP',
+    'S-1-5-7': 'ANONYMOUS LOGON',
+    'S-1-5-11': 'Authenticated Users',
+    'S-1-5-12': 'RESTRICTED',
+    'S-1-5-18': 'SYSTEM',
+    'S-1-5-19': 'LOCAL SERVICE',
+    'S-1-5-20': 'NETWORK SERVICE',
+    'S-1-5-32-544': 'Administrators',
+    'S-1-5-32-545': 'Users',
+    'S-1-5-32-547': 'Power Users',
+    'S-1-5-32-551': 'Backup Operators',
+    'S-1-15-2-1': 'ALL APPLICATION PACKAGES',
+    'S-1-15-2-2': 'ALL RESTRICTED APPLICATION PACKAGES',
+    'S-1-16-4096': 'Low Mandatory Level',
+    'S-1-16-8192': 'Medium Mandatory Level',
+    'S-1-16-12288': 'High Mandatory Level',
+    'S-1-16-16384': 'System Mandatory Level',
+}
+
+
+class Sid(Block):
+    __slots__ = ('_sid',)
+    _fields = dict(
+        revision=(0, BYTE),
+        sub_authority_count=(1, BYTE),
+        identifier_authority=(2, BYTES, 6),
+    )
+
+    def __init__(self, hive, offset):
+        super().__init__(hive, offset)
+        self._sid = None
+
+    @property
+    def size(self):
+        return 8 + self.sub_authority_count * 4
+
+    @property
+    def sub_authorities(self):
+        return struct.unpack_from(f'<{self.sub_authority_count}I', self._buf, self._offset + 8)
+
+    @property
+    def sid(self):
+        '''
+        String form like S-1-5-32-544
+        '''
+        if self._sid is None:
+            authority = int.from_bytes(self.identifier_authority, 'big')
+            self._sid = '-'.join(['S', str(self.revision), str(authority) if authority < 1 << 32 else hex(authority),
+                                  *map(str, self.sub_authorities)])
+        return self._sid
+
+    @property
+    def name(self):
+        '''
+        Account name of well-known SIDs, None for others
+        '''
+        return WELL_KNOWN_SIDS.get(self.sid)
+
+    def __str__(self):
+        return self.sid if self.name is None else f'{self.sid} ({self.name})'
+
+
+class Ace(Block):
+    __slots__ = ('_sid',)
+    _fields = dict(
+        ace_type=(0, BYTE),
+        ace_flags=(1, BYTE),
+        ace_size=(2, WORD),
+        mask=(4, DWORD),
+    )
+
+    def __init__(self, hive, offset):
+        super().__init__(hive, offset)
+        self._sid = None
+
+    @property
+    def type_str(self):
+        try:
+            return AceType(self.ace_type).name
+        except ValueError:
+            return f'UNKNOWN ({hex(self.ace_type)})'
+
+    @property
+    def flags(self):
+        return AceFlags(self.ace_flags)
+
+    @property
+    def rights(self):
+        return KeyRights(self.mask)
+
+    @property
+    def is_object(self):
+        return self.ace_type in (AceType.ACCESS_ALLOWED_OBJECT, AceType.ACCESS_DENIED_OBJECT, AceType.SYSTEM_AUDIT_OBJECT,
+                                 AceType.SYSTEM_ALARM_OBJECT, AceType.ACCESS_ALLOWED_CALLBACK_OBJECT,
+                                 AceType.ACCESS_DENIED_CALLBACK_OBJECT, AceType.SYSTEM_AUDIT_CALLBACK_OBJECT,
+                                 AceType.SYSTEM_ALARM_CALLBACK_OBJECT)
+
+    def _object_types(self):
+        # (object type, inherited object type) GUIDs of object ACEs and offset of their SID
+        offset = self._offset + 12
+        if not self.is_object:
+            return None, None, self._offset + 8
+        object_flags = STRUCTS[DWORD].unpack_from(self._buf, self._offset + 8)[0]
+        guids = []
+        for flag in (ACE_OBJECT_TYPE_PRESENT, ACE_INHERITED_OBJECT_TYPE_PRESENT):
+            if object_flags&flag:
+                # Unlike hive header GUIDs, these are stored as Windows GUID structures, with little-endian leading fields
+                guids.append(str(uuid.UUID(bytes_le=STRUCTS[GUID].unpack_from(self._buf, offset)[0])))
+                offset += 16
+            else:
+                guids.append(None)
+        return *guids, offset
+
+    @property
+    def sid(self):
+        '''
+        Trustee of the ACE, None for types without one
+        '''
+        if self._sid is None and self.ace_type != AceType.ACCESS_ALLOWED_COMPOUND and self.ace_type <= AceType.SYSTEM_SCOPED_POLICY_ID:
+            self._sid = Sid(self._hive, self._object_types()[2])
+        return self._sid
+
+    def asdict(self):
+        result = dict(type=self.type_str, flags=self.ace_flags, mask=self.mask, sid=None if self.sid is None else self.sid.sid)
+        if self.is_object:
+            result['object_type'], result['inherited_object_type'], _ = self._object_types()
+        return result
+
+    def __str__(self):
+        return f'{self.type_str} {self.sid} {hex(self.mask)} {self.flags!r}'
+
+
+class Acl(Block):
+    __slots__ = ('_aces',)
+    _fields = dict(
+        acl_revision=(0, BYTE),
+        acl_size=(2, WORD),
+        ace_count=(4, WORD),
+    )
+
+    def __init__(self, hive, offset):
+        super().__init__(hive, offset)
+        self._aces = None
+
+    @property
+    def aces(self):
+        if self._aces is None:
+            aces = []
+            offset = self._offset + 8
+            end = self._offset + self.acl_size
+            for i in range(self.ace_count):
+                ace = Ace(self._hive, offset)
+                if ace.ace_size < 8 or offset + ace.ace_size > end:
+                    raise ValueError(f'Invalid size {ace.ace_size} of ACE {i} at {hex(offset)}')
+                aces.append(ace)
+                offset += ace.ace_size
+            self._aces = aces
+        return self._aces
+
+    def __iter__(self):
+        return iter(self.aces)
+
+    def __len__(self):
+        return self.ace_count
+
+    def asdict(self):
+        return [ace.asdict() for ace in self.aces]
+
+
+class SecurityDescriptor(Block):
+    '''
+    Self-relative security descriptor, as stored in KeySecurity cells. Owner, group and ACLs are decoded on first access
+    '''
+    __slots__ = ('_owner', '_group', '_sacl', '_dacl')
+    _fields = dict(
+        revision=(0, BYTE),
+        control=(2, WORD),
+        owner_offset=(4, DWORD),
+        group_offset=(8, DWORD),
+        sacl_offset=(12, DWORD),
+        dacl_offset=(16, DWORD),
+    )
+
+    def __init__(self, hive, offset):
+        super().__init__(hive, offset)
+        if not self.control&SE_SELF_RELATIVE:
+            raise ValueError(f'Security descriptor at {hex(offset)} is not self-relative, control {hex(self.control)}')
+        self._owner = self._group = self._sacl = self._dacl = None
+
+    def _part(self, cls, offset, present=True):
+        return cls(self._hive, self._offset + offset) if offset and present else None
+
+    @property
+    def owner(self):
+        if self._owner is None:
+            self._owner = self._part(Sid, self.owner_offset)
+        return self._owner
+
+    @property
+    def group(self):
+        if self._group is None:
+            self._group = self._part(Sid, self.group_offset)
+        return self._group
+
+    @property
+    def sacl(self):
+        if self._sacl is None:
+            self._sacl = self._part(Acl, self.sacl_offset, self.control&SE_SACL_PRESENT)
+        return self._sacl
+
+    @property
+    def dacl(self):
+        '''
+        None when the descriptor has no DACL, which grants everyone full access
+        '''
+        if self._dacl is None:
+            self._dacl = self._part(Acl, self.dacl_offset, self.control&SE_DACL_PRESENT)
+        return self._dacl
+
+    def asdict(self):
+        return dict(
+            control=self.control,
+            owner=None if self.owner is None else self.owner.sid,
+            group=None if self.group is None else self.group.sid,
+            dacl=None if self.dacl is None else self.dacl.asdict(),
+            sacl=None if self.sacl is None else self.sacl.asdict(),
+        )
+
+    def __str__(self):
+        return f'{self.__class__.__module__}.{self.__class__.__qualname__} at {hex(self._offset)}, owner {self.owner}, group {self.group}'
@@ -0,0 +1,305 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import socket
+
+from .export import key_dict, value_dict
+from .registry import Registry, RegistryKey
+
+
+log = logging.getLogger()
+
+
+DEFAULT_PORT = 8457
+
+
+class LoadedHive:
+    '''
+    Registry kept open by the server. Its lock serializes requests to it, as cell cache is not thread-safe
+    '''
+    def __init__(self, name, path, registry):
+        self.name = name
+        self.path = path
+        self.registry = registry
+        self.lock = asyncio.Lock()
+
+
+class HiveServer:
+    '''
+    Asyncio server keeping hives open, with their mmaps, cell caches and path indexes warm between requests
+    Protocol is JSON Lines over TCP on localhost or a Unix socket: each request is {"id": ..., "op": ..., **params},
+    each response is {"id": ..., "result": ...} or {"id": ..., "error": ...}. Requests of one connection are
+    processed concurrently and may be answered out of order
+    Ops:
+        load(path, name=path, index=False, logs=False), unload(hive), hives()
+        get(hive, path, values=True), list(hive, path)
+        walk(hive, path=None, max_depth=None, values=False, limit=None)
+        find(hive, pattern, regex=False, limit=None), stats(hive), shutdown()
+    Lookups in warm hives are answered right on the event loop, opening hives, walks and finds run in a pool of jobs threads.
+    Requests to one hive are serialized, different hives are served concurrently
+    '''
+    def __init__(self, jobs=None):
+        self.hives = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(jobs)
+        self._server = None
+        self._stopped = None
+        self._connections = set()
+        self._ops = dict(
+            load=self.load,
+            unload=self.unload,
+            hives=self.list_hives,
+            get=self.get,
+            list=self.list,
+            walk=self.walk,
+            find=self.find,
+            stats=self.stats,
+            shutdown=self.shutdown,
+        )
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT, path=None):
+        '''
+        Starts listening on a Unix socket at path or on host:port. Port 0 picks a free one, see .address
+        '''
+        self._stopped = asyncio.Event()
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        log.info(f'Listening on {self.address}')
+        return self
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        '''
+        Serves until shutdown request, then closes all hives
+        '''
+        try:
+            await self._stopped.wait()
+        finally:
+            await self.close()
+
+    async def close(self):
+        '''
+        Stops serving and closes all hives once no op reads them anymore
+        '''
+        if self._server is not None:
+            self._server.close()
+            # Idle clients would keep connections open, their handlers and pending requests are cancelled
+            for task in list(self._connections):
+                task.cancel()
+            await self._server.wait_closed()
+        # Cancelled walks and finds keep running in worker threads until they're done with their hives
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown, True)
+        for hive in self.hives.values():
+            hive.registry.close()
+        self.hives.clear()
+
+    async def _handle(self, reader, writer):
+        write_lock = asyncio.Lock()
+        tasks = set()
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._respond(line, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            # Server is shutting down with clients still connected
+            for task in tasks:
+                task.cancel()
+        finally:
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def _respond(self, line, writer, write_lock):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.pop('id', None)
+            op = request.pop('op')
+            if op not in self._ops:
+                raise ValueError(f'Unknown op {op}, expected one of {list(self._ops)}')
+            response = dict(id=request_id, result=await self._ops[op](**request))
+        except Exception as e:
+            response = dict(id=request_id, error=f'{e.__class__.__name__}: {e}')
+        async with write_lock:
+            writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+            await writer.drain()
+
+    def _hive(self, name):
+        if name not in self.hives:
+            raise KeyError(f'Hive {name} is not loaded')
+        return self.hives[name]
+
+    async def _run(self, name, func, *args, inline=False):
+        # Serialized per hive. Cheap lookups are answered on the event loop, heavy ops are moved off it
+        hive = self._hive(name)
+        async with hive.lock:
+            if inline:
+                return func(hive.registry, *args)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, hive.registry, *args)
+
+    async def load(self, path, name=None, index=False, logs=False):
+        name = path if name is None else name
+        if name in self.hives:
+            raise ValueError(f'Hive {name} is already loaded')
+        registry = await asyncio.get_running_loop().run_in_executor(
+            self._executor, lambda: Registry.from_path(path, use_mmap=True, index=index, logs=logs))
+        if name in self.hives:
+            registry.close()
+            raise ValueError(f'Hive {name} is already loaded')
+        # Root is decoded now so that the first lookup doesn't pay for it
+        registry.root
+        self.hives[name] = LoadedHive(name, path, registry)
+        return name
+
+    async def unload(self, hive):
+        loaded = self._hive(hive)
+        async with loaded.lock:
+            del self.hives[hive]
+            loaded.registry.close()
+        return hive
+
+    async def list_hives(self):
+        return [dict(name=hive.name, path=hive.path) for hive in self.hives.values()]
+
+    async def get(self, hive, path, values=True):
+        return await self._run(hive, get, path, values, inline=True)
+
+    async def list(self, hive, path):
+        return await self._run(hive, list_subkeys, path, inline=True)
+
+    async def walk(self, hive, path=None, max_depth=None, values=False, limit=None):
+        return await self._run(hive, walk, path, max_depth, values, limit)
+
+    async def find(self, hive, pattern, regex=False, limit=None):
+        return await self._run(hive, find, pattern, regex, limit)
+
+    async def stats(self, hive):
+        return await self._run(hive, stats, inline=True)
+
+    async def shutdown(self):
+        self._stopped.set()
+        return True
+
+
+# Ops run against a Registry
+
+def get(registry, path, values):
+    return key_dict(registry.get(path), values)
+
+
+def list_subkeys(registry, path):
+    return [keynode.name for keynode in registry.get(path)._keynode.iter_subkeys()]
+
+
+def walk(registry, path, max_depth, values, limit):
+    result = []
+    for key_path, key, key_values in registry.walk(path, max_depth, include_values=False):
+        if limit is not None and len(result) >= limit:
+            break
+        result.append(key_dict(key, values))
+    return result
+
+
+def find(registry, pattern, regex, limit):
+    result = []
+    for path, item in registry.find(pattern, regex):
+        if limit is not None and len(result) >= limit:
+            break
+        if isinstance(item, RegistryKey):
+            result.append(dict(kind='key', path=path, name=item.name))
+        else:
+            result.append(dict(kind='value', path=path, **value_dict(item)))
+    return result
+
+
+def stats(registry):
+    return registry.stats()
+
+
+class Client:
+    '''
+    Blocking client of HiveServer for scripts:
+        client = Client(('127.0.0.1', 8457))  # or Client('/path/to/socket')
+        client.load('/hives/SYSTEM', name='system')
+        client.get('system', '\\\\ControlSet001\\\\Services')
+    Raises RuntimeError with server errors
+    '''
+    def __init__(self, address=('127.0.0.1', DEFAULT_PORT)):
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.connect(address)
+        self._file = self._socket.makefile('rwb')
+        self._next_id = 0
+
+    def request(self, op, **params):
+        self._next_id += 1
+        self._file.write(json.dumps(dict(id=self._next_id, op=op, **params)).encode('utf-8') + b'\n')
+        self._file.flush()
+        response = json.loads(self._file.readline())
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def load(self, path, **params):
+        return self.request('load', path=path, **params)
+
+    def unload(self, hive):
+        return self.request('unload', hive=hive)
+
+    def hives(self):
+        return self.request('hives')
+
+    def get(self, hive, path, **params):
+        return self.request('get', hive=hive, path=path, **params)
+
+    def list(self, hive, path):
+        return self.request('list', hive=hive, path=path)
+
+    def walk(self, hive, path=None, **params):
+        return self.request('walk', hive=hive, path=path, **params)
+
+    def find(self, hive, pattern, **params):
+        return self.request('find', hive=hive, pattern=pattern, **params)
+
+    def stats(self, hive):
+        return self.request('stats', hive=hive)
+
+    def shutdown(self):
+        return self.request('shutdown')
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def serve(hives=(), host='127.0.0.1', port=DEFAULT_PORT, path=None, jobs=None):
+    '''
+    Runs HiveServer until shutdown request or Ctrl+C, preloading hives
+    '''
+    async def main():
+        server = HiveServer(jobs)
+        for hive in hives:
+            await server.load(hive)
+        await server.start(host, port, path)
+        print(f'Listening on {server.address}', flush=True)
+        await server.serve_forever()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,160 @@
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+from .common import *
+from .celltable import CellTable
+from .index import PathIndex
+from .registry import Registry
+from .timeline import Timeline
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+log = logging.getLogger()
+
+
+MAGIC = b'RPSH'
+VERSION = 1
+# magic, version, number of sections
+HEADER = struct.Struct('<4sII')
+# name, offset, size
+SECTION = struct.Struct('<16sQQ')
+# Sections start at page boundaries, so arrays in them are aligned
+ALIGNMENT = 4096
+# CellTable arrays and their dtypes
+CELL_ARRAYS = (('offsets', 'int64'), ('sizes', 'int64'), ('allocated', 'bool'), ('signatures', 'uint16'), ('hbins', 'int64'))
+
+
+def _default_dir():
+    # tmpfs keeps published hives in RAM, pages are shared by all processes mapping them
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def publish(registry, path=None, cells=False):
+    '''
+    Writes everything needed to serve a Registry into a single file which other processes map read-only with SharedHive:
+    hive buffer (with transaction logs already replayed), its path index and timeline if they're loaded,
+    and CellTable arrays when cells is True (requires numpy)
+    The file is created in /dev/shm by default, so every process attached to it shares one copy of it in page cache
+    Returns its path. Publisher removes it with unlink() when workers are done, attached processes keep their mapping
+    '''
+    sections = [(b'hive', registry._buf)]
+    if registry._index is not None:
+        sections.append((b'index', registry._index._buf))
+    if registry._timeline is not None:
+        sections.append((b'timeline', registry._timeline._buf))
+    if cells:
+        table = CellTable.from_registry(registry)
+        for name, dtype in CELL_ARRAYS:
+            sections.append((f'c.{name}'.encode(), np.ascontiguousarray(getattr(table, name), dtype=dtype)))
+
+    directory = bytearray(_align(HEADER.size + len(sections) * SECTION.size))
+    HEADER.pack_into(directory, 0, MAGIC, VERSION, len(sections))
+    offset = len(directory)
+    for i, (name, data) in enumerate(sections):
+        size = memoryview(data).nbytes
+        SECTION.pack_into(directory, HEADER.size + i * SECTION.size, name, offset, size)
+        offset += _align(size)
+
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix='reg-', suffix='.shm', dir=_default_dir())
+        os.close(fd)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(directory)
+        for name, data in sections:
+            size = memoryview(data).nbytes
+            f.write(data)
+            f.write(bytes(_align(size) - size))
+    os.replace(tmp, path)
+    log.info(f'Published {registry} to {path}, {offset} bytes')
+    return path
+
+
+def unlink(path):
+    os.remove(path)
+
+
+def _align(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class SharedHive:
+    '''
+    Registry attached to a file written by publish(). Nothing is parsed or copied: the file is mapped read-only,
+    the registry, its path index and timeline work on views of the mapping, so attaching costs an open and an mmap
+    Each attached process has its own cell cache, only the buffers are shared
+    Keys, values and data views of .registry must not be used after close()
+    '''
+    def __init__(self, path, cache_size=DEFAULT_CACHE_SIZE, raw=False):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        self._views = []
+        self.sections = {}
+        try:
+            magic, version, count = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'Not a published hive: {magic}, version {version}')
+            for i in range(count):
+                name, offset, size = SECTION.unpack_from(self._mmap, HEADER.size + i * SECTION.size)
+                if offset + size > len(self._mmap):
+                    raise ValueError(f'Section {name} of {path} is truncated')
+                self.sections[name.rstrip(b'\x00').decode()] = self._view(offset, size)
+
+            self.registry = Registry(self.sections['hive'], cache_size, raw=raw)
+            if 'index' in self.sections:
+                self.registry._index = PathIndex(self.sections['index'])
+            if 'timeline' in self.sections:
+                self.registry._timeline = Timeline(self.sections['timeline'])
+        except Exception:
+            self.close()
+            raise
+
+    def _view(self, offset, size):
+        view = memoryview(self._mmap)[offset : offset + size]
+        self._views.append(view)
+        return view
+
+    @property
+    def cells(self):
+        '''
+        CellTable over shared arrays, None if it wasn't published
+        '''
+        if 'c.offsets' not in self.sections:
+            return None
+        if np is None:
+            raise ImportError('CellTable requires numpy')
+        return CellTable(*[np.frombuffer(self.sections[f'c.{name}'], dtype=dtype) for name, dtype in CELL_ARRAYS])
+
+    def close(self):
+        registry = getattr(self, 'registry', None)
+        if registry is not None:
+            registry.close()
+            self.registry = None
+        self.sections.clear()
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __str__(self):
+        return f'{self.__class__.__module__}.{self.__class__.__qualname__} {self.path}, sections {list(self.sections)}'
+
+
+def attach(path, cache_size=DEFAULT_CACHE_SIZE, raw=False):
+    return SharedHive(path, cache_size, raw)
@@ -0,0 +1,266 @@
+import functools
+import logging
+import struct
+
+from .common import *
+from .cell import BIG_DATA_SEGMENT_SIZE, FLAG_KEY_COMP_NAME, FLAG_KEY_HIVE_ENTRY, FLAG_VALUE_COMP_NAME, RegType, name_hash
+from .transaction import checksum
+
+
+log = logging.getLogger()
+
+
+# signature, sequence1, sequence2, last_written, major, minor, file type, file format, root cell offset, hive bins data size, clustering factor
+REGF = struct.Struct('<4sIIQIIIIIII')
+HBIN = struct.Struct('<4sII8xQ')
+# Cell size and KeyNode fields up to its name
+NK = struct.Struct('<i2sHQ15IHH')
+VK = struct.Struct('<i2sHIIIHH')
+DB = struct.Struct('<i2sHI')
+CELL_SIZE = STRUCTS[INT]
+LIST_HEADER = struct.Struct('<i2sH')
+NO_OFFSET = 0xffffffff
+# 2014-11-14, timestamps of generated keys grow from it
+BASE_FILETIME = 0x01D0000000000000
+HBIN_SIZE = 4096
+LIST_TYPES = ('lf', 'lh', 'li', 'ri')
+
+
+def _align(size, alignment):
+    return (size + alignment - 1) // alignment * alignment
+
+
+class Shape:
+    '''
+    Layout of a synthetic hive: a full tree of depth levels below the root, fanout subkeys per key
+    values - number of values per key, types cycle through REG_SZ, REG_DWORD, REG_BINARY, REG_QWORD and REG_MULTI_SZ
+    value_size - size of string and binary data
+    big_value_size, big_value_every - add a REG_BINARY value of big_value_size to every Nth key, stored in db cells when it's bigger than a segment
+    lists - subkeys list type, one of lf, lh, li, ri or mixed to alternate them by level. ri lists point to lh leaves of ri_leaf_size
+    '''
+    def __init__(self, depth=3, fanout=10, values=4, value_size=64, big_value_size=0, big_value_every=100, lists='lh', ri_leaf_size=256):
+        if lists not in LIST_TYPES and lists != 'mixed':
+            raise ValueError(f'Unsupported list type {lists}, expected one of {LIST_TYPES} or mixed')
+        self.depth = depth
+        self.fanout = fanout
+        self.values = values
+        self.value_size = value_size
+        self.big_value_size = big_value_size
+        self.big_value_every = big_value_every
+        self.lists = lists
+        self.ri_leaf_size = ri_leaf_size
+
+    @property
+    def keys(self):
+        return sum(self.fanout ** level for level in range(self.depth + 1))
+
+    def list_type(self, level):
+        return LIST_TYPES[level % len(LIST_TYPES)] if self.lists == 'mixed' else self.lists
+
+    def paths(self, count):
+        '''
+        count paths of existing keys spread over the deepest level
+        '''
+        if self.depth == 0 or self.fanout == 0:
+            return ['\\'] * count
+        paths = []
+        for i in range(count):
+            names = []
+            n = i * 7919
+            for level in range(self.depth):
+                names.append(f'Key{n % self.fanout}')
+                n //= self.fanout
+            paths.append('\\' + '\\'.join(names))
+        return paths
+
+    def asdict(self):
+        return dict(self.__dict__)
+
+    def __str__(self):
+        return f'{self.__class__.__module__}.{self.__class__.__qualname__}, {self.keys} keys, ' + ', '.join(f'{k}={v}' for k, v in self.__dict__.items())
+
+
+# Presets used by benchmarks
+SHAPES = dict(
+    small=Shape(depth=3, fanout=10),
+    medium=Shape(depth=4, fanout=20, big_value_size=65536, big_value_every=1000, lists='mixed'),
+    large=Shape(depth=5, fanout=20, values=6, value_size=256, big_value_size=1 << 20, big_value_every=10000, lists='mixed'),
+)
+
+
+class HiveWriter:
+    '''
+    Appends cells to hbins of a file opened for writing, keeping only the current hbin in memory
+    Offsets are relative to the first hbin, like everywhere in the format
+    '''
+    def __init__(self, f):
+        self._file = f
+        self._start = f.tell()
+        self._hbin = bytearray()
+        # Offset of the current hbin and position of the next cell in it
+        self._base = 0
+        self._position = 0
+        self.size = 0
+
+    def _flush(self):
+        if not self._hbin:
+            return
+        if self._position < len(self._hbin):
+            CELL_SIZE.pack_into(self._hbin, self._position, len(self._hbin) - self._position)
+        self._file.write(self._hbin)
+        self._base += len(self._hbin)
+        self._hbin = bytearray()
+
+    def cell(self, payload):
+        '''
+        Writes an allocated cell, payload starting with its signature. Returns its offset
+        '''
+        size = _align(len(payload) + 4, 8)
+        if self._position + size > len(self._hbin):
+            self._flush()
+            hbin_size = max(HBIN_SIZE, _align(size + 32, HBIN_SIZE))
+            self._hbin = bytearray(hbin_size)
+            HBIN.pack_into(self._hbin, 0, b'hbin', self._base, hbin_size, BASE_FILETIME)
+            self._position = 32
+            self.size = self._base + hbin_size
+        offset = self._base + self._position
+        CELL_SIZE.pack_into(self._hbin, self._position, -size)
+        self._hbin[self._position + 4 : self._position + 4 + len(payload)] = payload
+        self._position += size
+        return offset
+
+    def patch(self, offset, data):
+        '''
+        Overwrites bytes of an already written cell
+        '''
+        if offset >= self._base:
+            self._hbin[offset - self._base : offset - self._base + len(data)] = data
+        else:
+            position = self._file.tell()
+            self._file.seek(self._start + offset)
+            self._file.write(data)
+            self._file.seek(position)
+
+    def close(self):
+        self._flush()
+        return self.size
+
+
+@functools.lru_cache()
+def _pattern(size):
+    # Binary data of every key is a slice of it, starting at a key dependent byte
+    return bytes(i % 256 for i in range(size + 256))
+
+
+@functools.lru_cache()
+def _big_data(size):
+    return bytes(i % 251 for i in range(size))
+
+
+def _value_data(index, shape, key_index):
+    kind = index % 5
+    if kind == 0:
+        text = f'value {key_index} '.ljust(max(1, shape.value_size // 2 - 1), 'x')
+        return f'String{index}', RegType.REG_SZ, text.encode('utf-16-le') + b'\x00\x00'
+    elif kind == 1:
+        return f'Dword{index}', RegType.REG_DWORD, struct.pack('<I', key_index)
+    elif kind == 2:
+        start = key_index % 256
+        return f'Binary{index}', RegType.REG_BINARY, _pattern(shape.value_size)[start : start + shape.value_size]
+    elif kind == 3:
+        return f'Qword{index}', RegType.REG_QWORD, struct.pack('<Q', key_index << 20)
+    return f'Multi{index}', RegType.REG_MULTI_SZ, f'a{key_index}\x00b\x00\x00'.encode('utf-16-le')
+
+
+def _write_value(writer, name, data_type, data):
+    size = len(data)
+    if size <= 4:
+        data_size = size | 0x80000000
+        data_offset = int.from_bytes(data.ljust(4, b'\x00'), 'little')
+    elif size <= BIG_DATA_SEGMENT_SIZE:
+        data_size = size
+        data_offset = writer.cell(data)
+    else:
+        segments = [writer.cell(data[i : i + BIG_DATA_SEGMENT_SIZE]) for i in range(0, size, BIG_DATA_SEGMENT_SIZE)]
+        segments_list = writer.cell(struct.pack(f'<{len(segments)}I', *segments))
+        data_size = size
+        data_offset = writer.cell(DB.pack(0, b'db', len(segments), segments_list)[4:])
+    name = name.encode('ascii')
+    return writer.cell(VK.pack(0, b'vk', len(name), data_size, data_offset, data_type, FLAG_VALUE_COMP_NAME, 0)[4:] + name)
+
+
+def _write_list(writer, kind, entries, shape):
+    # entries are (offset, name) of subkeys, lists are sorted by uppercased name
+    entries = sorted(entries, key=lambda i: i[1].upper())
+    if kind == 'ri':
+        leaves = [_write_list(writer, 'lh', entries[i : i + shape.ri_leaf_size], shape) for i in range(0, len(entries), shape.ri_leaf_size)]
+        return writer.cell(LIST_HEADER.pack(0, b'ri', len(leaves))[4:] + struct.pack(f'<{len(leaves)}I', *leaves))
+    if kind == 'li':
+        body = struct.pack(f'<{len(entries)}I', *[offset for offset, name in entries])
+    elif kind == 'lf':
+        body = b''.join([struct.pack('<I4s', offset, name[:4].encode('ascii')) for offset, name in entries])
+    else:
+        body = b''.join([struct.pack('<II', offset, name_hash(name)) for offset, name in entries])
+    return writer.cell(LIST_HEADER.pack(0, kind.encode(), len(entries))[4:] + body)
+
+
+def _write_key(writer, name, parent, shape, key_index):
+    values = [_value_data(i, shape, key_index) for i in range(shape.values)]
+    if shape.big_value_size and key_index % shape.big_value_every == 0:
+        values.append(('Big', RegType.REG_BINARY, _big_data(shape.big_value_size)))
+
+    # KeyNode goes first so that the root is the first cell of the hive, values list is patched in after it
+    flags = FLAG_KEY_COMP_NAME | (FLAG_KEY_HIVE_ENTRY if parent == NO_OFFSET else 0)
+    max_value_name = max([len(value[0]) * 2 for value in values], default=0)
+    max_value_data = max([len(value[2]) for value in values], default=0)
+    encoded = name.encode('ascii')
+    header = NK.pack(0, b'nk', flags, BASE_FILETIME + key_index * 10_000_000, 0, parent, 0, 0, NO_OFFSET, NO_OFFSET,
+                     0, NO_OFFSET, NO_OFFSET, NO_OFFSET, 0, 0, max_value_name, max_value_data, 0, len(encoded), 0)
+    offset = writer.cell(header[4:] + encoded)
+    if values:
+        value_offsets = [_write_value(writer, *value) for value in values]
+        values_list = writer.cell(struct.pack(f'<{len(value_offsets)}I', *value_offsets))
+        writer.patch(offset + 40, struct.pack('<II', len(value_offsets), values_list))
+    return offset
+
+
+def generate(path, shape=None, file_name='synthetic'):
+    '''
+    Writes a valid hive of the given Shape to path, streaming it hbin by hbin so size is not limited by memory
+    Returns number of keys written
+    '''
+    shape = Shape() if shape is None else shape
+    with open(path, 'wb') as f:
+        f.write(bytes(4096))
+        writer = HiveWriter(f)
+        key_index = 0
+        root = _write_key(writer, 'ROOT', NO_OFFSET, shape, key_index)
+        # offset, name, remaining subkey numbers, written subkeys, level
+        stack = [(root, 'ROOT', iter(range(shape.fanout if shape.depth > 0 else 0)), [], 0)]
+        while stack:
+            offset, name, children, entries, level = stack[-1]
+            i = next(children, None)
+            if i is None:
+                stack.pop()
+                if entries:
+                    subkeys_list = _write_list(writer, shape.list_type(level), entries, shape)
+                    writer.patch(offset + 24, struct.pack('<III', len(entries), 0, subkeys_list))
+                    writer.patch(offset + 56, struct.pack('<I', max(len(entry[1]) for entry in entries) * 2))
+                if stack:
+                    stack[-1][3].append((offset, name))
+                continue
+            key_index += 1
+            child_name = f'Key{i}'
+            child = _write_key(writer, child_name, offset, shape, key_index)
+            stack.append((child, child_name, iter(range(shape.fanout if level + 1 < shape.depth else 0)), [], level + 1))
+        hive_bins_data_size = writer.close()
+
+        header = bytearray(4096)
+        REGF.pack_into(header, 0, b'regf', 1, 1, BASE_FILETIME, 1, 5, 0, 1, root, hive_bins_data_size, 1)
+        encoded = file_name.encode('utf-16-le')[:64]
+        header[48 : 48 + len(encoded)] = encoded
+        STRUCTS[DWORD].pack_into(header, 508, checksum(header))
+        f.seek(0)
+        f.write(header)
+    log.info(f'Generated {key_index + 1} keys, {hive_bins_data_size} bytes of hbins in {path}')
+    return key_index + 1
@@ -0,0 +1,156 @@
+import array
+import bisect
+import datetime
+import logging
+import mmap
+import os
+import struct
+
+from .common import *
+from .index import fingerprint
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+log = logging.getLogger()
+
+
+MAGIC = b'RPTL'
+VERSION = 1
+# magic, version, sequence1, sequence2, last_written, checksum, number of entries
+HEADER = struct.Struct('<4sIIIQII')
+CELL_SIZE = STRUCTS[INT]
+LAST_WRITTEN = STRUCTS[QWORD]
+
+
+def to_filetime(value):
+    '''
+    FILETIME int of a datetime (naive ones are UTC), FILETIME ints are returned as is
+    '''
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        delta = value - FILETIME_EPOCH
+        return (delta.days * 86400 + delta.seconds) * 10_000_000 + delta.microseconds * 10
+    return value
+
+
+class Timeline:
+    '''
+    KeyNode last_written timestamps as a sorted array of FILETIME ints with a parallel array of KeyNode offsets
+    Built by one linear pass over hbins, saved as a sidecar file which is memory-mapped and binary searched:
+    header, count little-endian uint64 timestamps, count uint32 offsets. Entries with equal timestamps are in file order
+    '''
+    def __init__(self, buf):
+        self._buf = buf
+        magic, version, *header, self._count = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'Not a timeline: {magic}, version {version}')
+        self.fingerprint = tuple(header)
+        view = memoryview(buf)
+        times_end = HEADER.size + self._count * 8
+        self.filetimes = view[HEADER.size : times_end].cast('Q')
+        self.offsets = view[times_end : times_end + self._count * 4].cast('I')
+
+    @classmethod
+    def build(cls, registry):
+        '''
+        Collects (last_written, offset) of every allocated KeyNode without decoding them and sorts them,
+        vectorized with numpy when it's available
+        '''
+        buf = registry._buf
+        cell_size = CELL_SIZE.unpack_from
+        last_written = LAST_WRITTEN.unpack_from
+        filetimes = array.array('Q')
+        offsets = array.array('I')
+        for hbin in registry._iter_hbins():
+            offset = hbin._offset + 32
+            end = hbin._offset + hbin.size
+            while offset < end:
+                size, = cell_size(buf, offset)
+                if size == 0:
+                    raise ValueError(f'Invalid cell size at {hex(offset)}')
+                if size < 0 and buf[offset + 4 : offset + 6] == b'nk':
+                    filetimes.append(last_written(buf, offset + 8)[0])
+                    offsets.append(offset)
+                offset += abs(size)
+
+        if np is not None:
+            # Offsets are ascending, so stable sort keeps them ordered within equal timestamps
+            order = np.argsort(np.frombuffer(filetimes, dtype=np.uint64), kind='stable')
+            filetimes = np.frombuffer(filetimes, dtype=np.uint64)[order].astype('<u8').tobytes()
+            offsets = np.frombuffer(offsets, dtype=np.uint32)[order].astype('<u4').tobytes()
+        else:
+            order = sorted(range(len(filetimes)), key=filetimes.__getitem__)
+            filetimes = array.array('Q', [filetimes[i] for i in order]).tobytes()
+            offsets = array.array('I', [offsets[i] for i in order]).tobytes()
+
+        header = HEADER.pack(MAGIC, VERSION, *fingerprint(registry.regf), len(filetimes) // 8)
+        return cls(header + filetimes + offsets)
+
+    @classmethod
+    def open(cls, path, registry):
+        '''
+        Memory-maps timeline saved at path
+        Builds and saves a new one if it's missing, broken or doesn't match registry header
+        '''
+        try:
+            with open(path, 'rb') as f:
+                timeline = cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError, struct.error):
+            timeline = None
+
+        if timeline is not None:
+            if timeline.fingerprint == fingerprint(registry.regf):
+                return timeline
+            log.info(f'Timeline {path} is stale, rebuilding')
+            timeline.close()
+
+        timeline = cls.build(registry)
+        try:
+            timeline.save(path)
+        except OSError as e:
+            log.warning(f'Failed to save timeline {path}: {e}')
+        return timeline
+
+    def save(self, path):
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self._buf)
+        os.replace(tmp, path)
+
+    def close(self):
+        # Views have to go first, mmaps and shared buffers can't be closed while they're exported
+        self.filetimes.release()
+        self.offsets.release()
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+    def range(self, start=None, end=None):
+        '''
+        Yields (last_written, KeyNode offset) with start <= last_written < end in ascending order
+        start, end - FILETIME ints or datetimes, open-ended when None
+        '''
+        low = 0 if start is None else bisect.bisect_left(self.filetimes, to_filetime(start))
+        high = self._count if end is None else bisect.bisect_left(self.filetimes, to_filetime(end))
+        for i in range(low, high):
+            yield self.filetimes[i], self.offsets[i]
+
+    def latest(self, count):
+        '''
+        Yields count most recently written (last_written, KeyNode offset), newest first
+        '''
+        for i in range(self._count - 1, max(self._count - count, 0) - 1, -1):
+            yield self.filetimes[i], self.offsets[i]
+
+    def __iter__(self):
+        return self.range()
+
+    def __len__(self):
+        return self._count
+
+    def __str__(self):
+        return f'{self.__class__.__module__}.{self.__class__.__qualname__}, {self._count} keys'
@@ -0,0 +1,196 @@
+import logging
+import os
+import struct
+
+from .common import *
+
+
+log = logging.getLogger()
+
+
+# Seed of Marvin32 hashes protecting log entries
+MARVIN_SEED = 0x82EF4D887A4E55C5
+BASE_BLOCK_SIZE = 512
+# Fields of a base block needed for recovery: signature, sequence1, sequence2 and hive_bins_data_size
+BASE_BLOCK = struct.Struct('<4sII28xI')
+# The same fields written back separately, packing BASE_BLOCK would zero the fields it skips
+SEQUENCES = struct.Struct('<II')
+HIVE_BINS_DATA_SIZE = STRUCTS[DWORD]
+CHECKSUM = STRUCTS[DWORD]
+# signature, size, flags, sequence number, hive_bins_data_size, number of dirty pages, hash-1, hash-2
+LOG_ENTRY = struct.Struct('<4sIIIIIQQ')
+# offset relative to the first hbin, size
+DIRTY_PAGE = struct.Struct('<II')
+
+
+def _rotl(x, n):
+    return ((x << n) | (x >> (32 - n))) & 0xffffffff
+
+
+def _marvin_mix(lo, hi):
+    hi ^= lo
+    lo = (_rotl(lo, 20) + hi) & 0xffffffff
+    hi = _rotl(hi, 9) ^ lo
+    lo = (_rotl(lo, 27) + hi) & 0xffffffff
+    hi = _rotl(hi, 19)
+    return lo, hi
+
+
+def marvin32(data, seed=MARVIN_SEED):
+    lo = seed & 0xffffffff
+    hi = seed >> 32
+    words = len(data) // 4
+    for word in struct.unpack_from(f'<{words}I', data):
+        lo = (lo + word) & 0xffffffff
+        lo, hi = _marvin_mix(lo, hi)
+    final = 0x80
+    for byte in reversed(bytes(data[words*4:])):
+        final = (final << 8) | byte
+    lo = (lo + final) & 0xffffffff
+    lo, hi = _marvin_mix(*_marvin_mix(lo, hi))
+    return (hi << 32) | lo
+
+
+def checksum(buf):
+    '''
+    XOR of the first 127 dwords of a base block, 0 and -1 are replaced with 1 and -2
+    '''
+    value = 0
+    for word in struct.unpack_from('<127I', buf):
+        value ^= word
+    if value == 0:
+        return 1
+    elif value == 0xffffffff:
+        return 0xfffffffe
+    return value
+
+
+def valid_base_block(buf):
+    return (len(buf) >= BASE_BLOCK_SIZE
+            and BASE_BLOCK.unpack_from(buf)[0] == b'regf'
+            and checksum(buf) == CHECKSUM.unpack_from(buf, 508)[0])
+
+
+def is_dirty(buf):
+    '''
+    Primary file needs recovery when its base block is broken or its sequence numbers differ
+    '''
+    if not valid_base_block(buf):
+        return True
+    signature, sequence1, sequence2, hive_bins_data_size = BASE_BLOCK.unpack_from(buf)
+    return sequence1 != sequence2
+
+
+class LogEntry:
+    '''
+    Log entry of a new format (Windows 8.1+) transaction log: a set of dirty pages written to the hive at once
+    '''
+    __slots__ = ('sequence', 'hive_bins_data_size', 'pages')
+
+    def __init__(self, sequence, hive_bins_data_size, pages):
+        self.sequence = sequence
+        self.hive_bins_data_size = hive_bins_data_size
+        # (offset relative to the first hbin, memoryview of page data)
+        self.pages = pages
+
+
+def read_entries(buf):
+    '''
+    Yields valid entries of a transaction log, stopping at the first broken one
+    '''
+    buf = memoryview(buf)
+    offset = BASE_BLOCK_SIZE
+    while offset + LOG_ENTRY.size <= len(buf):
+        signature, size, flags, sequence, hive_bins_data_size, count, hash1, hash2 = LOG_ENTRY.unpack_from(buf, offset)
+        if (signature != b'HvLE' or size < LOG_ENTRY.size or size % 512 or offset + size > len(buf)
+                or LOG_ENTRY.size + count*DIRTY_PAGE.size > size):
+            break
+        entry = buf[offset : offset + size]
+        if marvin32(entry[:32]) != hash2 or marvin32(entry[LOG_ENTRY.size:]) != hash1:
+            log.warning(f'Log entry {sequence} at {hex(offset)} has invalid hash, stopping')
+            break
+
+        pages = []
+        data = LOG_ENTRY.size + count*DIRTY_PAGE.size
+        for i in range(count):
+            page_offset, page_size = DIRTY_PAGE.unpack_from(entry, LOG_ENTRY.size + i*DIRTY_PAGE.size)
+            pages.append((page_offset, entry[data : data + page_size]))
+            data += page_size
+        if data > size:
+            break
+        yield LogEntry(sequence, hive_bins_data_size, pages)
+        offset += size
+
+
+def _read(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    return source.read()
+
+
+def find_logs(path):
+    '''
+    Transaction logs next to a hive: path.LOG1 and path.LOG2, any case
+    '''
+    directory, name = os.path.split(os.path.abspath(path))
+    candidates = {i.upper(): i for i in os.listdir(directory)}
+    return [os.path.join(directory, candidates[f'{name}.LOG{i}'.upper()]) for i in (1, 2) if f'{name}.LOG{i}'.upper() in candidates]
+
+
+def replay(buf, logs):
+    '''
+    Applies dirty pages of transaction logs (paths, file objects or buffers) on top of a dirty hive
+    buf is patched in place when writable: a bytearray or a copy-on-write mmap (mmap.ACCESS_COPY),
+    so only pages written by the logs get private copies and every read keeps going directly through the buffer.
+    Read-only buffers are copied first, as is a buffer the logs grow beyond its size
+    Returns (buffer, number of applied log entries)
+    '''
+    if not is_dirty(buf):
+        return buf, 0
+
+    logs = [_read(i) for i in logs]
+    base = buf if valid_base_block(buf) else None
+    if base is None:
+        # Take the latest valid base block from logs
+        candidates = [i for i in logs if valid_base_block(i)]
+        if not candidates:
+            raise ValueError('Neither hive nor its logs have a valid base block')
+        base = max(candidates, key=lambda i: BASE_BLOCK.unpack_from(i)[1])
+
+    entries = {}
+    for data in logs:
+        for entry in read_entries(data):
+            entries.setdefault(entry.sequence, entry)
+
+    # Entries are replayed consecutively starting from secondary sequence number of the base block
+    signature, sequence1, sequence, hive_bins_data_size = BASE_BLOCK.unpack_from(base)
+    applied = []
+    while sequence in entries:
+        applied.append(entries[sequence])
+        hive_bins_data_size = entries[sequence].hive_bins_data_size
+        sequence += 1
+    if not applied:
+        log.warning('Hive is dirty, but logs have no entries to replay')
+        return buf, 0
+
+    size = max([len(buf), 4096 + hive_bins_data_size] + [4096 + offset + len(page) for entry in applied for offset, page in entry.pages])
+    if memoryview(buf).readonly or size > len(buf):
+        patched = bytearray(size)
+        patched[:len(buf)] = buf
+        buf = patched
+    if base is not buf:
+        buf[:BASE_BLOCK_SIZE] = bytes(base[:BASE_BLOCK_SIZE])
+
+    for entry in applied:
+        for offset, page in entry.pages:
+            buf[4096 + offset : 4096 + offset + len(page)] = page
+
+    # Header of a recovered hive is consistent again
+    SEQUENCES.pack_into(buf, 4, sequence, sequence)
+    HIVE_BINS_DATA_SIZE.pack_into(buf, 40, hive_bins_data_size)
+    CHECKSUM.pack_into(buf, 508, checksum(buf))
+    log.info(f'Replayed {len(applied)} log entries, sequence {sequence - len(applied)}..{sequence - 1}')
+    return buf, len(applied)
@@ -0,0 +1,174 @@
+import collections
+import logging
+import struct
+
+from .common import *
+from .transaction import checksum
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+log = logging.getLogger()
+
+
+# signature, sequence1, sequence2, last_written, major, minor, file type, file format, root cell offset, hive bins data size
+REGF = struct.Struct('<4sIIQIIIIII')
+HBIN = struct.Struct('<4sII')
+CHECKSUM = STRUCTS[DWORD]
+HBIN_ALIGNMENT = 4096
+# Reports of badly broken hives stop collecting issues here
+MAX_ISSUES = 100
+
+# offset - absolute offset in the buffer the issue was found at, check - short name of the failed check
+Issue = collections.namedtuple('Issue', ['offset', 'check', 'message'])
+
+
+class ValidationReport:
+    '''
+    Result of validate(): errors make the hive unsafe to parse, warnings don't
+    hbins and cells - numbers of verified ones, cells is None when cell chains weren't checked
+    '''
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.hbins = 0
+        self.cells = None
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def error(self, offset, check, message):
+        if len(self.errors) < MAX_ISSUES:
+            self.errors.append(Issue(offset, check, message))
+
+    def warning(self, offset, check, message):
+        if len(self.warnings) < MAX_ISSUES:
+            self.warnings.append(Issue(offset, check, message))
+
+    def raise_for_errors(self):
+        if self.errors:
+            offset, check, message = self.errors[0]
+            raise ValueError(f'Invalid hive, {len(self.errors)} errors, first one at {hex(offset)}: {check}: {message}')
+        return self
+
+    def asdict(self):
+        return dict(
+            ok=self.ok,
+            errors=[issue._asdict() for issue in self.errors],
+            warnings=[issue._asdict() for issue in self.warnings],
+            hbins=self.hbins,
+            cells=self.cells,
+        )
+
+    def __bool__(self):
+        return self.ok
+
+    def __str__(self):
+        return f'{self.__class__.__module__}.{self.__class__.__qualname__}, {len(self.errors)} errors, {len(self.warnings)} warnings, {self.hbins} hbins'
+
+
+def _checksum(buf):
+    if np is not None:
+        value = int(np.bitwise_xor.reduce(np.frombuffer(buf, dtype='<u4', count=127)))
+        return 1 if value == 0 else 0xfffffffe if value == 0xffffffff else value
+    return checksum(buf)
+
+
+def _header(buf, report):
+    # Returns end of hive bins data if the rest of the hive can be checked against it
+    if len(buf) < 4096:
+        report.error(0, 'size', f'File of {len(buf)} bytes is shorter than the base block')
+        return None
+    (signature, sequence1, sequence2, _, major, minor, file_type, file_format,
+     root_cell_offset, hive_bins_data_size) = REGF.unpack_from(buf, 0)
+    if signature != b'regf':
+        report.error(0, 'signature', f'Expected regf, got {signature}')
+        return None
+    stored = CHECKSUM.unpack_from(buf, 508)[0]
+    computed = _checksum(buf)
+    if stored != computed:
+        report.error(508, 'checksum', f'Stored {hex(stored)}, computed {hex(computed)}')
+    if sequence1 != sequence2:
+        report.warning(4, 'sequence', f'Sequence numbers {sequence1} and {sequence2} differ, hive is dirty and its logs should be replayed')
+    if major != 1:
+        report.warning(20, 'version', f'Unsupported version {major}.{minor}')
+    if file_type != 0:
+        report.warning(28, 'file_type', f'File type {file_type} is not a primary hive')
+    if file_format != 1:
+        report.warning(32, 'file_format', f'File format {file_format} is not direct memory load')
+
+    if hive_bins_data_size == 0 or hive_bins_data_size % HBIN_ALIGNMENT:
+        report.error(40, 'hive_bins_data_size', f'{hive_bins_data_size} is not a positive multiple of {HBIN_ALIGNMENT}')
+        return None
+    if 4096 + hive_bins_data_size > len(buf):
+        report.error(40, 'hive_bins_data_size', f'{hive_bins_data_size} bytes of hive bins data but file has {len(buf) - 4096}, it is truncated')
+        return None
+    if root_cell_offset % 8 or root_cell_offset >= hive_bins_data_size:
+        report.error(36, 'root_cell_offset', f'{hex(root_cell_offset)} is not a cell offset within hive bins data')
+    return 4096 + hive_bins_data_size
+
+
+def _hbins(buf, end, report):
+    # Offset and size chain of hbins, returns (offset, size) of valid ones
+    hbins = []
+    offset = 4096
+    while offset < end:
+        signature, relative, size = HBIN.unpack_from(buf, offset)
+        if signature != b'hbin':
+            report.error(offset, 'hbin_signature', f'Expected hbin, got {signature}')
+            break
+        if relative != offset - 4096:
+            report.error(offset + 4, 'hbin_offset', f'hbin says it is at {hex(relative)}, found at {hex(offset - 4096)}')
+        if size == 0 or size % HBIN_ALIGNMENT or offset + size > end:
+            report.error(offset + 8, 'hbin_size', f'{size} is not a positive multiple of {HBIN_ALIGNMENT} within hive bins data')
+            break
+        hbins.append((offset, size))
+        offset += size
+    report.hbins = len(hbins)
+    return hbins
+
+
+def _cells(buf, hbins, report):
+    # Cell chains of hbins have to cover them exactly. Sizes are read through an int32 view, without a struct call per cell
+    sizes = memoryview(buf)[: (len(buf) // 4) * 4].cast('i')
+    cells = 0
+    try:
+        for offset, size in hbins:
+            position = offset + 32
+            end = offset + size
+            while position < end:
+                cell_size = abs(sizes[position >> 2])
+                if cell_size == 0 or cell_size % 8:
+                    report.error(position, 'cell_size', f'Cell size {cell_size} is not a positive multiple of 8')
+                    break
+                if position + cell_size > end:
+                    report.error(position, 'cell_size', f'Cell of {cell_size} bytes crosses end of hbin at {hex(end)}')
+                    break
+                position += cell_size
+                cells += 1
+    finally:
+        sizes.release()
+    report.cells = cells
+
+
+def validate(buf, cells=True):
+    '''
+    Checks a hive buffer before anything is parsed, without raising on broken input
+    Base block: signature, checksum, sequence numbers, versions, hive_bins_data_size against buffer length, root cell offset
+    hbins: signatures, offsets and sizes chained from the first one to the end of hive bins data
+    cells - also check that cell sizes are multiples of 8 which chain exactly to the end of every hbin.
+    It's a linear pass over cell headers, the rest takes microseconds per hbin
+    Returns ValidationReport
+    '''
+    report = ValidationReport()
+    end = _header(buf, report)
+    if end is None:
+        return report
+    hbins = _hbins(buf, end, report)
+    if cells:
+        _cells(buf, hbins, report)
+    return report
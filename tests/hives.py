@@ -0,0 +1,66 @@
+'''
+Small hand-shaped hives for tests, written with reg.synth building blocks
+A tree is (values, {name: subtree}, flags), values are (name, RegType, data bytes)
+'''
+import struct
+
+from reg.cell import FLAG_KEY_COMP_NAME, FLAG_KEY_HIVE_ENTRY, FLAG_KEY_SYM_LINK, RegType
+from reg.common import DWORD, STRUCTS
+from reg.synth import BASE_FILETIME, NK, NO_OFFSET, REGF, HiveWriter, Shape, _write_list, _write_value
+from reg.transaction import checksum
+
+
+def key(values=(), flags=0, **subkeys):
+    return list(values), subkeys, flags
+
+
+def link(target):
+    return key([('SymbolicLinkValue', RegType.REG_LINK, target.encode('utf-16-le'))], FLAG_KEY_SYM_LINK)
+
+
+def sz(name, text):
+    return name, RegType.REG_SZ, (text + '\x00').encode('utf-16-le')
+
+
+def dword(name, number):
+    return name, RegType.REG_DWORD, struct.pack('<I', number)
+
+
+def _write_key(writer, name, parent, tree, security, counter):
+    values, subkeys, flags = tree
+    flags |= FLAG_KEY_COMP_NAME | (FLAG_KEY_HIVE_ENTRY if parent == NO_OFFSET else 0)
+    counter[0] += 1
+    encoded = name.encode('ascii')
+    offset = writer.cell(NK.pack(0, b'nk', flags, BASE_FILETIME + counter[0] * 10_000_000, 0, parent, 0, 0, NO_OFFSET, NO_OFFSET,
+                                 0, NO_OFFSET, security, NO_OFFSET, 0, 0, 0, 0, 0, len(encoded), 0)[4:] + encoded)
+    if values:
+        value_offsets = [_write_value(writer, *value) for value in values]
+        values_list = writer.cell(struct.pack(f'<{len(value_offsets)}I', *value_offsets))
+        writer.patch(offset + 40, struct.pack('<II', len(value_offsets), values_list))
+    entries = [(_write_key(writer, subkey, offset, subtree, security, counter), subkey) for subkey, subtree in subkeys.items()]
+    if entries:
+        writer.patch(offset + 24, struct.pack('<III', len(entries), 0, _write_list(writer, 'lh', entries, Shape())))
+    return offset
+
+
+def make(path, tree, descriptor=None):
+    '''
+    Writes tree to path. descriptor - self-relative security descriptor bytes put into an sk cell referenced by every key
+    '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(bytes(4096))
+        writer = HiveWriter(f)
+        security = NO_OFFSET
+        if descriptor is not None:
+            # Single sk cell linked to itself
+            security = writer.cell(struct.pack('<2sHIIII', b'sk', 0, 0, 0, 1, len(descriptor)) + descriptor)
+            writer.patch(security + 8, struct.pack('<II', security, security))
+        root = _write_key(writer, 'ROOT', NO_OFFSET, tree, security, [0])
+        hive_bins_data_size = writer.close()
+        header = bytearray(4096)
+        REGF.pack_into(header, 0, b'regf', 1, 1, BASE_FILETIME, 1, 5, 0, 1, root, hive_bins_data_size, 1)
+        STRUCTS[DWORD].pack_into(header, 508, checksum(header))
+        f.seek(0)
+        f.write(header)
+    return path
@@ -0,0 +1,77 @@
+import struct
+
+import pytest
+
+from reg import synth
+from reg.carve import Carver, RecoveredKey, RecoveredList, RecoveredValue, carve
+from reg.registry import Registry
+
+
+def _free(buf, offset):
+    # Deleting a cell flips its size positive and leaves the content
+    size, = struct.unpack_from('<i', buf, offset)
+    struct.pack_into('<i', buf, offset, abs(size))
+
+
+@pytest.fixture
+def deleted(tmp_path):
+    '''
+    Hive with \\Key2\\Key1 deleted along with its values and values list, and its KeyNode offset and value offsets
+    '''
+    path = tmp_path / 'carve.hive'
+    synth.generate(path, synth.Shape(depth=2, fanout=3, values=3))
+    buf = bytearray(path.read_bytes())
+    with Registry(bytes(buf)) as registry:
+        keynode = registry.get('\\Key2\\Key1')._keynode
+        values = [value._offset for value in keynode.values]
+        offset = keynode._offset
+        _free(buf, 4096 + keynode.key_values_list_offset)
+    _free(buf, offset)
+    for value in values:
+        _free(buf, value)
+    return bytes(buf), offset, values
+
+
+def test_nothing_deleted(tmp_path):
+    path = tmp_path / 'clean.hive'
+    synth.generate(path, synth.Shape(depth=2, fanout=3, values=3))
+    with Registry.from_path(path) as registry:
+        assert list(carve(registry)) == []
+
+
+def test_deleted_key(deleted):
+    buf, offset, values = deleted
+    with Registry(buf) as registry:
+        records = list(carve(registry))
+        keys = [record for record in records if isinstance(record, RecoveredKey)]
+        assert [(key.offset, key.keynode.name, key.parent_path, key.value_offsets) for key in keys] == [
+            (offset, 'Key1', '\\Key2', tuple(values))]
+        recovered = {record.offset: record for record in records if isinstance(record, RecoveredValue)}
+        assert sorted(recovered) == sorted(values)
+        assert [recovered[value].keyvalue.name for value in values] == ['String0', 'Dword1', 'Binary2']
+        assert {recovered[value].key_offset for value in values} == {offset}
+        # Records come in file order
+        assert [record.offset for record in records] == sorted(record.offset for record in records)
+
+
+def test_signatures_and_slack(deleted):
+    buf, offset, values = deleted
+    with Registry(buf + bytes(4096) + buf[offset : offset + 256]) as registry:
+        assert [record.offset for record in carve(registry, signatures=(b'nk',), slack=False)] == [offset]
+        found = [record.offset for record in carve(registry, signatures=(b'nk',))]
+        assert found == [offset, len(buf) + 4096]
+        with pytest.raises(ValueError, match='Unsupported signatures'):
+            Carver(registry, signatures=(b'sk',))
+
+
+def test_deleted_list(tmp_path):
+    path = tmp_path / 'list.hive'
+    synth.generate(path, synth.Shape(depth=1, fanout=3, values=0, lists='lf'))
+    buf = bytearray(path.read_bytes())
+    with Registry(bytes(buf)) as registry:
+        list_offset = 4096 + registry.root._keynode.subkeys_list_offset
+    _free(buf, list_offset)
+    with Registry(bytes(buf)) as registry:
+        lists = [record for record in carve(registry) if isinstance(record, RecoveredList)]
+        assert [(record.offset, [keynode.name for keynode in record.leaf.keynodes()]) for record in lists] == [
+            (list_offset, ['Key0', 'Key1', 'Key2'])]
@@ -0,0 +1,41 @@
+import pytest
+
+from reg import diff, synth
+from reg.registry import Registry
+
+
+@pytest.fixture
+def hive(tmp_path):
+    path = tmp_path / 'old.hive'
+    synth.generate(path, synth.Shape(depth=3, fanout=3, values=2, big_value_size=40000, big_value_every=5))
+    return path.read_bytes()
+
+
+def _changes(old, new, **options):
+    with Registry(old) as registry_a, Registry(new) as registry_b:
+        return [(change.change, change.kind, change.path, change.name) for change in diff.diff(registry_a, registry_b, **options)]
+
+
+def test_same_hive(hive):
+    assert _changes(hive, hive) == []
+
+
+def test_big_value_change(hive):
+    new = bytearray(hive)
+    with Registry(hive) as registry:
+        big = registry.get('\\Key1\\Key0').values['Big']._keyvalue
+        segments, segment_size = big._segments()
+    # Last byte of the second segment
+    new[segments[1] + segment_size - 1] ^= 0xff
+    assert len(segments) == 3
+    assert _changes(hive, bytes(new)) == [(diff.MODIFIED, 'value', '\\Key1\\Key0', 'Big')]
+
+
+def test_deep_change_without_ancestors_written(hive):
+    # Windows only updates last_written of the written key
+    new = bytearray(hive)
+    with Registry(hive) as registry:
+        dword = registry.get('\\Key2\\Key1\\Key0').values['Dword1']._keyvalue
+    new[dword._offset + 12] ^= 0xff
+    assert _changes(hive, bytes(new)) == [(diff.MODIFIED, 'value', '\\Key2\\Key1\\Key0', 'Dword1')]
+    assert _changes(hive, bytes(new), prune=True) == []
@@ -0,0 +1,52 @@
+import csv
+import io
+import json
+
+import pytest
+
+from reg import export, synth
+from reg.registry import Registry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    path = tmp_path / 'export.hive'
+    synth.generate(path, synth.Shape(depth=2, fanout=3, values=5, value_size=8))
+    with Registry.from_path(path) as registry:
+        yield registry
+
+
+def test_jsonl(registry):
+    out = io.StringIO()
+    stats = export.export(registry, out)
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    # 13 keys with 5 values each
+    assert stats.rows == len(rows) == 13 * 6
+    assert rows[0] == dict(kind='key', path='\\', name='ROOT', last_written=rows[0]['last_written'], type=None, data=None)
+    values = {row['name']: row for row in rows[1:6]}
+    assert [row['kind'] for row in values.values()] == ['value'] * 5
+    assert values['Dword1']['type'] == 'REG_DWORD' and values['Dword1']['data'] == 0
+    assert values['Binary2']['data'] == registry.root.values['Binary2'].value.hex()
+    assert values['Multi4']['data'] == registry.root.values['Multi4'].value == ['a0', 'b']
+
+
+def test_csv_subtree(registry):
+    out = io.StringIO()
+    stats = export.export(registry, out, 'csv', paths=['\\Key1'])
+    rows = list(csv.reader(io.StringIO(out.getvalue())))
+    assert rows[0] == export.FIELDS
+    assert stats.rows == len(rows) - 1 == 4 * 6
+    assert {row[1] for row in rows[1:]} == {'\\Key1', '\\Key1\\Key0', '\\Key1\\Key1', '\\Key1\\Key2'}
+    multi = [row for row in rows if row[2] == 'Multi4'][0]
+    assert json.loads(multi[5]) == registry.get('\\Key1').values['Multi4'].value
+
+
+def test_batches(registry):
+    progress = []
+    stats = export.export(registry, io.StringIO(), batch_size=10, progress=progress.append)
+    assert [batch.rows for batch in progress] == list(range(10, stats.rows, 10))
+
+
+def test_unknown_format(registry):
+    with pytest.raises(ValueError, match='xml'):
+        export.export(registry, io.StringIO(), 'xml')
@@ -0,0 +1,53 @@
+import struct
+
+import pytest
+
+from reg import synth
+from reg.index import PathIndex
+from reg.registry import Registry
+from reg.transaction import checksum
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'index.hive'
+    synth.generate(path, synth.Shape(depth=3, fanout=4, values=1))
+    return path
+
+
+def test_index_matches_tree(path):
+    with Registry.from_path(path) as registry:
+        index = PathIndex.build(registry)
+        paths = [key_path for key_path, key, values in registry.walk(include_values=False)][1:]
+        assert len(index) == len(paths) == 84
+        for key_path in paths:
+            assert index.get(key_path) == (key_path, registry.get(key_path)._keynode._offset)
+        assert index.get('\\key2\\KEY3\\key0') == ('\\Key2\\Key3\\Key0', registry.get('\\Key2\\Key3\\Key0')._keynode._offset)
+        assert index.get('\\Key4') is None
+
+
+def test_sidecar(path):
+    with Registry.from_path(path, use_mmap=True, index=True) as registry:
+        assert len(registry._index) == 84
+        assert registry.get('\\Key1\\Key2').path == '\\Key1\\Key2'
+        with pytest.raises(KeyError):
+            registry.get('\\Key1\\Key9')
+    sidecar = path.parent / 'index.hive.idx'
+    saved = sidecar.read_bytes()
+    with Registry.from_path(path, index=True) as registry:
+        assert registry.get('\\Key3\\Key3\\Key3').name == 'Key3'
+    assert sidecar.read_bytes() == saved
+
+
+def test_stale_sidecar_is_rebuilt(path):
+    Registry.from_path(path, index=True).close()
+    sidecar = path.parent / 'index.hive.idx'
+    saved = sidecar.read_bytes()
+    # Hive written since: sequence numbers differ
+    buf = bytearray(path.read_bytes())
+    struct.pack_into('<II', buf, 4, 7, 7)
+    struct.pack_into('<I', buf, 508, checksum(buf))
+    path.write_bytes(buf)
+    with Registry.from_path(path, index=True) as registry:
+        assert registry._index.fingerprint[:2] == (7, 7)
+    assert sidecar.read_bytes() != saved
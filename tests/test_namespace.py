@@ -0,0 +1,78 @@
+import pytest
+
+from hives import dword, key, link, make, sz
+from reg.cell import RegType
+from reg.namespace import Namespace
+
+
+@pytest.fixture
+def image(tmp_path):
+    config = tmp_path / 'Windows' / 'System32' / 'config'
+    make(config / 'SYSTEM', key(
+        ControlSet001=key(Services=key(Foo=key([sz('ImagePath', 'foo.sys')]))),
+        ControlSet002=key(Services=key()),
+        Select=key([dword('Current', 1)]),
+        LinkToCS2=link('\\REGISTRY\\MACHINE\\SYSTEM\\ControlSet002'),
+        LinkToSoftware=link('\\REGISTRY\\MACHINE\\SOFTWARE\\Classes'),
+        Loop=link('\\REGISTRY\\MACHINE\\SYSTEM\\Loop'),
+    ))
+    profile = key([('ProfileImagePath', RegType.REG_EXPAND_SZ, 'C:\\Users\\alice\x00'.encode('utf-16-le'))])
+    make(config / 'SOFTWARE', key(
+        Classes=key(txtfile=key([sz('Type', 'Text')])),
+        Microsoft=key(**{'Windows NT': key(CurrentVersion=key(ProfileList=key(**{'S-1-5-21-1-2-3-1001': profile})))}),
+    ))
+    make(tmp_path / 'Users' / 'alice' / 'NTUSER.DAT', key(
+        Software=key(App=key([dword('X', 5)])),
+        Machine=link('\\REGISTRY\\MACHINE\\SOFTWARE'),
+    ))
+    return tmp_path
+
+
+def test_mounts_from_image(image):
+    with Namespace.from_image(image) as namespace:
+        assert sorted(namespace.mounts) == ['HKLM\\SOFTWARE', 'HKLM\\SYSTEM', 'HKU\\S-1-5-21-1-2-3-1001']
+        assert namespace.get('HKU\\S-1-5-21-1-2-3-1001\\Software\\App').values['X'].value == 5
+
+
+def test_current_control_set(image):
+    with Namespace.from_image(image) as namespace:
+        mount_point, foo = namespace.locate('HKEY_LOCAL_MACHINE\\system\\CurrentControlSet\\Services\\Foo')
+        assert mount_point == 'HKLM\\SYSTEM'
+        assert foo.path == '\\ControlSet001\\Services\\Foo'
+        assert foo.values['ImagePath'].value == 'foo.sys'
+
+
+def test_links(image):
+    with Namespace.from_image(image) as namespace:
+        assert namespace.get('HKLM\\SYSTEM\\LinkToCS2\\Services').path == '\\ControlSet002\\Services'
+        assert namespace.get('HKLM\\SYSTEM\\LinkToCS2', follow=False).path == '\\LinkToCS2'
+        # Across hives, and through a link of another hive
+        assert namespace.locate('HKLM\\SYSTEM\\LinkToSoftware\\txtfile')[0] == 'HKLM\\SOFTWARE'
+        assert namespace.get('HKU\\S-1-5-21-1-2-3-1001\\Machine\\Classes\\txtfile').path == '\\Classes\\txtfile'
+        assert namespace._links[('HKLM', 'SYSTEM', 'LINKTOCS2')] == ('HKLM', 'SYSTEM', 'CONTROLSET002')
+        with pytest.raises(KeyError, match='loop'):
+            namespace.get('HKLM\\SYSTEM\\Loop')
+        with pytest.raises(KeyError):
+            namespace.get('HKLM\\SYSTEM\\Nope')
+
+
+def test_eviction(image):
+    with Namespace.from_image(image, max_open=1) as namespace:
+        # SOFTWARE stays open after reading ProfileList
+        assert (namespace.opens, namespace.evictions) == (1, 0)
+        namespace.get('HKLM\\SOFTWARE\\Classes')
+        namespace.get('HKLM\\SYSTEM\\Select')
+        namespace.get('HKLM\\SYSTEM\\ControlSet001')
+        namespace.get('HKLM\\SOFTWARE\\Classes')
+        assert (namespace.opens, namespace.evictions) == (3, 2)
+        assert len(namespace._open) == 1
+
+
+def test_close_with_live_views(image):
+    namespace = Namespace.from_image(image)
+    value = namespace.get('HKLM\\SOFTWARE\\Classes\\txtfile').values['Type']
+    chunks = list(value._keyvalue.chunks())
+    namespace.get('HKLM\\SYSTEM\\Select')
+    namespace.close()
+    assert not namespace._open
+    assert bytes(chunks[0]) == 'Text\x00'.encode('utf-16-le')
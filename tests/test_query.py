@@ -0,0 +1,66 @@
+import re
+
+import pytest
+
+from reg import synth
+from reg.registry import Registry, RegistryKey
+
+
+@pytest.fixture(scope='module')
+def registry(tmp_path_factory):
+    path = tmp_path_factory.mktemp('query') / 'query.hive'
+    synth.generate(path, synth.Shape(depth=3, fanout=4, values=3))
+    with Registry.from_path(path) as registry:
+        yield registry
+
+
+@pytest.fixture(scope='module')
+def everything(registry):
+    keys, values = [], []
+    for path, key, key_values in registry.walk():
+        keys.append(path)
+        values.extend(('' if path == '\\' else path) + '\\' + value.name for value in key_values)
+    return keys, values
+
+
+def _find(registry, pattern, regex=False):
+    keys, values = [], []
+    for path, item in registry.find(pattern, regex):
+        if isinstance(item, RegistryKey):
+            keys.append(path)
+        else:
+            values.append(('' if path == '\\' else path) + '\\' + item.name)
+    return sorted(keys), sorted(values)
+
+
+def _expected(everything, regex):
+    keys, values = everything
+    return sorted(path for path in keys if regex.fullmatch(path)), sorted(path for path in values if regex.fullmatch(path))
+
+
+def _glob(pattern):
+    parts = []
+    for segment in pattern.strip('\\').split('\\'):
+        # * and ? stay within one name
+        name = re.escape(segment).replace(r'\*', r'[^\\]*').replace(r'\?', r'[^\\]')
+        parts.append(r'(?:\\[^\\]+)*' if segment == '**' else r'\\' + name)
+    return re.compile(''.join(parts), re.IGNORECASE)
+
+
+@pytest.mark.parametrize('pattern', ['\\Key1\\Key*', '\\Key*\\*\\Key?', '**\\Dword*', '\\key2\\**', '**\\KEY3\\KEY0'])
+def test_glob(registry, everything, pattern):
+    found = _find(registry, pattern)
+    assert found == _expected(everything, _glob(pattern))
+    assert found != ([], [])
+
+
+@pytest.mark.parametrize('pattern', [r'\\Key1\\Key0.*', r'.*\\string0', r'\\Key[23]\\.*\\Binary2', r'\\Key0(\\.*)?'])
+def test_regex(registry, everything, pattern):
+    found = _find(registry, pattern, regex=True)
+    assert found == _expected(everything, re.compile(pattern, re.IGNORECASE))
+    assert found != ([], [])
+
+
+def test_keys_or_values_only(registry):
+    assert [path for path, item in registry.find('\\Key1\\*', include_values=False)] == ['\\Key1\\Key0', '\\Key1\\Key1', '\\Key1\\Key2', '\\Key1\\Key3']
+    assert [item.name for path, item in registry.find('\\Key1\\*', include_keys=False)] == ['String0', 'Dword1', 'Binary2']
@@ -0,0 +1,83 @@
+import signal
+import struct
+
+import pytest
+
+from reg import synth
+from reg.registry import Registry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    path = tmp_path / 'small.hive'
+    synth.generate(path, synth.Shape(depth=2, fanout=3, values=4))
+    with Registry.from_path(path) as registry:
+        yield registry
+
+
+@pytest.fixture(autouse=True)
+def timeout():
+    # Iterations sharing a position used to loop forever instead of failing
+    signal.alarm(10)
+    yield
+    signal.alarm(0)
+
+
+def test_nested_values_iteration(registry):
+    key = registry.get('\\Key1')
+    names = ['String0', 'Dword1', 'Binary2', 'Qword3']
+    dword = key.values['Dword1'].value
+    seen = []
+    for value in key.values:
+        assert key.values['Dword1'].value == dword
+        assert 'Qword3' in key.values
+        assert key.values.names() == names
+        seen.append(value.name)
+    assert seen == names
+
+
+def test_interleaved_keys_iteration(registry):
+    # Both keys share the cached KeyNode and its lists
+    first, second = registry.get('\\Key1'), registry.get('\\Key1')
+    assert [(value.name, [other.name for other in second.values]) for value in first.values] == [
+        (name, ['String0', 'Dword1', 'Binary2', 'Qword3']) for name in ['String0', 'Dword1', 'Binary2', 'Qword3']]
+    assert [(key.name, [other.name for other in registry.root.subkeys], 'KEY2' in registry.root.subkeys)
+            for key in registry.root.subkeys] == [
+        (name, ['Key0', 'Key1', 'Key2'], True) for name in ['Key0', 'Key1', 'Key2']]
+
+
+def test_lookups_during_walk(registry):
+    paths = []
+    for path, key, values in registry.walk():
+        if len(key.subkeys):
+            assert key.subkeys.get('Key0') is not None
+        assert len([value for value in key.values if value.name in key.values]) == 4
+        paths.append(path)
+    assert len(paths) == 13
+
+
+def test_close_mmap_with_raw_value_alive(tmp_path):
+    path = tmp_path / 'raw.hive'
+    synth.generate(path, synth.Shape(depth=1, fanout=2, values=3))
+    with Registry.from_path(path, use_mmap=True, raw=True) as registry:
+        string = registry.root.values['String0'].value
+        binary = registry.root.values['Binary2'].value
+        dword = registry.root.values['Dword1'].value
+    assert string.decode('utf-16-le').startswith('value 0 ')
+    assert isinstance(binary, bytes) and len(binary) == 64
+    assert dword == 0
+
+
+def test_index_root_with_empty_leaf(tmp_path):
+    path = tmp_path / 'ri.hive'
+    synth.generate(path, synth.Shape(depth=1, fanout=3, values=0, lists='ri', ri_leaf_size=2))
+    buf = bytearray(path.read_bytes())
+    with Registry(bytes(buf)) as registry:
+        assert registry.get('\\Key2').name == 'Key2'
+        ri = 4096 + registry.root._keynode.subkeys_list_offset
+    # Second leaf claims no items
+    leaf, = struct.unpack_from('<I', buf, ri + 8 + 4)
+    struct.pack_into('<H', buf, 4096 + leaf + 6, 0)
+    with Registry(bytes(buf)) as registry:
+        with pytest.raises(ValueError, match='Empty leaf 1'):
+            registry.get('\\Key2')
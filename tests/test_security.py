@@ -0,0 +1,113 @@
+import struct
+import uuid
+
+import pytest
+
+from hives import dword, key, make
+from reg.registry import Registry
+from reg.security import AceFlags, KeyRights
+
+GUID = uuid.UUID('12345678-1234-5678-1234-567812345678')
+
+
+def sid(text):
+    revision, authority, *sub_authorities = map(int, text.split('-')[1:])
+    return struct.pack('<BB', revision, len(sub_authorities)) + authority.to_bytes(6, 'big') + struct.pack(f'<{len(sub_authorities)}I', *sub_authorities)
+
+
+def ace(ace_type, flags, mask, trustee, object_type=None):
+    body = struct.pack('<I', mask)
+    if object_type is not None:
+        body += struct.pack('<I', 1) + object_type.bytes_le
+    body += sid(trustee)
+    return struct.pack('<BBH', ace_type, flags, 4 + len(body)) + body
+
+
+def acl(*aces):
+    body = b''.join(aces)
+    return struct.pack('<BBHHH', 2, 0, 8 + len(body), len(aces), 0) + body
+
+
+def descriptor(owner, group, dacl=None, sacl=None, control=0x8000):
+    parts, offsets = b'', {}
+    for name, data in (('sacl', sacl), ('dacl', dacl), ('owner', owner), ('group', group)):
+        offsets[name] = 0 if data is None else 20 + len(parts)
+        parts += data or b''
+    control |= (0x4 if dacl is not None else 0) | (0x10 if sacl is not None else 0)
+    return struct.pack('<BBHIIII', 1, 0, control, offsets['owner'], offsets['group'], offsets['sacl'], offsets['dacl']) + parts
+
+
+DESCRIPTOR = descriptor(
+    sid('S-1-5-32-544'), sid('S-1-5-18'),
+    dacl=acl(ace(0, 0x2, 0xf003f, 'S-1-5-18'), ace(1, 0x12, 0x20019, 'S-1-5-21-1-2-3-1001'), ace(5, 0, 0x1, 'S-1-1-0', GUID)),
+    sacl=acl(ace(2, 0x80, 0x10000, 'S-1-1-0')),
+)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    path = make(tmp_path / 'security.hive', key([dword('Count', 1)], Software=key(Classes=key()), System=key()), DESCRIPTOR)
+    with Registry.from_path(path) as registry:
+        yield registry
+
+
+def test_sids(registry):
+    security = registry.root.security
+    assert (security.owner.sid, security.owner.name) == ('S-1-5-32-544', 'Administrators')
+    assert (security.group.sid, security.group.name) == ('S-1-5-18', 'SYSTEM')
+    user = security.dacl.aces[1].sid
+    assert user.sid == 'S-1-5-21-1-2-3-1001'
+    assert list(user.sub_authorities) == [21, 1, 2, 3, 1001]
+
+
+def test_aces(registry):
+    dacl = registry.get('\\Software\\Classes').security.dacl
+    assert len(dacl) == 3
+    assert [(ace.type_str, ace.sid.sid) for ace in dacl] == [
+        ('ACCESS_ALLOWED', 'S-1-5-18'), ('ACCESS_DENIED', 'S-1-5-21-1-2-3-1001'), ('ACCESS_ALLOWED_OBJECT', 'S-1-1-0')]
+    assert dacl.aces[0].rights == KeyRights(0xf003f)
+    assert KeyRights.WRITE_DAC in dacl.aces[0].rights
+    assert dacl.aces[1].flags == AceFlags.CONTAINER_INHERIT | AceFlags.INHERITED
+    # The GUID comes before the SID
+    assert dacl.aces[2].asdict() == dict(type='ACCESS_ALLOWED_OBJECT', flags=0, mask=1, sid='S-1-1-0', object_type=str(GUID),
+                                         inherited_object_type=None)
+
+
+def test_asdict(registry):
+    assert registry.root.security.asdict() == dict(
+        control=0x8014,
+        owner='S-1-5-32-544',
+        group='S-1-5-18',
+        dacl=[dict(type='ACCESS_ALLOWED', flags=0x2, mask=0xf003f, sid='S-1-5-18'),
+              dict(type='ACCESS_DENIED', flags=0x12, mask=0x20019, sid='S-1-5-21-1-2-3-1001'),
+              dict(type='ACCESS_ALLOWED_OBJECT', flags=0, mask=1, sid='S-1-1-0', object_type=str(GUID), inherited_object_type=None)],
+        sacl=[dict(type='SYSTEM_AUDIT', flags=0x80, mask=0x10000, sid='S-1-1-0')],
+    )
+
+
+def test_shared_descriptor(registry):
+    descriptors = list(registry.descriptors())
+    assert len(descriptors) == 1
+    assert descriptors[0].descriptor is registry.root.security
+    assert registry.get('\\System').security is registry.get('\\Software\\Classes').security
+
+
+def test_no_dacl(tmp_path):
+    path = make(tmp_path / 'open.hive', key(), descriptor(sid('S-1-5-18'), None))
+    with Registry.from_path(path) as registry:
+        security = registry.root.security
+        assert security.dacl is None and security.sacl is None and security.group is None
+        assert security.owner.name == 'SYSTEM'
+
+
+def test_not_self_relative(tmp_path):
+    path = make(tmp_path / 'absolute.hive', key(), descriptor(sid('S-1-5-18'), None, control=0))
+    with Registry.from_path(path) as registry:
+        with pytest.raises(ValueError, match='not self-relative'):
+            registry.root.security
+
+
+def test_no_security(tmp_path):
+    with Registry.from_path(make(tmp_path / 'none.hive', key(Software=key()))) as registry:
+        assert registry.get('\\Software').security is None
+        assert list(registry.descriptors()) == []
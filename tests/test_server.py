@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+from reg import server as server_module
+from reg import synth
+from reg.server import HiveServer
+
+
+async def _request(reader, writer, **request):
+    writer.write(json.dumps(request).encode('utf-8') + b'\n')
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+def test_close_waits_for_running_ops(tmp_path, monkeypatch):
+    path = tmp_path / 'walk.hive'
+    synth.generate(path, synth.Shape(depth=3, fanout=15, values=4))
+    outcomes = []
+    original = server_module.walk
+
+    def walk(*args):
+        try:
+            result = original(*args)
+        except Exception as e:
+            outcomes.append(e)
+            raise
+        outcomes.append(len(result))
+        return result
+    monkeypatch.setattr(server_module, 'walk', walk)
+
+    async def main():
+        server = HiveServer(jobs=2)
+        name = await server.load(str(path))
+        await server.start(port=0)
+        reader, writer = await asyncio.open_connection(*server.address)
+        assert (await _request(reader, writer, id=1, op='get', hive=name, path='\\Key1'))['result']['name'] == 'Key1'
+
+        # Walk runs in a worker thread while the server is closed
+        registry = server.hives[name].registry
+        writer.write(json.dumps(dict(id=2, op='walk', hive=name, values=True)).encode('utf-8') + b'\n')
+        await writer.drain()
+        while not server.hives[name].lock.locked():
+            await asyncio.sleep(0.001)
+        await server.close()
+        assert not server.hives
+        assert registry._mmap is None
+        assert outcomes == [3616]
+        writer.close()
+
+    asyncio.run(asyncio.wait_for(main(), 60))
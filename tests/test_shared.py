@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+
+import pytest
+
+from reg import shared, synth
+from reg.registry import Registry
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+@pytest.fixture
+def registry(tmp_path):
+    path = tmp_path / 'shared.hive'
+    synth.generate(path, synth.Shape(depth=2, fanout=4, values=2))
+    with Registry.from_path(path) as registry:
+        yield registry
+
+
+def _read(path, key_path, queue):
+    with shared.attach(path) as hive:
+        queue.put(hive.registry.get(key_path).values['String0'].value)
+
+
+def test_publish_and_attach(registry, tmp_path):
+    registry.load_index(str(tmp_path / 'shared.hive.idx'))
+    registry.load_timeline()
+    path = shared.publish(registry, str(tmp_path / 'published.shm'))
+    try:
+        with shared.attach(path) as hive:
+            assert sorted(hive.sections) == ['hive', 'index', 'timeline']
+            assert hive.registry.get('\\Key2\\Key1').path == '\\Key2\\Key1'
+            assert len(hive.registry._index) == 20
+            assert [key_path for key_path, key in hive.registry.recent(2)] == [key_path for key_path, key in registry.recent(2)]
+            assert hive.cells is None
+            assert bytes(hive.sections['hive']) == bytes(registry._buf)
+    finally:
+        shared.unlink(path)
+    assert not os.path.exists(path)
+
+
+def test_attach_from_another_process(registry, tmp_path):
+    path = shared.publish(registry, str(tmp_path / 'published.shm'))
+    queue = multiprocessing.get_context('spawn').Queue()
+    process = multiprocessing.get_context('spawn').Process(target=_read, args=(path, '\\Key3\\Key0', queue))
+    process.start()
+    value = queue.get(timeout=60)
+    process.join(60)
+    assert process.exitcode == 0
+    assert value == registry.get('\\Key3\\Key0').values['String0'].value
+
+
+@pytest.mark.skipif(np is None, reason='CellTable requires numpy')
+def test_cells(registry, tmp_path):
+    from reg.celltable import CellTable
+    expected = CellTable.from_registry(registry)
+    path = shared.publish(registry, str(tmp_path / 'published.shm'), cells=True)
+    with shared.attach(path) as hive:
+        cells = hive.cells
+        for name, dtype in shared.CELL_ARRAYS:
+            assert np.array_equal(getattr(cells, name), getattr(expected, name))
+        del cells
+
+
+def test_not_published(tmp_path):
+    path = tmp_path / 'bogus.shm'
+    path.write_bytes(bytes(4096))
+    with pytest.raises(ValueError, match='Not a published hive'):
+        shared.attach(str(path))
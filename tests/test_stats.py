@@ -0,0 +1,31 @@
+import pytest
+
+from reg import synth
+from reg.registry import Registry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    path = tmp_path / 'stats.hive'
+    synth.generate(path, synth.Shape(depth=2, fanout=3, values=1))
+    with Registry.from_path(path) as registry:
+        yield registry
+
+
+def test_walk_times_subkeys(registry):
+    with registry.profile():
+        assert len(list(registry.walk())) == 13
+        timings = registry.stats()['timings']
+    # Root and its 3 subkeys have subkey lists
+    assert timings['subkeys']['calls'] == 4
+    assert timings['subkeys']['seconds'] > 0
+
+
+def test_lookups_time_subkeys(registry):
+    with registry.profile():
+        registry.root.subkeys['Key1']
+        registry.root.subkeys[2]
+        'Key0' in registry.root.subkeys
+        timings = registry.stats()['timings']
+    assert timings['subkeys']['calls'] == 3
+    assert 'data' not in timings
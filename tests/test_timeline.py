@@ -0,0 +1,62 @@
+import datetime
+
+import pytest
+
+from reg import synth, timeline
+from reg.registry import Registry
+from reg.timeline import Timeline, to_filetime
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'timeline.hive'
+    synth.generate(path, synth.Shape(depth=2, fanout=4, values=1))
+    return path
+
+
+def _by_time(registry):
+    keys = [(key._keynode.raw('last_written'), key_path) for key_path, key, values in registry.walk(include_values=False)]
+    return [key_path for last_written, key_path in sorted(keys)], sorted(keys)
+
+
+def test_modified_and_recent(path):
+    with Registry.from_path(path) as registry:
+        paths, keys = _by_time(registry)
+        assert [key_path for key_path, key in registry.modified()] == paths
+        start, end = keys[3][0], keys[9][0]
+        assert [key_path for key_path, key in registry.modified(start, end)] == paths[3:9]
+        assert [key_path for key_path, key in registry.recent(4)] == paths[::-1][:4]
+        assert [key.name for key_path, key in registry.recent(100)] == [key_path.rsplit('\\', 1)[-1] or 'ROOT' for key_path in paths[::-1]]
+
+
+def test_datetimes(path):
+    with Registry.from_path(path) as registry:
+        paths, keys = _by_time(registry)
+        start = synth.BASE_FILETIME + 5 * 10_000_000
+        as_datetime = datetime.datetime(1601, 1, 1) + datetime.timedelta(microseconds=start // 10)
+        # Datetimes keep microseconds, FILETIMEs count 100ns
+        assert to_filetime(as_datetime) == start - start % 10
+        assert to_filetime(as_datetime.replace(tzinfo=datetime.timezone.utc)) == start - start % 10
+        assert [key_path for key_path, key in registry.modified(as_datetime)] == paths[5:]
+
+
+def test_without_numpy(path, monkeypatch):
+    with Registry.from_path(path) as registry:
+        vectorized = list(Timeline.build(registry))
+        monkeypatch.setattr(timeline, 'np', None)
+        assert list(Timeline.build(registry)) == vectorized
+        assert len(vectorized) == 21
+
+
+def test_sidecar(path):
+    with Registry.from_path(path, use_mmap=True, timeline=True) as registry:
+        assert len(registry.timeline) == 21
+    sidecar = path.parent / 'timeline.hive.tl'
+    saved = sidecar.read_bytes()
+    with Registry.from_path(path, use_mmap=True, timeline=True) as registry:
+        assert [key_path for key_path, key in registry.recent(1)] == ['\\Key3\\Key3']
+    assert sidecar.read_bytes() == saved
+    sidecar.write_bytes(b'garbage')
+    with Registry.from_path(path, timeline=True) as registry:
+        assert len(registry.timeline) == 21
+    assert sidecar.read_bytes() == saved
@@ -0,0 +1,63 @@
+import struct
+
+import pytest
+
+from reg import synth
+from reg.registry import Registry
+from reg.transaction import DIRTY_PAGE, LOG_ENTRY, checksum, marvin32
+
+
+def _log_entry(sequence, hive_bins_data_size, pages):
+    body = b''.join(DIRTY_PAGE.pack(offset, len(page)) for offset, page in pages) + b''.join(page for offset, page in pages)
+    size = LOG_ENTRY.size + len(body)
+    body += bytes(-size % 512)
+    size += -size % 512
+    hash1 = marvin32(body)
+    header = LOG_ENTRY.pack(b'HvLE', size, 0, sequence, hive_bins_data_size, len(pages), hash1, 0)
+    hash2 = marvin32(header[:32])
+    return LOG_ENTRY.pack(b'HvLE', size, 0, sequence, hive_bins_data_size, len(pages), hash1, hash2) + body
+
+
+@pytest.fixture
+def dirty(tmp_path):
+    '''
+    Dirty hive with a log entry changing Dword1 of \\Key1, and the value it's changed to
+    '''
+    path = tmp_path / 'dirty.hive'
+    synth.generate(path, synth.Shape(depth=2, fanout=3, values=4))
+    buf = bytearray(path.read_bytes())
+    with Registry(bytes(buf)) as registry:
+        offset = registry.get('\\Key1').values['Dword1']._keyvalue._offset
+    sequence, = struct.unpack_from('<I', buf, 8)
+    hive_bins_data_size, = struct.unpack_from('<I', buf, 40)
+
+    # Log holds the page with the changed value, the primary file is left with the old one and a newer primary sequence
+    page_offset = (offset - 4096) // 4096 * 4096
+    page = bytearray(buf[4096 + page_offset : 4096 + page_offset + 4096])
+    struct.pack_into('<I', page, offset - 4096 - page_offset + 12, 0xdeadbeef)
+    base = bytearray(buf[:512])
+    struct.pack_into('<I', base, 4, sequence + 1)
+    struct.pack_into('<I', base, 508, checksum(base))
+    (tmp_path / 'dirty.hive.LOG1').write_bytes(bytes(base) + _log_entry(sequence, hive_bins_data_size, [(page_offset, bytes(page))]))
+
+    struct.pack_into('<I', buf, 4, sequence + 1)
+    struct.pack_into('<I', buf, 508, checksum(buf))
+    path.write_bytes(buf)
+    return path, 0xdeadbeef
+
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_replay_keeps_header(dirty, use_mmap):
+    path, expected = dirty
+    with Registry.from_path(path) as registry:
+        regf = registry.regf
+        header = (regf.major_version, regf.minor_version, regf.root_cell_offset, regf.hive_bins_data_size)
+
+    with Registry.from_path(path, use_mmap=use_mmap, logs=True) as registry:
+        assert registry.replayed == 1
+        regf = registry.regf
+        assert regf.sequence1 == regf.sequence2
+        assert (regf.major_version, regf.minor_version, regf.root_cell_offset, regf.hive_bins_data_size) == header
+        assert registry.validate().ok
+        assert registry.root.name == 'ROOT'
+        assert registry.get('\\Key1').values['Dword1'].value == expected
@@ -0,0 +1,66 @@
+import struct
+
+import pytest
+
+from reg import synth
+from reg.registry import Registry
+from reg.transaction import checksum
+from reg.validate import validate
+
+
+@pytest.fixture
+def hive(tmp_path):
+    path = tmp_path / 'valid.hive'
+    synth.generate(path, synth.Shape(depth=2, fanout=20, values=4))
+    return path.read_bytes()
+
+
+def _checks(report):
+    return [issue.check for issue in report.errors]
+
+
+def test_valid(hive):
+    report = Registry(hive).validate()
+    assert report.ok and not report.warnings
+    assert report.hbins == (len(hive) - 4096) // 4096
+    assert report.cells > 421
+
+
+def test_corrupt_checksum(hive):
+    buf = bytearray(hive)
+    buf[100] ^= 0xff
+    report = validate(buf)
+    assert _checks(report) == ['checksum']
+    with pytest.raises(ValueError, match='checksum'):
+        report.raise_for_errors()
+
+
+def test_truncated(hive):
+    report = validate(hive[:-4096])
+    assert _checks(report) == ['hive_bins_data_size']
+    assert report.hbins == 0
+    assert 'truncated' in report.errors[0].message
+    assert not validate(hive[:1000]).ok
+
+
+def test_broken_hbin_and_cell(hive):
+    buf = bytearray(hive)
+    # Size of the first cell of the second hbin stops being a multiple of 8, third hbin loses its signature
+    struct.pack_into('<i', buf, 4096 + 4096 + 32, -12)
+    buf[4096 + 2 * 4096 : 4096 + 2 * 4096 + 4] = b'hbim'
+    report = validate(buf)
+    assert _checks(report) == ['hbin_signature', 'cell_size']
+    assert report.errors[0].offset == 4096 + 2 * 4096
+    assert report.errors[1].offset == 4096 + 4096 + 32
+    assert report.hbins == 2
+    # Header and hbins only
+    assert _checks(validate(buf, cells=False)) == ['hbin_signature']
+
+
+def test_dirty_is_a_warning(hive):
+    buf = bytearray(hive)
+    struct.pack_into('<I', buf, 4, 2)
+    struct.pack_into('<I', buf, 508, checksum(buf))
+    report = validate(buf)
+    assert report.ok
+    assert [issue.check for issue in report.warnings] == ['sequence']